@@ -1,19 +1,28 @@
-import base64
-import os
-import json
-from google import genai
-from google.genai import types
+import asyncio
+from typing import TYPE_CHECKING, AsyncIterator
+from src.llm_client import generate_structured, stream_response
+from src.model_router import RouteFeatures, model_router
+from src.schemas import CoverageAnalysis
+from src.telemetry import span
 
-def generate_insurance_recommendations(data: dict) -> dict:
+if TYPE_CHECKING:
+    from google.genai import types
+
+# Bump whenever the prompt template changes so cached answers are not reused
+PROMPT_VERSION = "1"
+
+def build_insurance_request(data: dict, model: str) -> tuple[str, list, "types.GenerateContentConfig"]:
     """
-    Generate detailed insurance recommendations or analyze vehicle condition using Gemini.
+    Build the model, contents and config of an insurance recommendation call.
+
+    Accepts either a `description`/`coverage_data` pair or the
+    `user_input`/`accident_description` + `insurance_data` inputs of the other endpoints.
     """
-    api_key = os.environ.get("GEMINI_API_KEY")
-    if not api_key:
-        raise ValueError("GEMINI_API_KEY environment variable is not set.")
-    
-    client = genai.Client(api_key=api_key)
-    model = "gemini-2.5-pro-exp-03-25"
+    # Imported here so the SDK only loads once a request needs it
+    from google.genai import types
+
+    description = data.get("description") or data.get("user_input") or data.get("accident_description")
+    coverage_data = data.get("coverage_data") or data.get("insurance_data")
     
     # Prepare input for Gemini
     input_text = f"""
@@ -25,10 +34,10 @@ def generate_insurance_recommendations(data: dict) -> dict:
         - `explanation` (string): Una breve explicación de por qué está cubierto o no.
 
     Descripción del vehículo:
-    {data['description']}
+    {description}
     
     Información de cobertura:
-    {data['coverage_data']}
+    {coverage_data}
     
     Genera el JSON de salida.
     """
@@ -42,23 +51,39 @@ def generate_insurance_recommendations(data: dict) -> dict:
     ]
     generate_content_config = types.GenerateContentConfig(
         response_mime_type="application/json",
+        response_schema=CoverageAnalysis,
     )
-    
-    # Generate response
-    response_text = ""
-    for chunk in client.models.generate_content_stream(
-        model=model,
-        contents=contents,
-        config=generate_content_config,
-    ):
-        if chunk.text:  # Ensure chunk.text is not None
-            response_text += chunk.text
-    
-    # Parse and return the JSON response
-    try:
-        return json.loads(response_text)
-    except json.JSONDecodeError as e:
-        raise ValueError(f"Failed to parse JSON response: {response_text}") from e
+    return model, contents, generate_content_config
+
+def route_features(data: dict, endpoint: str) -> RouteFeatures:
+    description = data.get("description") or data.get("user_input") or data.get("accident_description") or ""
+    return RouteFeatures(endpoint, input_chars=len(description))
+
+async def generate_insurance_recommendations(data: dict, endpoint: str = "analyze_vehicle_condition") -> dict:
+    """
+    Generate detailed insurance recommendations or analyze vehicle condition using Gemini.
+
+    The answer is constrained to the CoverageAnalysis schema. The model is picked
+    per request by the model router, which re-asks the pro model when the flash
+    answer does not validate.
+    """
+    async def ask(model: str) -> dict:
+        with span("prompt_build"):
+            model, contents, generate_content_config = build_insurance_request(data, model)
+        return await generate_structured(
+            model, contents, generate_content_config, CoverageAnalysis, cache_version=PROMPT_VERSION
+        )
+
+    return await model_router.run(route_features(data, endpoint), ask)
+
+def stream_insurance_recommendations(data: dict, endpoint: str = "analyze_vehicle_condition") -> AsyncIterator[str]:
+    """
+    Stream the raw JSON text of an insurance recommendation as Gemini produces it.
+    """
+    model = model_router.choose(route_features(data, endpoint))
+    with span("prompt_build"):
+        model, contents, generate_content_config = build_insurance_request(data, model)
+    return stream_response(model, contents, generate_content_config, cache_version=PROMPT_VERSION)
 
 if __name__ == "__main__":
     sample_data = {
@@ -68,5 +93,5 @@ if __name__ == "__main__":
             "coverage": ["Collision", "Theft", "Weather-related damages"],
         },
     }
-    recommendations = generate_insurance_recommendations(sample_data)
+    recommendations = asyncio.run(generate_insurance_recommendations(sample_data))
     print(recommendations)
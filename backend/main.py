@@ -1,22 +1,167 @@
 import json
-import json
 import os
-from fastapi import FastAPI, Query, HTTPException, File, UploadFile, Body
-from typing import Dict
-from pydantic import BaseModel
-from gemini import generate_insurance_recommendations
-from src.image_proc import process_image_with_gemini, process_image_for_insurance_creation
+import asyncio
+import base64
+import hashlib
+import math
+import time
+from contextlib import asynccontextmanager
+from datetime import date
+from fastapi import FastAPI, Query, HTTPException, File, Form, UploadFile, Body, Request, Response
+from fastapi.responses import StreamingResponse, JSONResponse, PlainTextResponse
+from typing import Dict, Optional
+from pydantic import BaseModel, field_validator
+from gemini import generate_insurance_recommendations, stream_insurance_recommendations
+from src.image_proc import (
+    process_image_with_gemini,
+    stream_image_with_gemini,
+    process_images_with_gemini,
+    process_image_for_insurance_creation,
+    stream_image_for_insurance,
+    insurance_fields_to_ask,
+    merge_damage_assessments,
+)
+from src.image_features import prefill_insurance_data
+from src.image_preprocess import ImageDecodeError, PreparedImage, preprocess_upload
+from src.image_index import ImageHashIndex
+from src.storage import InsuranceStore
+from src.llm_client import response_cache, warm_up
+from src.streaming import sse_response, sse_event, single_chunk
+from src.audio_pipeline import SpeechServiceError, transcribe, transcribe_segments, audio_format
+from src.policy_index import PolicyIndex
+from src.coverage_rules import CoverageRuleEngine
+from src.report_sessions import IntentMatcher, ReportSessionStore
+from src.job_queue import JobQueue, QueueFullError
+from src.resilience import CircuitOpenError, LatencyBudgetMiddleware, is_retriable, latency_budget, resilience
+from src.model_router import model_router
+from src.ine_stats import IneStats
+from src.pricing import MAX_QUOTE_BATCH, PricingEngine
+from src.geocoder import ReverseGeocoder
+from src.weather import WeatherService
+from src.carapi import MAX_VEHICLE_BATCH, VehicleLookupError, VehicleRegistry
+from src.reference_data import ReferenceData
+from src.schemas import DamageAssessment, invalid_fields
+from src.telemetry import TelemetryMiddleware, log_event, metrics, span
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+INSURANCE_FILE = os.path.join(DATA_DIR, "insurances.json")
+INSURANCE_DB = os.environ.get("INSURANCE_DB", os.path.join(DATA_DIR, "insurances.db"))
+JOB_QUEUE_DB = os.environ.get("JOB_QUEUE_DB", os.path.join(DATA_DIR, "jobs.db"))
+IMAGE_INDEX_DB = os.environ.get("IMAGE_INDEX_DB", os.path.join(DATA_DIR, "image_index.db"))
+WEATHER_DB = os.environ.get("WEATHER_DB", os.path.join(DATA_DIR, "weather.db"))
+REPORT_SESSIONS_DB = os.environ.get("REPORT_SESSIONS_DB", os.path.join(DATA_DIR, "report_sessions.db"))
+
+# The legacy JSON file is imported into the store the first time it is opened
+insurance_store = InsuranceStore(INSURANCE_DB, legacy_json_path=INSURANCE_FILE)
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# Photos accepted per /process_images call and Gemini calls run at once for them
+MAX_BATCH_IMAGES = int(os.environ.get("MAX_BATCH_IMAGES", "20"))
+BATCH_IMAGE_CONCURRENCY = int(os.environ.get("BATCH_IMAGE_CONCURRENCY", "4"))
+
+policy_index = PolicyIndex([
+    os.path.join(DATA_DIR, "seguro.md"),
+    os.path.join(DATA_DIR, "cobertura.txt"),
+])
+coverage_engine = CoverageRuleEngine(os.path.join(DATA_DIR, "cobertura.txt"))
+report_sessions = ReportSessionStore(REPORT_SESSIONS_DB)
+intent_matcher = IntentMatcher()
+job_queue = JobQueue(JOB_QUEUE_DB)
+# Perceptual hashes of analyzed claim photos: re-sent photos reuse their analysis, reused ones are flagged
+image_index = ImageHashIndex(IMAGE_INDEX_DB)
+ine_stats = IneStats({
+    "tractores_industriales": os.path.join(DATA_DIR, "tractores_industriales.csv"),
+    "familiares_trabajan_explotaciones": os.path.join(DATA_DIR, "familiares_trabajan_explotaciones.csv"),
+})
+pricing_engine = PricingEngine(ine_stats)
+# The centroid table lists only some of the municipalities of the INE datasets, so a match is the
+# nearest listed one, not necessarily the right one: matches are flagged `municipio_approximate`
+geocoder = ReverseGeocoder(os.path.join(DATA_DIR, "municipios_centroides.csv"))
+# AEMET observations per (station, day), prefetched in bulk, as weather evidence for accident claims
+weather = WeatherService(WEATHER_DB)
+# Registry records of the vehicles named in claims, to verify the claimed tractor model
+vehicle_registry = VehicleRegistry()
+
+def load_statistics() -> None:
+    # Map the INE statistics columns, parsing the CSVs only when they changed; premiums derive from them
+    ine_stats.load()
+    pricing_engine.build()
 
-import tempfile
-import speech_recognition as sr  # Using SpeechRecognition for transcription
-from pydub import AudioSegment  # Import pydub for audio conversion
+# Chunk and index the reference files once instead of re-reading them per request, and again only when they change
+reference_data = ReferenceData()
+reference_data.register("policy_index", policy_index.paths, policy_index.build)
+reference_data.register("coverage_rules", [coverage_engine.path], coverage_engine.build)
+reference_data.register("ine_stats", ine_stats.paths, load_statistics)
+reference_data.register("geocoder", [geocoder.path], geocoder.build)
 
-INSURANCE_FILE = "/home/guillermo/hackathon/AXA_Hackathon/backend/data/insurances.json"
+# Import the Gemini SDK and open its connection before the worker accepts requests, not on the first LLM request
+LLM_WARMUP = os.environ.get("LLM_WARMUP", "true").lower() == "true"
+startup_report: dict = {}
 
-app = FastAPI()
+# Longest a GET /jobs/{job_id} request may be held open waiting for the result
+MAX_JOB_WAIT = 60
+
+async def warm_up_llm() -> None:
+    started = time.perf_counter()
+    startup_report["llm_warm_up"] = await warm_up(model_router.flash_model)
+    startup_report["llm_warm_up"]["seconds"] = time.perf_counter() - started
+    log_event("llm_warm_up", always=True, **startup_report["llm_warm_up"])
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    started = time.perf_counter()
+    reference_data.load()
+    job_queue.start()
+    watcher = asyncio.create_task(reference_data.watch())
+    # Photos are analyzed without deduplication until the stored hashes are in memory
+    image_index_load = asyncio.create_task(asyncio.to_thread(image_index.load))
+    weather.load()
+    vehicle_registry.start()
+    weather_refresh = asyncio.create_task(weather.refresh())
+    if LLM_WARMUP:
+        await warm_up_llm()
+    startup_report["ready_seconds"] = time.perf_counter() - started
+    log_event("startup", always=True, ready_ms=round(startup_report["ready_seconds"] * 1000, 2))
+    yield
+    watcher.cancel()
+    image_index_load.cancel()
+    weather_refresh.cancel()
+    await weather.close()
+    await vehicle_registry.close()
+    await job_queue.stop()
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(TelemetryMiddleware)
+app.add_middleware(LatencyBudgetMiddleware)
+
+def upstream_error(e: Exception, detail: str) -> HTTPException:
+    """
+    HTTP error for a failed Gemini call: 503 while the circuit is open or Gemini
+    kept failing with a transient error, 504 when the latency budget ran out,
+    500 otherwise.
+    """
+    if isinstance(e, CircuitOpenError):
+        return HTTPException(status_code=503, detail=detail, headers={"Retry-After": str(math.ceil(e.retry_after))})
+    if isinstance(e, TimeoutError):
+        return HTTPException(status_code=504, detail=detail)
+    if is_retriable(e):
+        return HTTPException(status_code=503, detail=detail)
+    return HTTPException(status_code=500, detail=detail)
 
 class AccidentDescription(BaseModel):
     accident_description: str
+    # Where and when it happened, to attach the weather observed there (the date defaults to today)
+    coordinates: Optional[tuple[float, float]] = None
+    accident_date: Optional[date] = None
+
+    @field_validator("accident_date")
+    @classmethod
+    def not_in_future(cls, value: Optional[date]) -> Optional[date]:
+        if value is not None and value > date.today():
+            raise ValueError("accident_date cannot be in the future")
+        return value
 
 class InsuranceData(BaseModel):
     modelo_tractor: str
@@ -26,63 +171,463 @@ class InsuranceData(BaseModel):
     descripcion_adicional: str
     coordinates: tuple[float, float]
     garaje: bool
+    # Vehicle registry ID, to verify `modelo_tractor` against the registered vehicle
+    vehicle_id: Optional[str] = None
+
+class QuoteRequest(InsuranceData):
+    # 5-digit INE code of the municipality, for the local exposure factor (resolved from the coordinates if omitted)
+    municipio: Optional[str] = None
+
+def attach_municipios(records: list[dict]) -> list[dict]:
+    """
+    Fill in the INE `municipio` code of the records that lack one from their coordinates, in bulk,
+    flagging it `municipio_approximate`.
+    """
+    pending = [record for record in records if not record.get("municipio") and record.get("coordinates")]
+    for record, match in zip(pending, geocoder.lookup_many(record["coordinates"] for record in pending)):
+        record["municipio"] = match["code"] if match else None
+        record["municipio_approximate"] = match is not None
+    return records
+
+def flag_approximate(quotes: list[dict], records: list[dict]) -> list[dict]:
+    """
+    Mark the quotes whose exposure factor comes from a geocoded municipality.
+    """
+    for quote, record in zip(quotes, records):
+        if quote["municipio"] is not None and record.get("municipio_approximate"):
+            quote["municipio_approximate"] = True
+    return quotes
 
 @app.get("/")
 def root():
     return {"message": "Welcome to the Insurance Prediction API"}
 
-@app.post("/save_insurance")
-def save_insurance(insurance: InsuranceData) -> Dict:
+def component_metrics() -> list:
+    """
+    Gauges and counters of the LLM cache, job queue and circuit breakers, read at scrape time.
+    """
+    cache = response_cache.stats()
+    jobs = job_queue.stats()
+    circuits = resilience.stats()
+    return [
+        ("backend_llm_cache_lookups_total", "counter", "LLM response cache lookups, by result.", [
+            ({"result": result}, cache[result]) for result in ("memory_hits", "disk_hits", "misses")
+        ]),
+        ("backend_job_queue_depth", "gauge", "LLM jobs waiting in the queue.", [({}, jobs["queue_depth"])]),
+        ("backend_jobs_running", "gauge", "LLM jobs being run.", [({}, jobs["running"])]),
+        ("backend_circuit_open", "gauge", "Whether a model's circuit breaker is open (1) or not (0).", [
+            ({"model": model}, int(health["circuit"] == "open")) for model, health in circuits.items()
+        ]),
+    ]
+
+metrics.register_collector(component_metrics)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics() -> PlainTextResponse:
     """
-    Save new insurance data to a JSON file.
+    Per-stage and per-endpoint latency histograms and component gauges, in the Prometheus text format.
+    """
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/startup/stats")
+def startup_stats() -> Dict:
+    """
+    Time this worker took to become ready, the LLM warm-up, and the build and reloads of each reference data source.
+    """
+    return {**startup_report, "reference_data": reference_data.stats()}
+
+@app.get("/image_index/stats")
+def image_index_stats() -> Dict:
+    """
+    Stored photo hashes, duplicate and cross-claim match rates, and lookup latency.
+    """
+    return image_index.stats()
+
+@app.get("/llm_cache/stats")
+def llm_cache_stats() -> Dict:
+    """
+    Hit/miss counters of the Gemini response cache.
+    """
+    return response_cache.stats()
+
+@app.get("/policy_index/stats")
+def policy_index_stats() -> Dict:
+    """
+    Prompt size before and after policy retrieval, and retrieval latency, per endpoint.
+    """
+    return policy_index.stats()
+
+@app.get("/coverage_rules/stats")
+def coverage_rules_stats() -> Dict:
+    """
+    Hit rate and latency of the local coverage rule engine.
+    """
+    return coverage_engine.stats()
+
+@app.get("/llm_resilience/stats")
+def llm_resilience_stats() -> Dict:
+    """
+    Circuit state, latency percentiles, retries and hedges of the Gemini calls, per model.
+    """
+    return resilience.stats()
+
+@app.get("/model_router/stats")
+def model_router_stats() -> Dict:
+    """
+    Per-model latency and validation failures, and per-endpoint routing and escalation rate.
+    """
+    return model_router.stats()
+
+async def enqueue_job(kind: str, payload: dict, provisional: Optional[dict] = None) -> JSONResponse:
+    """
+    Queue an LLM job and answer 202 right away with the ID to poll at /jobs/{job_id},
+    along with any `provisional` result already known locally.
     """
     try:
-        # Load existing insurances
-        if os.path.exists(INSURANCE_FILE):
-            with open(INSURANCE_FILE, "r", encoding="utf-8") as file:
-                insurances = json.load(file)
-        else:
-            insurances = []
+        job_id = await asyncio.to_thread(job_queue.submit, kind, payload)
+    except QueueFullError as e:
+        # A slot frees up each time a worker takes a token from the rate limiter
+        retry_after = max(1, round(1 / job_queue.bucket.rate))
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(retry_after)})
+    content = {"job_id": job_id, "status": "queued", "status_url": f"/jobs/{job_id}"}
+    if provisional is not None:
+        content["provisional"] = provisional
+    return JSONResponse(status_code=202, content=content)
+
+def image_payload(file_name: Optional[str], image: PreparedImage) -> dict:
+    return {
+        "file_name": file_name,
+        "data": base64.b64encode(image.data).decode("ascii"),
+        "mime_type": image.mime_type,
+        "width": image.width,
+        "height": image.height,
+        "dhash": image.dhash,
+    }
+
+def image_from_payload(payload: dict) -> PreparedImage:
+    return PreparedImage(
+        base64.b64decode(payload["data"]), payload["mime_type"], payload["width"], payload["height"], payload.get("dhash"),
+    )
+
+def prefill_from_photo(image: PreparedImage) -> dict:
+    """
+    Insurance fields read locally from the photo's features (colour and coordinates),
+    so the LLM is only asked for the rest, plus the capture date and the municipality
+    geocoded from the coordinates.
+    """
+    prefilled = prefill_insurance_data(image.features)
+    place = geocoder.lookup(*prefilled["coordinates"]) if "coordinates" in prefilled else None
+    if place is not None:
+        prefilled["municipio"] = place["code"]
+        prefilled["municipio_approximate"] = True
+    return prefilled
+
+async def find_duplicate_photo(image: PreparedImage, file_name: Optional[str], claim_id: Optional[str]) -> Optional[tuple[dict, dict]]:
+    """
+    Analysis and report of an earlier near-identical photo, or None; a photo
+    first sent with a different claim is logged as reused across claims.
+    """
+    if image.dhash is None:
+        return None
+    with span("image_dedup"):
+        match = await asyncio.to_thread(image_index.lookup, image.dhash, claim_id)
+    if match is None:
+        return None
+    report = match.report(claim_id)
+    if report["cross_claim"]:
+        log_event(
+            "image_reused_across_claims", level="warning", claim_id=claim_id, file_name=file_name,
+            original_claim_id=match.claim_id, original_file_name=match.file_name, distance=match.distance,
+        )
+    return match.analysis, report
+
+async def remember_photo(image: PreparedImage, analysis: dict, file_name: Optional[str], claim_id: Optional[str]) -> None:
+    if image.dhash is None:
+        return
+    try:
+        await asyncio.to_thread(image_index.add, image.dhash, analysis, claim_id, file_name)
+    except Exception as e:
+        # Deduplication is best effort; the analysis is still returned
+        log_event("image_index_failed", level="warning", error=str(e))
+
+async def analyze_claim_photo(
+    image: PreparedImage, file_name: Optional[str], claim_id: Optional[str], endpoint: str = "process_image",
+) -> dict:
+    """
+    Damage analysis of a claim photo, reused from an earlier near-identical photo
+    when there is one (with a `duplicate_of` report) instead of asking Gemini again.
+    """
+    duplicate = await find_duplicate_photo(image, file_name, claim_id)
+    if duplicate is not None:
+        analysis, report = duplicate
+        return {"image_analysis": analysis, "duplicate_of": report}
+    analysis = await process_image_with_gemini(image, endpoint=endpoint)
+    await remember_photo(image, analysis, file_name, claim_id)
+    return {"image_analysis": analysis}
+
+@app.get("/jobs/stats")
+def jobs_stats() -> Dict:
+    """
+    Depth, wait time and rejection counters of the LLM job queue.
+    """
+    return job_queue.stats()
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str, wait: float = Query(0, ge=0, le=MAX_JOB_WAIT)) -> Dict:
+    """
+    Status of a queued LLM job, with its result once done.
+
+    With `wait` the request is held open for up to that many seconds until the job finishes.
+    """
+    job = await job_queue.wait(job_id, wait) if wait else await asyncio.to_thread(job_queue.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return job
+
+def ine_dataset(dataset: str):
+    statistics = ine_stats.get(dataset)
+    if statistics is None:
+        raise HTTPException(status_code=404, detail=f"Unknown dataset: {dataset}")
+    return statistics
+
+@app.get("/ine/stats")
+def ine_stats_summary() -> Dict:
+    """
+    Rows, municipalities, years and cache file of each INE dataset.
+    """
+    return ine_stats.stats()
+
+@app.get("/ine/{dataset}/municipios/{code}")
+def ine_municipality_series(dataset: str, code: str) -> Dict:
+    """
+    Yearly series of one municipality, by its 5-digit INE code.
+    """
+    statistics = ine_dataset(dataset)
+    series = statistics.series(int(code)) if code.isdigit() else None
+    if series is None:
+        raise HTTPException(status_code=404, detail=f"Unknown municipality: {code}")
+    return series
+
+@app.get("/ine/{dataset}/aggregates")
+def ine_aggregates(
+    dataset: str,
+    year: Optional[int] = Query(None),
+    province: Optional[str] = Query(None, min_length=2, max_length=2),
+) -> Dict:
+    """
+    Totals per year and province, optionally for one year and/or province (2-digit code).
+    """
+    return {"aggregates": ine_dataset(dataset).aggregates(year, province)}
+
+@app.post("/quote")
+def quote(record: QuoteRequest) -> Dict:
+    """
+    Deterministic yearly premium for one tractor, with the factors applied.
+    """
+    records = attach_municipios([record.model_dump()])
+    return flag_approximate([pricing_engine.quote(records[0])], records)[0]
+
+@app.post("/quote/batch")
+def quote_batch(records: list[QuoteRequest] = Body(..., max_length=MAX_QUOTE_BATCH)) -> Dict:
+    """
+    Price a whole portfolio in one pass, in the order of the records.
+    """
+    records = attach_municipios([record.model_dump() for record in records])
+    quotes = flag_approximate(pricing_engine.quote_batch(records), records)
+    return {
+        "quotes": quotes,
+        "count": len(quotes),
+        "total_premium": round(sum(quote["premium"] for quote in quotes), 2),
+    }
+
+@app.get("/geocode")
+def geocode(lat: float = Query(..., ge=-90, le=90), lon: float = Query(..., ge=-180, le=180)) -> Dict:
+    """
+    INE municipality nearest to a coordinate pair.
+    """
+    match = geocoder.lookup(lat, lon)
+    if match is None:
+        raise HTTPException(status_code=404, detail="No known municipality near these coordinates.")
+    return match
+
+@app.post("/geocode/batch")
+def geocode_batch(coordinates: list[tuple[float, float]] = Body(..., max_length=MAX_QUOTE_BATCH)) -> Dict:
+    """
+    Nearest municipality of each (lat, lon) pair, in order; null where none is near.
+    """
+    return {"municipios": geocoder.lookup_many(coordinates)}
+
+async def weather_evidence(lat: float, lon: float, day: date) -> dict:
+    """
+    Cached weather at the nearest AEMET station on `day`, with the municipality of the place.
+    """
+    evidence = await weather.context(lat, lon, day)
+    evidence["municipio"] = geocoder.lookup(lat, lon)
+    return evidence
+
+@app.get("/weather")
+async def weather_at(
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    day: Optional[date] = Query(None, alias="date"),
+) -> Dict:
+    """
+    Weather evidence for a place and date (today by default), answered from the
+    cache; `status` is `pending` while AEMET is asked in the background.
+    """
+    if day is not None and day > date.today():
+        raise HTTPException(status_code=422, detail="date cannot be in the future")
+    return await weather_evidence(lat, lon, day or date.today())
 
-        # Add new insurance
-        insurances.append(insurance.dict())
+@app.get("/weather/stats")
+def weather_stats() -> Dict:
+    """
+    Stations and station-days cached, hit rate, and AEMET prefetches and fetches.
+    """
+    return weather.stats()
 
-        # Save back to the file
-        with open(INSURANCE_FILE, "w", encoding="utf-8") as file:
-            json.dump(insurances, file, indent=4, ensure_ascii=False)
+@app.post("/vehicles/lookup")
+async def vehicles_lookup(vehicle_ids: list[str] = Body(..., max_length=MAX_VEHICLE_BATCH)) -> Dict:
+    """
+    Registry records of many vehicles, looked up concurrently and cached; an
+    unknown ID maps to null, and one the registry failed on is listed in `errors`.
+    """
+    if not vehicle_registry.enabled:
+        raise HTTPException(status_code=503, detail="The vehicle registry is not configured.")
+    results = await vehicle_registry.lookup_many(vehicle_ids)
+    errors = {vehicle_id: str(result) for vehicle_id, result in results.items() if isinstance(result, VehicleLookupError)}
+    return {
+        "vehicles": {vehicle_id: result for vehicle_id, result in results.items() if vehicle_id not in errors},
+        "errors": errors,
+    }
 
-        return {"message": "Insurance data saved successfully."}
+@app.get("/vehicles/stats")
+def vehicles_stats() -> Dict:
+    """
+    Vehicle registry cache size and hit rate (404s included), and request volume and latency.
+    """
+    return vehicle_registry.stats()
+
+@app.get("/geocoder/stats")
+def geocoder_stats() -> Dict:
+    """
+    Centroids indexed, and lookup volume and latency of the reverse geocoder.
+    """
+    return geocoder.stats()
+
+@app.get("/pricing/stats")
+def pricing_stats() -> Dict:
+    """
+    Municipalities with an exposure factor, and quoting volume and latency.
+    """
+    return pricing_engine.stats()
+
+@app.post("/save_insurance")
+async def save_insurance(insurance: InsuranceData) -> Dict:
+    """
+    Save new insurance data to the insurance store.
+    """
+    try:
+        # The geocoded municipality is only approximate: it is stored flagged `municipio_approximate`,
+        # so the `municipio` filter finds the record and callers can still leave such matches out
+        record = insurance.dict()
+        place = geocoder.lookup(*insurance.coordinates)
+        if place is not None:
+            record["municipio"] = place["code"]
+            record["municipio_approximate"] = True
+        # Stored with the record once settled: the registry is waited for briefly, and a check
+        # still `pending` then is only returned, as nothing would update the stored one later
+        vehicle_check = None
+        if insurance.vehicle_id:
+            vehicle_check = await vehicle_registry.verify(insurance.vehicle_id, insurance.modelo_tractor)
+            if vehicle_check["status"] != "pending":
+                record["vehicle_check"] = vehicle_check
+        # Append the new insurance as a single O(1) write
+        with span("storage"):
+            insurance_id = await asyncio.to_thread(insurance_store.append, record)
+
+        response = {"message": "Insurance data saved successfully.", "id": insurance_id, "municipio": place["code"] if place else None}
+        if place is not None:
+            response["municipio_approximate"] = True
+        if vehicle_check is not None:
+            response["vehicle_check"] = vehicle_check
+        return response
     except Exception as e:
-        print(f"Error in /save_insurance endpoint: {e}")
+        log_event("endpoint_error", level="error", error=str(e))
         raise HTTPException(status_code=500, detail="An error occurred while saving the insurance data.")
 
 @app.get("/load_insurances")
-def load_insurances() -> Dict:
+def load_insurances(
+    request: Request,
+    response: Response,
+    cursor: Optional[int] = Query(None, description="ID of the last record of the previous page."),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    modelo: Optional[str] = Query(None, description="Exact tractor model."),
+    año_min: Optional[int] = None,
+    año_max: Optional[int] = None,
+    garaje: Optional[bool] = None,
+    bbox: Optional[str] = Query(None, description="min_lat,min_lon,max_lat,max_lon"),
+    municipio: Optional[str] = Query(None, description="5-digit INE municipality code."),
+    municipio_exact: bool = Query(False, description="Leave out records whose municipio was geocoded from the coordinates."),
+    format: str = Query("json", pattern="^(json|ndjson)$"),
+):
     """
-    Load all saved insurances from the JSON file.
+    Load saved insurances from the insurance store, paginated and filtered server-side.
+
+    With `format=ndjson` the matching records are streamed one per line as they are read.
     """
     try:
-        # Load insurances from the file
-        if os.path.exists(INSURANCE_FILE):
-            with open(INSURANCE_FILE, "r", encoding="utf-8") as file:
-                insurances = json.load(file)
-        else:
-            insurances = []
-
-        return {"insurances": insurances}
+        filters = {"modelo": modelo, "año_min": año_min, "año_max": año_max, "garaje": garaje, "municipio": municipio,
+                   "municipio_exact": municipio_exact}
+        if bbox is not None:
+            try:
+                min_lat, min_lon, max_lat, max_lon = (float(value) for value in bbox.split(","))
+            except ValueError:
+                raise HTTPException(status_code=422, detail="bbox must be min_lat,min_lon,max_lat,max_lon.")
+            filters["bbox"] = (min_lat, min_lon, max_lat, max_lon)
+
+        # The store is append-only, so its version plus the query identifies the response
+        with span("storage"):
+            version = insurance_store.version()
+        etag_source = f"{version}|{sorted(request.query_params.multi_items())}"
+        etag = '"' + hashlib.sha1(etag_source.encode("utf-8")).hexdigest() + '"'
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers={"ETag": etag})
+
+        if format == "ndjson":
+            records = insurance_store.iter_records(after_id=cursor, limit=limit, **filters)
+            lines = (json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+            return StreamingResponse(lines, media_type="application/x-ndjson", headers={"ETag": etag})
+
+        page_size = limit or DEFAULT_PAGE_SIZE
+        # Fetch one extra record to know whether there is a next page
+        with span("storage"):
+            insurances = insurance_store.query(after_id=cursor, limit=page_size + 1, **filters)
+        next_cursor = None
+        if len(insurances) > page_size:
+            insurances = insurances[:page_size]
+            next_cursor = insurances[-1]["id"]
+
+        response.headers["ETag"] = etag
+        return {"insurances": insurances, "next_cursor": next_cursor}
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Error in /load_insurances endpoint: {e}")
+        log_event("endpoint_error", level="error", error=str(e))
         raise HTTPException(status_code=500, detail="An error occurred while loading the insurance data.")
 
 @app.post("/process_accident")
-def process_accident(accident: AccidentDescription) -> Dict:
+async def process_accident(accident: AccidentDescription, async_mode: bool = Query(False, alias="async")) -> Dict:
     """
     Process an accident description and generate a JSON response with facts and unanswered questions.
+
+    With `async=true` the request is queued and a job ID is returned right away.
     """
+    if async_mode:
+        return await enqueue_job("process_accident", accident.model_dump(mode="json"))
     try:
-        # Load insurance data from seguro.md
-        with open("data/seguro.md", "r", encoding="utf-8") as file:
-            insurance_data = file.read()
+        # Retrieve the sections of seguro.md relevant to the accident
+        insurance_data = policy_index.context_for(accident.accident_description, "seguro.md", "process_accident")
         
         # Prepare data for Gemini
         gemini_input = {
@@ -91,90 +636,248 @@ def process_accident(accident: AccidentDescription) -> Dict:
         }
         
         # Generate response using Gemini
-        response = generate_insurance_recommendations(gemini_input)
+        response = await generate_insurance_recommendations(gemini_input, endpoint="process_accident")
         
-        # Debug print for Gemini result
-        print("Gemini Accident Processing (Debug):", response)
+        log_event("llm_response", level="debug", description="Accident Processing", response=response)
         
         # Return the response
-        return {
+        result = {
             "accident_description": accident.accident_description,
             "insurance_response": response
         }
+        if accident.coordinates is not None:
+            result["weather"] = await weather_evidence(*accident.coordinates, accident.accident_date or date.today())
+        return result
     except Exception as e:
         # Handle errors and return a meaningful message
-        print(f"Error occurred: {e}")
-        raise HTTPException(status_code=500, detail="An error occurred while processing the accident description.")
+        log_event("endpoint_error", level="error", error=str(e))
+        raise upstream_error(e, "An error occurred while processing the accident description.")
 
 @app.post("/process_image")
-async def process_image(file: UploadFile = File(...)) -> Dict:
+async def process_image(
+    file: UploadFile = File(...),
+    claim_id: Optional[str] = Form(None),
+    vehicle_id: Optional[str] = Form(None),
+    async_mode: bool = Query(False, alias="async"),
+) -> Dict:
     """
     Process an image to identify the tractor model, analyze the insurance problem, and determine what happened.
+
+    A photo already analyzed (even re-compressed or resized) returns the stored
+    analysis with a `duplicate_of` report, flagged `cross_claim` when it was
+    first sent with another `claim_id`. With a `vehicle_id`, the identified
+    model is checked against the vehicle registry in `vehicle_check`. With
+    `async=true` the request is queued and a job ID is returned right away.
     """
     try:
-        # Save the uploaded file temporarily
-        file_location = f"/tmp/{file.filename}"
-        with open(file_location, "wb") as buffer:
-            buffer.write(await file.read())
-        
-        # Debug print for file location
-        print(f"File saved at {file_location}")
+        if vehicle_id:
+            # Looked up while the photo is analyzed, not after
+            vehicle_registry.prefetch(vehicle_id)
+
+        # Decode, orient, downscale and re-encode the upload in memory
+        image = await preprocess_upload(file)
+
+        if async_mode:
+            return await enqueue_job(
+                "process_image", {**image_payload(file.filename, image), "claim_id": claim_id, "vehicle_id": vehicle_id},
+            )
         
-        # Process the image using Gemini
-        response = process_image_with_gemini(file_location)
+        # Process the image using Gemini, unless the same photo was analyzed before
+        response = await analyze_claim_photo(image, file.filename, claim_id)
+        if vehicle_id:
+            response["vehicle_check"] = vehicle_registry.check(vehicle_id, response["image_analysis"].get("modelo_tractor"))
         
-        # Debug print for Gemini result
-        print("Gemini Image Processing (Debug):", response)
+        log_event("llm_response", level="debug", description="Image Processing", response=response)
         
         # Return the response
-        return {
-            "file_name": file.filename,
-            "image_analysis": response
-        }
+        return {"file_name": file.filename, **response}
+    except HTTPException:
+        raise
+    except ImageDecodeError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         # Log the error for debugging
-        print(f"Error in /process_image endpoint: {e}")
+        log_event("endpoint_error", level="error", error=str(e))
+        raise upstream_error(e, "An error occurred while processing the image.")
+
+@app.post("/process_image/stream")
+async def process_image_stream(file: UploadFile = File(...), claim_id: Optional[str] = Form(None)):
+    """
+    Same as /process_image, streamed as server-sent events while Gemini answers.
+    """
+    try:
+        image = await preprocess_upload(file)
+        duplicate = await find_duplicate_photo(image, file.filename, claim_id)
+    except ImageDecodeError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        log_event("endpoint_error", level="error", error=str(e))
         raise HTTPException(status_code=500, detail="An error occurred while processing the image.")
 
+    if duplicate is not None:
+        analysis, report = duplicate
+        return sse_response(
+            single_chunk(json.dumps(analysis, ensure_ascii=False)),
+            error_detail="An error occurred while processing the image.",
+            context={"file_name": file.filename, "duplicate_of": report},
+        )
+
+    async def remember(result: dict) -> dict:
+        # Only complete, valid analyses are reused for later copies of the photo
+        if not invalid_fields(DamageAssessment, result):
+            await remember_photo(image, result, file.filename, claim_id)
+        return result
+
+    return sse_response(
+        stream_image_with_gemini(image),
+        error_detail="An error occurred while processing the image.",
+        context={"file_name": file.filename},
+        on_result=remember,
+    )
+
+@app.post("/process_images")
+async def process_images(
+    files: list[UploadFile] = File(...),
+    claim_id: Optional[str] = Form(None),
+    combined: bool = Query(False),
+) -> Dict:
+    """
+    Process all the photos of a claim at once and merge the damages found across them.
+
+    By default each photo is analyzed separately with bounded parallelism, and
+    photos analyzed before reuse their analysis as in /process_image; with
+    `combined=true` all photos are sent to Gemini in a single multimodal request.
+    """
+    if len(files) > MAX_BATCH_IMAGES:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_IMAGES} images can be processed at once.")
+    try:
+        # Preprocess every upload in parallel on the image thread pool
+        images = await asyncio.gather(*(preprocess_upload(file) for file in files), return_exceptions=True)
+
+        if combined:
+            if any(isinstance(image, Exception) for image in images):
+                raise HTTPException(status_code=400, detail="One of the images could not be read.")
+            analysis = await process_images_with_gemini(images)
+            return {
+                "file_names": [file.filename for file in files],
+                "image_analysis": analysis,
+                "damage_summary": merge_damage_assessments([analysis]),
+            }
+
+        semaphore = asyncio.Semaphore(BATCH_IMAGE_CONCURRENCY)
+
+        async def analyze(file, image):
+            if isinstance(image, Exception):
+                return image
+            async with semaphore:
+                return await analyze_claim_photo(image, file.filename, claim_id, endpoint="process_images")
+
+        analyses = await asyncio.gather(*(analyze(file, image) for file, image in zip(files, images)), return_exceptions=True)
+
+        results = []
+        for file, analysis in zip(files, analyses):
+            if isinstance(analysis, ImageDecodeError):
+                results.append({"file_name": file.filename, "error": str(analysis)})
+            elif isinstance(analysis, Exception):
+                log_event("image_failed", level="error", file_name=file.filename, error=str(analysis))
+                results.append({"file_name": file.filename, "error": "An error occurred while processing the image."})
+            else:
+                results.append({"file_name": file.filename, **analysis})
+
+        succeeded = [analysis["image_analysis"] for analysis in analyses if not isinstance(analysis, Exception)]
+        if not succeeded:
+            if all(isinstance(analysis, ImageDecodeError) for analysis in analyses):
+                raise HTTPException(status_code=400, detail="None of the images could be read.")
+            raise HTTPException(status_code=500, detail="An error occurred while processing the images.")
+
+        return {
+            "results": results,
+            "damage_summary": merge_damage_assessments(succeeded),
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        log_event("endpoint_error", level="error", error=str(e))
+        raise upstream_error(e, "An error occurred while processing the images.")
+
 @app.post("/process_image_for_insurance")
-async def process_image_for_insurance(file: UploadFile = File(...)) -> Dict:
+async def process_image_for_insurance(file: UploadFile = File(...), async_mode: bool = Query(False, alias="async")) -> Dict:
     """
     Process an image to extract data for insurance creation, including tractor model, condition, color, year, etc.
+
+    The colour, capture date and GPS position are read locally from the photo
+    (listed in `local_fields`) and Gemini is only asked for the rest. With
+    `async=true` the request is queued and a job ID is returned right away,
+    with the local fields as `provisional`.
     """
     try:
-        # Save the uploaded file temporarily
-        file_location = f"/tmp/{file.filename}"
-        with open(file_location, "wb") as buffer:
-            buffer.write(await file.read())
-        
-        # Debug print for file location
-        print(f"File saved at {file_location}")
+        # Decode, orient, downscale and re-encode the upload in memory, extracting its local features
+        image = await preprocess_upload(file, features=True)
+        prefilled = prefill_from_photo(image)
+
+        if async_mode:
+            return await enqueue_job(
+                "process_image_for_insurance",
+                {**image_payload(file.filename, image), "prefilled": prefilled},
+                provisional=prefilled,
+            )
         
         # Process the image using Gemini
-        response = process_image_for_insurance_creation(file_location)
+        response = await process_image_for_insurance_creation(image, prefilled)
         
-        # Debug print for Gemini result
-        print("Gemini Insurance Creation Processing (Debug):", response)
+        log_event("llm_response", level="debug", description="Insurance Creation Processing", response=response)
         
         # Return the response
         return {
             "file_name": file.filename,
-            "insurance_data": response
+            "insurance_data": response,
+            "local_fields": list(prefilled),
         }
+    except HTTPException:
+        raise
+    except ImageDecodeError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         # Log the error for debugging
-        print(f"Error in /process_image_for_insurance endpoint: {e}")
+        log_event("endpoint_error", level="error", error=str(e))
+        raise upstream_error(e, "An error occurred while processing the image for insurance creation.")
+
+@app.post("/process_image_for_insurance/stream")
+async def process_image_for_insurance_stream(file: UploadFile = File(...)):
+    """
+    Same as /process_image_for_insurance, streamed as server-sent events: the
+    fields read locally come first, as `provisional` in the `context` event,
+    then Gemini's answer for the rest; `result` holds all of them.
+    """
+    try:
+        image = await preprocess_upload(file, features=True)
+        prefilled = prefill_from_photo(image)
+    except ImageDecodeError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        log_event("endpoint_error", level="error", error=str(e))
         raise HTTPException(status_code=500, detail="An error occurred while processing the image for insurance creation.")
 
+    context = {"file_name": file.filename, "provisional": prefilled}
+    return sse_response(
+        stream_image_for_insurance(image, insurance_fields_to_ask(prefilled)),
+        error_detail="An error occurred while processing the image for insurance creation.",
+        context=context,
+        on_result=lambda result: {**prefilled, **result},
+    )
+
 @app.post("/create_personalized_insurance")
-def create_personalized_insurance(user_input: str = Body(..., embed=True)) -> Dict:
+async def create_personalized_insurance(user_input: str = Body(..., embed=True), async_mode: bool = Query(False, alias="async")) -> Dict:
     """
     Create a personalized insurance plan based on the data in seguro.md and user-provided input.
+
+    With `async=true` the request is queued and a job ID is returned right away.
     """
+    if async_mode:
+        return await enqueue_job("create_personalized_insurance", {"user_input": user_input})
     try:
-        # Load insurance data from seguro.md
-        with open("data/seguro.md", "r", encoding="utf-8") as file:
-            insurance_data = file.read()
+        # Retrieve the sections of seguro.md relevant to the user's needs
+        insurance_data = policy_index.context_for(user_input, "seguro.md", "create_personalized_insurance")
 
         # Prepare data for Gemini
         gemini_input = {
@@ -183,10 +886,9 @@ def create_personalized_insurance(user_input: str = Body(..., embed=True)) -> Di
         }
 
         # Generate response using Gemini
-        response = generate_insurance_recommendations(gemini_input)
+        response = await generate_insurance_recommendations(gemini_input, endpoint="create_personalized_insurance")
 
-        # Debug print for Gemini result
-        print("Gemini Personalized Insurance (Debug):", response)
+        log_event("llm_response", level="debug", description="Personalized Insurance", response=response)
 
         # Return the response
         return {
@@ -195,18 +897,48 @@ def create_personalized_insurance(user_input: str = Body(..., embed=True)) -> Di
         }
     except Exception as e:
         # Handle errors and return a meaningful message
-        print(f"Error in /create_personalized_insurance endpoint: {e}")
-        raise HTTPException(status_code=500, detail="An error occurred while creating the personalized insurance.")
+        log_event("endpoint_error", level="error", error=str(e))
+        raise upstream_error(e, "An error occurred while creating the personalized insurance.")
+
+@app.post("/create_personalized_insurance/stream")
+async def create_personalized_insurance_stream(user_input: str = Body(..., embed=True)):
+    """
+    Same as /create_personalized_insurance, streamed as server-sent events while Gemini answers.
+    """
+    insurance_data = policy_index.context_for(user_input, "seguro.md", "create_personalized_insurance")
+
+    gemini_input = {
+        "user_input": user_input,
+        "insurance_data": insurance_data
+    }
+    return sse_response(
+        stream_insurance_recommendations(gemini_input, endpoint="create_personalized_insurance"),
+        error_detail="An error occurred while creating the personalized insurance.",
+        context={"user_input": user_input},
+    )
 
 @app.post("/analyze_vehicle_condition")
-def analyze_vehicle_condition(description: str = Body(..., embed=True)) -> Dict:
+async def analyze_vehicle_condition(description: str = Body(..., embed=True), async_mode: bool = Query(False, alias="async")) -> Dict:
     """
     Analyze the vehicle's condition and determine coverage based on the data in cobertura.txt.
+
+    With `async=true` a request that needs the LLM is queued and a job ID is returned right away.
     """
     try:
-        # Load coverage data from cobertura.txt
-        with open("data/cobertura.txt", "r", encoding="utf-8") as file:
-            coverage_data = file.read()
+        # Answer locally when the description maps unambiguously onto cobertura.txt
+        local_analysis = coverage_engine.evaluate(description)
+        if local_analysis is not None:
+            return {
+                "description": description,
+                "coverage_analysis": local_analysis,
+                "source": "rules",
+            }
+
+        if async_mode:
+            return await enqueue_job("analyze_vehicle_condition", {"description": description})
+
+        # Retrieve the sections of cobertura.txt relevant to the description
+        coverage_data = policy_index.context_for(description, "cobertura.txt", "analyze_vehicle_condition")
 
         # Prepare data for Gemini
         gemini_input = {
@@ -215,88 +947,149 @@ def analyze_vehicle_condition(description: str = Body(..., embed=True)) -> Dict:
         }
 
         # Generate response using Gemini
-        response = generate_insurance_recommendations(gemini_input)
+        response = await generate_insurance_recommendations(gemini_input, endpoint="analyze_vehicle_condition")
 
-        # Debug print for Gemini result
-        print("Gemini Vehicle Condition Analysis (Debug):", response)
+        log_event("llm_response", level="debug", description="Vehicle Condition Analysis", response=response)
 
         # Return the response
         return {
             "description": description,
-            "coverage_analysis": response
+            "coverage_analysis": response,
+            "source": "llm",
         }
+    except HTTPException:
+        raise
     except Exception as e:
         # Handle errors and return a meaningful message
-        print(f"Error in /analyze_vehicle_condition endpoint: {e}")
-        raise HTTPException(status_code=500, detail="An error occurred while analyzing the vehicle condition.")
+        log_event("endpoint_error", level="error", error=str(e))
+        raise upstream_error(e, "An error occurred while analyzing the vehicle condition.")
 
-@app.post("/analyze_report")
-async def analyze_report(file: UploadFile = File(...)) -> Dict:
+@app.post("/analyze_vehicle_condition/stream")
+async def analyze_vehicle_condition_stream(description: str = Body(..., embed=True)):
     """
-    Analyze the audio report by transcribing it and determining the next steps.
+    Same as /analyze_vehicle_condition, streamed as server-sent events; each
+    `coverage_analysis` item is sent as soon as Gemini closes it.
     """
-    temp_audio_path = None
-    temp_wav_path = None
+    local_analysis = coverage_engine.evaluate(description)
+    if local_analysis is not None:
+        return sse_response(
+            single_chunk(json.dumps(local_analysis, ensure_ascii=False)),
+            error_detail="An error occurred while analyzing the vehicle condition.",
+            context={"description": description, "source": "rules"},
+        )
 
-    # List of important questions
-    important_questions = [
-        "¿Dónde ocurrió el accidente?",
-        "¿Hubo heridos?",
-        "¿Cuál es el estado del vehículo?",
-        "¿Cuántos vehículos estuvieron involucrados?",
-    ]
+    coverage_data = policy_index.context_for(description, "cobertura.txt", "analyze_vehicle_condition")
 
-    # Simulate a session to track unanswered questions
-    session = {"unanswered_questions": important_questions}
+    gemini_input = {
+        "description": description,
+        "coverage_data": coverage_data
+    }
+    return sse_response(
+        stream_insurance_recommendations(gemini_input, endpoint="analyze_vehicle_condition"),
+        error_detail="An error occurred while analyzing the vehicle condition.",
+        context={"description": description, "source": "llm"},
+    )
 
+@app.post("/analyze_report")
+async def analyze_report(file: UploadFile = File(...), claim_id: Optional[str] = Form(None)) -> Dict:
+    """
+    Analyze the audio report by transcribing it and determining the next steps.
+
+    Reports are tracked per claim: each new recording is only matched against the
+    questions still open for `claim_id`. Without a claim ID a new session is started
+    and its ID is returned so the next recording can continue it.
+    """
     try:
-        # Save the uploaded audio file temporarily
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".m4a") as temp_audio_file:
-            temp_audio_file.write(await file.read())
-            temp_audio_path = temp_audio_file.name
-
-        # Convert the audio file to WAV format
-        temp_wav_path = temp_audio_path.replace(".m4a", ".wav")
-        audio = AudioSegment.from_file(temp_audio_path, format="m4a")
-        audio.export(temp_wav_path, format="wav")
-
-        # Transcribe the WAV audio file
-        recognizer = sr.Recognizer()
-        with sr.AudioFile(temp_wav_path) as source:
-            audio_data = recognizer.record(source)
-            transcription = recognizer.recognize_google(audio_data, language="es-ES")
-
-        # Debug print for transcription
-        print(f"Transcription: {transcription}")
-
-        # Analyze the transcription to determine which questions are still unanswered
-        for question in session["unanswered_questions"]:
-            if question.lower() in transcription.lower():
-                session["unanswered_questions"].remove(question)
+        # Decode in memory, split on silence and transcribe the segments concurrently
+        with span("upload_read"):
+            raw = await file.read()
+        transcription = await transcribe(raw, audio_format(file.filename))
+        if not transcription:
+            raise HTTPException(status_code=400, detail="No se pudo entender el audio. Inténtalo de nuevo.")
+
+        # Loaded (or started) only once there is a transcription, so a failed recording leaves no session behind
+        session = await asyncio.to_thread(report_sessions.get_or_create, claim_id)
+
+        # Detect which of the still open questions this recording answers
+        answered = intent_matcher.match(transcription, session.open_questions)
+        await asyncio.to_thread(report_sessions.record, session, transcription, answered)
 
         # If there are no more unanswered questions, return a completion response
-        if not session["unanswered_questions"]:
+        if not session.open_questions:
             return {
+                "claim_id": session.claim_id,
                 "status": "okey",
                 "message": "El reporte está completo. Procede al siguiente paso.",
+                "answered": session.answers,
             }
 
         # Otherwise, return the remaining questions
         return {
+            "claim_id": session.claim_id,
             "status": "incomplete",
-            "questions": session["unanswered_questions"],
+            "questions": [intent_matcher.questions[question_id].text for question_id in session.open_questions],
+            "answered": session.answers,
         }
 
-    except sr.UnknownValueError:
-        raise HTTPException(status_code=400, detail="No se pudo entender el audio. Inténtalo de nuevo.")
-    except sr.RequestError as e:
+    except HTTPException:
+        raise
+    except SpeechServiceError as e:
         raise HTTPException(status_code=500, detail=f"Error al procesar el audio: {e}")
     except Exception as e:
-        print(f"Error in /analyze_report endpoint: {e}")
+        log_event("endpoint_error", level="error", error=str(e))
         raise HTTPException(status_code=500, detail="Ocurrió un error al analizar el reporte.")
-    finally:
-        # Clean up the temporary audio files
-        if temp_audio_path and os.path.exists(temp_audio_path):
-            os.remove(temp_audio_path)
-        if temp_wav_path and os.path.exists(temp_wav_path):
-            os.remove(temp_wav_path)
\ No newline at end of file
+
+@app.post("/analyze_report/stream")
+async def analyze_report_stream(file: UploadFile = File(...)):
+    """
+    Transcribe an audio report and stream each segment's partial transcript as
+    a server-sent event as soon as it is recognized, then the full transcription.
+    """
+    with span("upload_read"):
+        raw = await file.read()
+    format = audio_format(file.filename)
+
+    async def events():
+        parts = []
+        try:
+            async for part in transcribe_segments(raw, format):
+                parts.append(part)
+                yield sse_event("segment", part)
+            parts.sort(key=lambda part: part["index"])
+            yield sse_event("result", {"transcription": " ".join(part["text"] for part in parts if part["text"])})
+        except Exception as e:
+            log_event("endpoint_error", level="error", error=str(e))
+            yield sse_event("error", {"detail": "Ocurrió un error al analizar el reporte."})
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+# Job handlers: a queued job runs the same code as the synchronous request
+async def process_accident_job(payload: dict) -> Dict:
+    with latency_budget("process_accident"):
+        return await process_accident(AccidentDescription(**payload), async_mode=False)
+
+async def process_image_job(payload: dict) -> Dict:
+    with latency_budget("process_image"):
+        response = await analyze_claim_photo(image_from_payload(payload), payload["file_name"], payload.get("claim_id"))
+    if payload.get("vehicle_id"):
+        response["vehicle_check"] = vehicle_registry.check(payload["vehicle_id"], response["image_analysis"].get("modelo_tractor"))
+    return {"file_name": payload["file_name"], **response}
+
+async def process_image_for_insurance_job(payload: dict) -> Dict:
+    with latency_budget("process_image_for_insurance"):
+        response = await process_image_for_insurance_creation(image_from_payload(payload), payload.get("prefilled"))
+    return {"file_name": payload["file_name"], "insurance_data": response}
+
+async def create_personalized_insurance_job(payload: dict) -> Dict:
+    with latency_budget("create_personalized_insurance"):
+        return await create_personalized_insurance(payload["user_input"], async_mode=False)
+
+async def analyze_vehicle_condition_job(payload: dict) -> Dict:
+    with latency_budget("analyze_vehicle_condition"):
+        return await analyze_vehicle_condition(payload["description"], async_mode=False)
+
+job_queue.register("process_accident", process_accident_job)
+job_queue.register("process_image", process_image_job)
+job_queue.register("process_image_for_insurance", process_image_for_insurance_job)
+job_queue.register("create_personalized_insurance", create_personalized_insurance_job)
+job_queue.register("analyze_vehicle_condition", analyze_vehicle_condition_job)
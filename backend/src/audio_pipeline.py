@@ -0,0 +1,187 @@
+import io
+import os
+import json
+import asyncio
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, AsyncIterator, Optional
+from src.telemetry import span
+
+if TYPE_CHECKING:
+    # SpeechRecognition and pydub are imported on first use, only by workers that get audio
+    from pydub import AudioSegment
+
+SAMPLE_RATE = 16000
+# Segmentation: a pause this long splits the audio, segments are merged up to SPEECH_MAX_SEGMENT_MS
+SPEECH_MIN_SILENCE_MS = int(os.environ.get("SPEECH_MIN_SILENCE_MS", "500"))
+SPEECH_SILENCE_OFFSET_DB = float(os.environ.get("SPEECH_SILENCE_OFFSET_DB", "16"))
+SPEECH_MAX_SEGMENT_MS = int(os.environ.get("SPEECH_MAX_SEGMENT_MS", "15000"))
+SEGMENT_PADDING_MS = 200
+SPEECH_MAX_CONCURRENCY = int(os.environ.get("SPEECH_MAX_CONCURRENCY", "4"))
+SPEECH_LANGUAGE = os.environ.get("SPEECH_LANGUAGE", "es-ES")
+
+
+@dataclass(frozen=True)
+class Segment:
+    index: int
+    start_ms: int
+    end_ms: int
+    audio: "AudioSegment"
+
+
+class SpeechServiceError(Exception):
+    """
+    The speech recognition service could not be reached or refused the request.
+    """
+
+
+class GoogleRecognizer:
+    """
+    Transcribes segments with the Google Web Speech API through SpeechRecognition.
+    """
+
+    def __init__(self, language: str = SPEECH_LANGUAGE):
+        import speech_recognition as sr  # Using SpeechRecognition for transcription
+
+        self.language = language
+        self._sr = sr
+        self._recognizer = sr.Recognizer()
+
+    def recognize(self, segment: Segment) -> str:
+        sr = self._sr
+        audio = segment.audio
+        audio_data = sr.AudioData(audio.raw_data, audio.frame_rate, audio.sample_width)
+        try:
+            return self._recognizer.recognize_google(audio_data, language=self.language)
+        except sr.UnknownValueError:
+            # A segment with no intelligible speech contributes nothing
+            return ""
+        except sr.RequestError as e:
+            raise SpeechServiceError(str(e)) from e
+
+
+class LocalRecognizer:
+    """
+    Offline stand-in recognizer: returns the i-th scripted transcript for segment i.
+
+    Used in tests and benchmarks so the pipeline can run without network access.
+    """
+
+    def __init__(self, transcripts: list[str]):
+        self.transcripts = transcripts
+
+    def recognize(self, segment: Segment) -> str:
+        if segment.index < len(self.transcripts):
+            return self.transcripts[segment.index]
+        return ""
+
+
+def get_recognizer():
+    """
+    Recognizer backend selected by SPEECH_BACKEND (`google`, the default, or `local`).
+
+    The local backend reads its scripted transcripts from the JSON list in
+    SPEECH_LOCAL_TRANSCRIPTS.
+    """
+    backend = os.environ.get("SPEECH_BACKEND", "google")
+    if backend == "local":
+        path = os.environ.get("SPEECH_LOCAL_TRANSCRIPTS")
+        transcripts = []
+        if path:
+            with open(path, "r", encoding="utf-8") as file:
+                transcripts = json.load(file)
+        return LocalRecognizer(transcripts)
+    if backend == "google":
+        return GoogleRecognizer()
+    raise ValueError(f"Unknown SPEECH_BACKEND: {backend}")
+
+
+def decode_audio(raw: bytes, format: Optional[str] = None) -> "AudioSegment":
+    """
+    Decode an upload in memory as 16 kHz mono 16-bit PCM.
+
+    ffmpeg reads the bytes from a pipe and resamples while decoding, so no
+    temporary files are written.
+    """
+    from pydub import AudioSegment
+
+    if format == "wav":
+        audio = AudioSegment.from_file(io.BytesIO(raw), format="wav")
+    else:
+        audio = AudioSegment.from_file(
+            io.BytesIO(raw),
+            format=format,
+            parameters=["-ar", str(SAMPLE_RATE), "-ac", "1"],
+        )
+    return audio.set_frame_rate(SAMPLE_RATE).set_channels(1).set_sample_width(2)
+
+
+def split_segments(audio: "AudioSegment") -> list[Segment]:
+    """
+    Split the audio on pauses, then merge neighbouring speech ranges into
+    segments no longer than SPEECH_MAX_SEGMENT_MS.
+    """
+    from pydub.silence import detect_nonsilent
+
+    silence_thresh = audio.dBFS - SPEECH_SILENCE_OFFSET_DB if audio.dBFS != float("-inf") else -50
+    ranges = detect_nonsilent(audio, min_silence_len=SPEECH_MIN_SILENCE_MS, silence_thresh=silence_thresh, seek_step=10)
+
+    merged: list[list[int]] = []
+    for start, end in ranges:
+        # Very long stretches of speech are cut at the maximum segment length
+        while end - start > SPEECH_MAX_SEGMENT_MS:
+            merged.append([start, start + SPEECH_MAX_SEGMENT_MS])
+            start += SPEECH_MAX_SEGMENT_MS
+        if merged and end - merged[-1][0] <= SPEECH_MAX_SEGMENT_MS:
+            merged[-1][1] = end
+        else:
+            merged.append([start, end])
+
+    segments = []
+    for index, (start, end) in enumerate(merged):
+        start = max(0, start - SEGMENT_PADDING_MS)
+        end = min(len(audio), end + SEGMENT_PADDING_MS)
+        segments.append(Segment(index, start, end, audio[start:end]))
+    return segments
+
+
+async def transcribe_segments(raw: bytes, format: Optional[str] = None, recognizer=None) -> AsyncIterator[dict]:
+    """
+    Decode, segment and transcribe an audio upload, yielding each segment's
+    transcript as soon as it is ready (not necessarily in order).
+    """
+    recognizer = recognizer or get_recognizer()
+    with span("audio_convert"):
+        audio = await asyncio.to_thread(decode_audio, raw, format)
+        segments = await asyncio.to_thread(split_segments, audio)
+    semaphore = asyncio.Semaphore(SPEECH_MAX_CONCURRENCY)
+
+    async def recognize(segment: Segment) -> dict:
+        async with semaphore:
+            with span("transcription"):
+                text = await asyncio.to_thread(recognizer.recognize, segment)
+        return {"index": segment.index, "start_ms": segment.start_ms, "end_ms": segment.end_ms, "text": text}
+
+    tasks = [asyncio.create_task(recognize(segment)) for segment in segments]
+    try:
+        for task in asyncio.as_completed(tasks):
+            yield await task
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def transcribe(raw: bytes, format: Optional[str] = None, recognizer=None) -> str:
+    """
+    Full transcription of an audio upload, with segments joined in order.
+    """
+    parts = [part async for part in transcribe_segments(raw, format, recognizer)]
+    return " ".join(part["text"] for part in sorted(parts, key=lambda part: part["index"]) if part["text"])
+
+
+def audio_format(filename: Optional[str]) -> Optional[str]:
+    """
+    Format hint from the upload's file name; ffmpeg probes the content otherwise.
+    """
+    if filename and "." in filename:
+        return filename.rsplit(".", 1)[1].lower()
+    return None
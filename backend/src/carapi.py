@@ -1,18 +1,304 @@
-import requests
+import os
+import re
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Iterable, Optional
+from urllib.parse import quote
+from src.telemetry import log_event
 
-vehicle_id = '123456'  # Replace with the actual vehicle ID
-access_token = 'your_access_token'  # Replace with your valid access token
+if TYPE_CHECKING:
+    import httpx
 
-url = f'https://offers.system.trans.eu/api/rest/v1/vehicles/{vehicle_id}'
-headers = {
-    'Accept': 'application/hal+json',
-    'Authorization': f'Bearer {access_token}'
-}
+VEHICLE_API_URL = os.environ.get("VEHICLE_API_URL", "https://offers.system.trans.eu/api/rest/v1").rstrip("/")
+VEHICLE_API_TOKEN = os.environ.get("VEHICLE_API_TOKEN", "")
+VEHICLE_API_TIMEOUT = float(os.environ.get("VEHICLE_API_TIMEOUT", "5"))
+# Vehicle records kept in memory, and for how long; IDs the registry does not know are remembered for less time
+VEHICLE_CACHE_SIZE = int(os.environ.get("VEHICLE_CACHE_SIZE", "10000"))
+VEHICLE_CACHE_TTL = float(os.environ.get("VEHICLE_CACHE_TTL", "86400"))
+VEHICLE_NEGATIVE_TTL = float(os.environ.get("VEHICLE_NEGATIVE_TTL", "3600"))
+# Registry requests in flight at once, which is also the size of the connection pool
+VEHICLE_LOOKUP_CONCURRENCY = int(os.environ.get("VEHICLE_LOOKUP_CONCURRENCY", "8"))
+# Longest a save waits for the registry before storing the check as `pending`
+VEHICLE_CHECK_TIMEOUT = float(os.environ.get("VEHICLE_CHECK_TIMEOUT", "1"))
+# Vehicle IDs accepted per /vehicles/lookup call
+MAX_VEHICLE_BATCH = 500
 
-response = requests.get(url, headers=headers)
 
-if response.status_code == 200:
-    vehicle_data = response.json()
-    print(vehicle_data)
-else:
-    print(f'Error: {response.status_code}')
+class VehicleLookupError(Exception):
+    """
+    The registry could not answer (an error status other than 404, or a network failure).
+    """
+
+
+def _tokens(text: str) -> set[str]:
+    return set(re.findall(r"[0-9a-záéíóúñü]+", text.casefold()))
+
+
+def registry_model(record: dict) -> str:
+    """
+    Make and model of a registry record, e.g. "John Deere 6120M".
+    """
+    parts = [record.get("brand") or record.get("make"), record.get("model")]
+    return " ".join(str(part) for part in parts if part)
+
+
+def model_matches(claimed: str, record: dict) -> bool:
+    """
+    Whether a claimed model names the registered vehicle: every token of the
+    registered model must appear in it, and so must the make unless the claim
+    is just the model.
+    """
+    claimed_tokens = _tokens(claimed)
+    model_tokens = _tokens(str(record.get("model") or ""))
+    make_tokens = _tokens(str(record.get("brand") or record.get("make") or ""))
+    if not model_tokens or not model_tokens <= claimed_tokens:
+        return False
+    return claimed_tokens == model_tokens or make_tokens <= claimed_tokens
+
+
+class VehicleRegistry:
+    """
+    Vehicle registry client: looks vehicle records up by ID over one pooled
+    keep-alive connection set, at most VEHICLE_LOOKUP_CONCURRENCY at a time.
+
+    Records are kept in an in-memory LRU with a TTL, and 404s are cached too
+    (for VEHICLE_NEGATIVE_TTL) so unknown IDs do not hit the registry on every
+    request. Concurrent lookups of the same ID share one request.
+
+    Request handlers call `check`, which only reads the cache: on a miss the
+    lookup is started in the background and the check reports `pending`, so a
+    claimed model is verified without a network round trip on the request path.
+    Saves, whose check is stored, call `verify` instead, which waits briefly for
+    the registry.
+    """
+
+    def __init__(
+        self,
+        base_url: str = VEHICLE_API_URL,
+        token: str = VEHICLE_API_TOKEN,
+        timeout: float = VEHICLE_API_TIMEOUT,
+        max_entries: int = VEHICLE_CACHE_SIZE,
+        ttl: float = VEHICLE_CACHE_TTL,
+        negative_ttl: float = VEHICLE_NEGATIVE_TTL,
+        concurrency: int = VEHICLE_LOOKUP_CONCURRENCY,
+    ):
+        self.base_url = base_url
+        self.token = token
+        self.timeout = timeout
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.concurrency = concurrency
+        self._client: Optional["httpx.AsyncClient"] = None
+        self._cache: OrderedDict[str, tuple[float, Optional[dict]]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._inflight: dict[str, asyncio.Task] = {}
+        self._background: set[asyncio.Task] = set()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.counters = {
+            "lookups": 0, "hits": 0, "negative_hits": 0, "misses": 0, "coalesced": 0,
+            "requests": 0, "not_found": 0, "errors": 0, "evictions": 0, "request_seconds": 0.0,
+        }
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.token)
+
+    def start(self) -> None:
+        """
+        Bind to the running event loop, so sync handlers can start background lookups.
+        """
+        self._loop = asyncio.get_running_loop()
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+
+    def _http(self) -> "httpx.AsyncClient":
+        if self._client is None:
+            # Imported on first use, like the other HTTP SDKs, to keep start-up fast
+            import httpx
+
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                headers={"Accept": "application/hal+json", "Authorization": f"Bearer {self.token}"},
+                limits=httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency),
+            )
+        return self._client
+
+    def cached(self, vehicle_id: str) -> tuple[bool, Optional[dict]]:
+        """
+        (found, record) from the cache alone; a cached 404 is (True, None).
+        """
+        now = time.time()
+        with self._lock:
+            self.counters["lookups"] += 1
+            entry = self._cache.get(vehicle_id)
+            if entry is not None:
+                if entry[0] > now:
+                    self._cache.move_to_end(vehicle_id)
+                    self.counters["hits" if entry[1] is not None else "negative_hits"] += 1
+                    return True, entry[1]
+                del self._cache[vehicle_id]
+            self.counters["misses"] += 1
+        return False, None
+
+    def _remember(self, vehicle_id: str, record: Optional[dict]) -> None:
+        expires_at = time.time() + (self.ttl if record is not None else self.negative_ttl)
+        with self._lock:
+            self._cache[vehicle_id] = (expires_at, record)
+            self._cache.move_to_end(vehicle_id)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+                self.counters["evictions"] += 1
+
+    async def lookup(self, vehicle_id: str) -> Optional[dict]:
+        """
+        The registry record of a vehicle, or None if the registry does not know it.
+
+        Raises VehicleLookupError when the registry cannot be reached.
+        """
+        found, record = self.cached(vehicle_id)
+        if found:
+            return record
+        task = self._inflight.get(vehicle_id)
+        if task is None:
+            task = asyncio.get_running_loop().create_task(self._fetch(vehicle_id))
+            self._inflight[vehicle_id] = task
+            task.add_done_callback(lambda _: self._inflight.pop(vehicle_id, None))
+        else:
+            with self._lock:
+                self.counters["coalesced"] += 1
+        return await asyncio.shield(task)
+
+    async def _fetch(self, vehicle_id: str) -> Optional[dict]:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        async with self._semaphore:
+            started = time.perf_counter()
+            try:
+                response = await self._http().get(f"{self.base_url}/vehicles/{quote(vehicle_id, safe='')}")
+            except Exception as e:
+                with self._lock:
+                    self.counters["errors"] += 1
+                raise VehicleLookupError(f"Vehicle registry unreachable: {e}") from e
+            finally:
+                with self._lock:
+                    self.counters["requests"] += 1
+                    self.counters["request_seconds"] += time.perf_counter() - started
+        if response.status_code == 404:
+            with self._lock:
+                self.counters["not_found"] += 1
+            self._remember(vehicle_id, None)
+            return None
+        if response.status_code != 200:
+            with self._lock:
+                self.counters["errors"] += 1
+            raise VehicleLookupError(f"Vehicle registry answered {response.status_code} for {vehicle_id}")
+        try:
+            record = response.json()
+        except ValueError as e:
+            with self._lock:
+                self.counters["errors"] += 1
+            raise VehicleLookupError(f"Vehicle registry sent an invalid record for {vehicle_id}") from e
+        self._remember(vehicle_id, record)
+        return record
+
+    async def lookup_many(self, vehicle_ids: Iterable[str]) -> dict[str, object]:
+        """
+        Look up many vehicles concurrently, within the concurrency cap: each ID
+        maps to its record, None (unknown) or the VehicleLookupError it raised.
+        """
+        vehicle_ids = list(dict.fromkeys(vehicle_ids))
+        results = await asyncio.gather(*(self.lookup(vehicle_id) for vehicle_id in vehicle_ids), return_exceptions=True)
+        return dict(zip(vehicle_ids, results))
+
+    def prefetch(self, vehicle_id: str, claimed_model: Optional[str] = None) -> None:
+        """
+        Start looking a vehicle up in the background; callable from any thread.
+        A mismatch with `claimed_model` found once it completes is logged.
+        """
+        if self._loop is None or not self.enabled:
+            return
+        self._loop.call_soon_threadsafe(self._spawn, vehicle_id, claimed_model)
+
+    def _spawn(self, vehicle_id: str, claimed_model: Optional[str]) -> None:
+        async def run():
+            try:
+                record = await self.lookup(vehicle_id)
+            except VehicleLookupError as e:
+                log_event("vehicle_lookup_failed", level="warning", vehicle_id=vehicle_id, error=str(e))
+                return
+            if claimed_model and record is not None and not model_matches(claimed_model, record):
+                log_event(
+                    "vehicle_model_mismatch", level="warning", vehicle_id=vehicle_id,
+                    claimed_model=claimed_model, registry_model=registry_model(record),
+                )
+
+        task = self._loop.create_task(run())
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    def check(self, vehicle_id: str, claimed_model: Optional[str]) -> dict:
+        """
+        Verify a claimed model against the cached registry record. `status` is
+        `match`, `mismatch`, `not_registered`, `pending` (being looked up) or
+        `unavailable` (no registry token configured).
+        """
+        if not self.enabled:
+            return {"vehicle_id": vehicle_id, "status": "unavailable"}
+        found, record = self.cached(vehicle_id)
+        if not found:
+            self.prefetch(vehicle_id, claimed_model)
+            return {"vehicle_id": vehicle_id, "status": "pending"}
+        return self._verdict(vehicle_id, claimed_model, record)
+
+    async def verify(self, vehicle_id: str, claimed_model: Optional[str], timeout: float = VEHICLE_CHECK_TIMEOUT) -> dict:
+        """
+        Like `check`, but waits up to `timeout` seconds for the registry on a
+        miss. A lookup still running then goes on in the background and fills
+        the cache; the check reports `pending`. It reports `unavailable` when
+        the registry cannot be reached.
+        """
+        if not self.enabled:
+            return {"vehicle_id": vehicle_id, "status": "unavailable"}
+        try:
+            record = await asyncio.wait_for(self.lookup(vehicle_id), timeout)
+        except asyncio.TimeoutError:
+            return {"vehicle_id": vehicle_id, "status": "pending"}
+        except VehicleLookupError as e:
+            log_event("vehicle_lookup_failed", level="warning", vehicle_id=vehicle_id, error=str(e))
+            return {"vehicle_id": vehicle_id, "status": "unavailable"}
+        return self._verdict(vehicle_id, claimed_model, record)
+
+    @staticmethod
+    def _verdict(vehicle_id: str, claimed_model: Optional[str], record: Optional[dict]) -> dict:
+        if record is None:
+            return {"vehicle_id": vehicle_id, "status": "not_registered"}
+        matches = bool(claimed_model) and model_matches(claimed_model, record)
+        return {
+            "vehicle_id": vehicle_id,
+            "status": "match" if matches else "mismatch",
+            "registry_model": registry_model(record),
+        }
+
+    async def close(self) -> None:
+        for task in list(self._background):
+            task.cancel()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            requests = self.counters["requests"]
+            lookups = self.counters["lookups"]
+            hits = self.counters["hits"] + self.counters["negative_hits"]
+            return {
+                "enabled": self.enabled,
+                "cached": len(self._cache),
+                **{key: value for key, value in self.counters.items() if key != "request_seconds"},
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "avg_request_ms": self.counters["request_seconds"] / requests * 1000 if requests else 0.0,
+                "in_flight": len(self._inflight),
+            }
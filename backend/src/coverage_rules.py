@@ -0,0 +1,216 @@
+import time
+import threading
+from dataclasses import dataclass, field
+from typing import Optional
+from src.policy_index import chunk_document
+from src.text_utils import fold_accents, stem, tokenize
+
+COVERED_HEADING = "¿Qué se asegura?"
+EXCLUDED_HEADING = "¿Qué no está asegurado?"
+
+# Words that negate the trigger that follows them ("no hubo incendio")
+NEGATIONS = frozenset({"no", "sin", "ni", "nunca", "not", "never", "without"})
+NEGATION_WINDOW = 3
+
+# Trigger phrases for the items of cobertura.txt, keyed by a phrase of the item text.
+# A description that triggers both covered and excluded items is ambiguous and left to the LLM.
+RULE_SYNONYMS = {
+    "lunas": [
+        "luna", "parabrisas", "cristal", "vidrio", "luneta", "ventanilla",
+        "windshield", "windscreen", "glass", "window",
+    ],
+    "robo y hurto": [
+        "robo", "robado", "robaron", "hurto", "sustraido", "sustraccion",
+        "theft", "stolen", "robbed",
+    ],
+    "incendio del vehiculo": [
+        "incendio", "incendiado", "fuego", "quemado", "se quemo", "llamas", "ardio",
+        "fire", "burned", "burnt",
+    ],
+    "perdida total": [
+        "perdida total", "siniestro total", "destruido", "irreparable",
+        "total loss", "destroyed", "write off",
+    ],
+    "accidentes personales": [
+        "herido", "lesion", "lesionado", "fallecido", "fallecimiento", "invalidez",
+        "injured", "injury", "injuries",
+    ],
+    "los daños del conductor": [
+        "herido", "lesion", "lesionado", "injured", "injury", "injuries",
+    ],
+    "asesoramiento juridico": [
+        "abogado", "asesoramiento juridico", "lawyer", "legal advice",
+    ],
+    "pago de multas": [
+        # Bare "fine"/"ticket" are everyday English words ("the tractor is fine"): only whole phrases
+        "multa", "sancion", "traffic fine", "speeding fine", "parking fine", "speeding ticket", "parking ticket",
+    ],
+    "energia nuclear": [
+        "inundacion", "riada", "terremoto", "catastrofe natural", "guerra", "terrorismo",
+        "atentado", "explosion", "disturbios", "flood", "earthquake", "war", "terrorism", "riot",
+    ],
+    "embriaguez": [
+        "borracho", "ebrio", "alcohol", "drogas", "estupefacientes", "sin permiso", "sin carnet",
+        "drunk", "drugs", "without license",
+    ],
+    "cosas transportadas": [
+        # Bare "carga" is also the act of loading ("cargamos la carga y se rompió la ventana"):
+        # only phrases about damage to what is carried
+        "daños a la carga", "daños en la carga", "carga dañada", "carga se dañó", "carga transportada",
+        "mercancia transportada", "mercancia dañada", "cosas transportadas",
+        "cargo damage", "damaged cargo", "damage to the cargo",
+    ],
+}
+
+# Damage and incident words the rules cannot settle on their own: their presence
+# without a matching rule means the description needs the LLM
+UNRESOLVED_TERMS = [
+    "golpe", "choque", "chocar", "colision", "abolladura", "abollado", "rayon", "rayado", "arañazo",
+    "rasguño", "capo", "puerta", "rueda", "neumatico", "motor", "averia", "vuelco", "volcar", "accidente",
+    "scratch", "scratches", "dent", "collision", "crash", "bumper", "door", "tire", "engine",
+    "breakdown", "rollover", "accident",
+]
+
+
+@dataclass(frozen=True)
+class CoverageRule:
+    item: str
+    is_covered: bool
+    section: str
+
+
+@dataclass(frozen=True)
+class _RuleSet:
+    """
+    Rules and trigger indexes of one build; replaced whole when cobertura.txt is reloaded.
+    """
+    rules: tuple[CoverageRule, ...] = ()
+    triggers: dict[str, list[tuple[tuple[str, ...], int]]] = field(default_factory=dict)
+    unresolved: dict[str, list[tuple[str, ...]]] = field(default_factory=dict)
+
+
+def _phrase(text: str) -> tuple[str, ...]:
+    return tuple(tokenize(text, keep=NEGATIONS))
+
+
+class CoverageRuleEngine:
+    """
+    Deterministic fast path for /analyze_vehicle_condition, compiled from cobertura.txt.
+
+    Guarantees and exclusions are read from the document and matched against the
+    description through an accent-folded, stemmed trigger index. A local answer is
+    only returned when every damage mentioned maps unambiguously onto a rule;
+    otherwise the caller falls back to the LLM.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._rule_set = _RuleSet()
+        self._negations = frozenset(stem(word) for word in NEGATIONS)
+        self._lock = threading.Lock()
+        self.counters = {"local_hits": 0, "llm_fallbacks": 0, "local_seconds": 0.0}
+
+    def build(self) -> None:
+        with open(self.path, "r", encoding="utf-8") as file:
+            passages = chunk_document("cobertura.txt", file.read())
+
+        rules = []
+        triggers: dict[str, list[tuple[tuple[str, ...], int]]] = {}
+        for passage in passages:
+            if passage.heading not in (COVERED_HEADING, EXCLUDED_HEADING):
+                continue
+            item = passage.text.splitlines()[0].strip()
+            folded = fold_accents(item)
+            for key, synonyms in RULE_SYNONYMS.items():
+                if fold_accents(key) in folded:
+                    rules.append(CoverageRule(item, passage.heading == COVERED_HEADING, passage.subheading))
+                    for synonym in synonyms:
+                        phrase = _phrase(synonym)
+                        triggers.setdefault(phrase[0], []).append((phrase, len(rules) - 1))
+                    break
+
+        unresolved: dict[str, list[tuple[str, ...]]] = {}
+        for term in UNRESOLVED_TERMS:
+            phrase = _phrase(term)
+            unresolved.setdefault(phrase[0], []).append(phrase)
+
+        self._rule_set = _RuleSet(tuple(rules), triggers, unresolved)
+
+    @property
+    def rules(self) -> tuple[CoverageRule, ...]:
+        return self._rule_set.rules
+
+    @staticmethod
+    def _matches(tokens: list[str], start: int, phrase: tuple[str, ...]) -> bool:
+        return tuple(tokens[start:start + len(phrase)]) == phrase
+
+    def evaluate(self, description: str) -> Optional[dict]:
+        """
+        Return a `coverage_analysis` answer when the description can be settled
+        locally with confidence, or None when it needs the LLM.
+        """
+        started = time.perf_counter()
+        result = self._evaluate(description)
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            if result is None:
+                self.counters["llm_fallbacks"] += 1
+            else:
+                self.counters["local_hits"] += 1
+                self.counters["local_seconds"] += elapsed
+        return result
+
+    def _evaluate(self, description: str) -> Optional[dict]:
+        rule_set = self._rule_set
+        tokens = _phrase(description)
+        matched: dict[tuple[str, ...], set[int]] = {}
+        for start, token in enumerate(tokens):
+            for phrase in rule_set.unresolved.get(token, ()):
+                if self._matches(tokens, start, phrase):
+                    return None
+            for phrase, rule_index in rule_set.triggers.get(token, ()):
+                if not self._matches(tokens, start, phrase):
+                    continue
+                window = tokens[max(0, start - NEGATION_WINDOW):start]
+                if phrase[0] not in self._negations and self._negations.intersection(window):
+                    return None
+                matched.setdefault(phrase, set()).add(rule_index)
+
+        if not matched:
+            return None
+        # A guarantee and an exclusion together ("una explosión ... se rompió la luna") need
+        # the LLM to decide whether the exclusion applies to the damage
+        rule_indexes = sorted(set().union(*matched.values()))
+        if len({rule_set.rules[index].is_covered for index in rule_indexes}) > 1:
+            return None
+
+        analysis = []
+        for rule_index in rule_indexes:
+            rule = rule_set.rules[rule_index]
+            analysis.append({
+                "item": rule.item.rstrip("."),
+                "is_covered": rule.is_covered,
+                "explanation": self._explain(rule),
+            })
+        return {"coverage_analysis": analysis}
+
+    @staticmethod
+    def _explain(rule: CoverageRule) -> str:
+        if not rule.is_covered:
+            return "Figura entre las exclusiones de la póliza (¿Qué no está asegurado?)."
+        if "opcionales" in fold_accents(rule.section):
+            return "Garantía opcional de la póliza: está cubierto si la modalidad contratada la incluye."
+        return f"Garantía incluida en la póliza ({rule.section.rstrip(':')})."
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = self.counters["local_hits"]
+            fallbacks = self.counters["llm_fallbacks"]
+            total = hits + fallbacks
+            return {
+                "rules": len(self.rules),
+                "local_hits": hits,
+                "llm_fallbacks": fallbacks,
+                "hit_rate": hits / total if total else 0.0,
+                "avg_local_ms": self.counters["local_seconds"] / hits * 1000 if hits else 0.0,
+            }
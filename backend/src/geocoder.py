@@ -0,0 +1,130 @@
+import os
+import csv
+import math
+import time
+import array
+import threading
+from dataclasses import dataclass, field
+from typing import Iterable, Optional
+
+# Coordinates farther than this from every known municipality centroid stay unresolved
+GEOCODER_MAX_KM = float(os.environ.get("GEOCODER_MAX_KM", "25"))
+# Side of the grid cells the centroids are bucketed in
+GEOCODER_CELL_DEGREES = float(os.environ.get("GEOCODER_CELL_DEGREES", "0.25"))
+
+KM_PER_DEGREE = 111.195
+
+
+def distance_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """
+    Equirectangular distance, accurate to well under 1% at municipality scale.
+    """
+    x = (lon2 - lon1) * math.cos(math.radians((lat1 + lat2) / 2))
+    y = lat2 - lat1
+    return math.hypot(x, y) * KM_PER_DEGREE
+
+
+@dataclass(frozen=True)
+class _Centroids:
+    """
+    Centroid columns and grid of one build; replaced whole when the CSV is reloaded.
+    """
+    codes: tuple[str, ...] = ()
+    names: tuple[str, ...] = ()
+    lats: array.array = field(default_factory=lambda: array.array("d"))
+    lons: array.array = field(default_factory=lambda: array.array("d"))
+    grid: dict[tuple[int, int], list[int]] = field(default_factory=dict)
+
+
+class ReverseGeocoder:
+    """
+    Offline reverse geocoder from (lat, lon) to the INE code of the nearest
+    municipality centroid.
+
+    Centroids are read from a CSV with `codigo,municipio,lat,lon` columns (or
+    given to `index`, as for weather stations) and bucketed in a uniform grid; a lookup scans the rings of cells around the
+    point outwards and stops once no closer centroid can be in the next ring.
+    """
+
+    def __init__(self, path: Optional[str], max_km: float = GEOCODER_MAX_KM, cell_degrees: float = GEOCODER_CELL_DEGREES):
+        self.path = path
+        self.max_km = max_km
+        self.cell_degrees = cell_degrees
+        self._centroids = _Centroids()
+        self._lock = threading.Lock()
+        self.counters = {"lookups": 0, "resolved": 0, "seconds": 0.0}
+
+    def build(self) -> None:
+        with open(self.path, "r", encoding="utf-8", newline="") as file:
+            self.index(
+                (row["codigo"].zfill(5), row["municipio"], float(row["lat"]), float(row["lon"]))
+                for row in csv.DictReader(file)
+            )
+
+    def index(self, places: Iterable[tuple[str, str, float, float]]) -> None:
+        """
+        Replace the indexed points with (code, name, lat, lon) tuples.
+        """
+        codes, names = [], []
+        lats, lons = array.array("d"), array.array("d")
+        grid: dict[tuple[int, int], list[int]] = {}
+        for code, name, lat, lon in places:
+            grid.setdefault(self._cell(lat, lon), []).append(len(codes))
+            codes.append(code)
+            names.append(name)
+            lats.append(lat)
+            lons.append(lon)
+        self._centroids = _Centroids(tuple(codes), tuple(names), lats, lons, grid)
+
+    def __len__(self) -> int:
+        return len(self._centroids.codes)
+
+    def _cell(self, lat: float, lon: float) -> tuple[int, int]:
+        return math.floor(lat / self.cell_degrees), math.floor(lon / self.cell_degrees)
+
+    def _nearest(self, centroids: _Centroids, lat: float, lon: float) -> Optional[dict]:
+        row, column = self._cell(lat, lon)
+        # Narrowest side of a cell around this latitude, so the ring bound never overshoots
+        cell_km = self.cell_degrees * KM_PER_DEGREE * math.cos(math.radians(min(abs(lat) + self.cell_degrees, 89.0)))
+        best, best_km = None, math.inf
+        for ring in range(math.ceil(self.max_km / cell_km) + 2):
+            # Every centroid in this ring is at least (ring - 1) cells away
+            if (ring - 1) * cell_km > min(best_km, self.max_km):
+                break
+            for i in range(row - ring, row + ring + 1):
+                edge = i in (row - ring, row + ring)
+                for j in (range(column - ring, column + ring + 1) if edge else (column - ring, column + ring)):
+                    for index in centroids.grid.get((i, j), ()):
+                        km = distance_km(lat, lon, centroids.lats[index], centroids.lons[index])
+                        if km < best_km:
+                            best, best_km = index, km
+        if best is None or best_km > self.max_km:
+            return None
+        return {"code": centroids.codes[best], "name": centroids.names[best], "distance_km": round(best_km, 3)}
+
+    def lookup(self, lat: float, lon: float) -> Optional[dict]:
+        """
+        Nearest municipality as {code, name, distance_km}, or None when none is within GEOCODER_MAX_KM.
+        """
+        return self.lookup_many([(lat, lon)])[0]
+
+    def lookup_many(self, coordinates: Iterable[tuple[float, float]]) -> list[Optional[dict]]:
+        started = time.perf_counter()
+        centroids = self._centroids
+        matches = [self._nearest(centroids, lat, lon) for lat, lon in coordinates]
+        with self._lock:
+            self.counters["lookups"] += len(matches)
+            self.counters["resolved"] += sum(1 for match in matches if match is not None)
+            self.counters["seconds"] += time.perf_counter() - started
+        return matches
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.counters["lookups"]
+            return {
+                "municipalities": len(self._centroids.codes),
+                "grid_cells": len(self._centroids.grid),
+                "lookups": lookups,
+                "resolved": self.counters["resolved"],
+                "avg_lookup_us": self.counters["seconds"] / lookups * 1e6 if lookups else 0.0,
+            }
@@ -0,0 +1,147 @@
+import os
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+# Side of the thumbnails colour and contrast are measured on
+SAMPLE_SIDE = 64
+# Saturation and brightness (0-255) from which a pixel counts as coloured rather than white, grey or black
+SATURATION_MIN = 70
+BRIGHTNESS_MIN = 50
+# Share of coloured pixels in the centre of the photo needed to name a hue; below it the colour is white, grey or black
+CHROMATIC_MIN_SHARE = 0.15
+# Grayscale standard deviation below which the photo is too uniform (dark, blown out, a close-up) to read its colour
+IMAGE_MIN_CONTRAST = float(os.environ.get("IMAGE_MIN_CONTRAST", "6"))
+
+# Upper bound of each hue range, in degrees, and the colour name the LLM would give it
+HUE_NAMES = (
+    (15, "rojo"), (40, "naranja"), (70, "amarillo"), (170, "verde"),
+    (260, "azul"), (300, "morado"), (345, "rosa"), (360, "rojo"),
+)
+
+# EXIF tags
+EXIF_IFD = 0x8769
+GPS_IFD = 0x8825
+DATETIME = 0x0132
+DATETIME_ORIGINAL = 0x9003
+GPS_LATITUDE_REF, GPS_LATITUDE, GPS_LONGITUDE_REF, GPS_LONGITUDE = 1, 2, 3, 4
+
+
+@dataclass(frozen=True)
+class ImageFeatures:
+    """
+    What can be read from a photo without the LLM.
+    """
+    color: Optional[str]
+    # Capture date (YYYY-MM-DD) and position (lat, lon) from EXIF, when the camera recorded them
+    captured_on: Optional[str]
+    coordinates: Optional[tuple[float, float]]
+    has_content: bool
+
+
+def _hue_name(degrees: float) -> str:
+    for bound, name in HUE_NAMES:
+        if degrees < bound:
+            return name
+    return "rojo"
+
+
+def dominant_color(img) -> str:
+    """
+    Name of the dominant colour in the centre of the photo, where the vehicle
+    usually is, from a hue histogram of its clearly coloured pixels.
+    """
+    from PIL import Image, ImageChops, ImageStat
+
+    width, height = img.size
+    centre = img.crop((width // 5, height // 5, width - width // 5, height - height // 5))
+    sample = centre.convert("RGB").resize((SAMPLE_SIDE, SAMPLE_SIDE), Image.Resampling.BILINEAR).convert("HSV")
+    hue, saturation, value = sample.split()
+    # Histogram of the hue of pixels both saturated and bright enough, computed in C
+    mask = ImageChops.multiply(
+        saturation.point(lambda x: 255 if x >= SATURATION_MIN else 0),
+        value.point(lambda x: 255 if x >= BRIGHTNESS_MIN else 0),
+    )
+    histogram = hue.histogram(mask)
+    if sum(histogram) >= CHROMATIC_MIN_SHARE * SAMPLE_SIDE * SAMPLE_SIDE:
+        totals: dict[str, int] = {}
+        for level, count in enumerate(histogram):
+            if count:
+                name = _hue_name(level * 360 / 256)
+                totals[name] = totals.get(name, 0) + count
+        return max(totals, key=totals.get)
+
+    brightness = ImageStat.Stat(value).mean[0]
+    if brightness >= 180:
+        return "blanco"
+    return "negro" if brightness < 60 else "gris"
+
+
+def has_content(img) -> bool:
+    """
+    Whether the photo has enough contrast for its dominant colour to be the
+    vehicle's. A near-uniform frame may still be a dark, overexposed or
+    close-up photo of a tractor, so this never decides `hay_tractor`.
+    """
+    from PIL import Image, ImageStat
+
+    sample = img.convert("L").resize((SAMPLE_SIDE, SAMPLE_SIDE), Image.Resampling.BILINEAR)
+    return ImageStat.Stat(sample).stddev[0] >= IMAGE_MIN_CONTRAST
+
+
+def capture_date(exif) -> Optional[str]:
+    raw = exif.get_ifd(EXIF_IFD).get(DATETIME_ORIGINAL) or exif.get(DATETIME)
+    if not isinstance(raw, str):
+        return None
+    try:
+        return datetime.strptime(raw.strip("\x00 "), "%Y:%m:%d %H:%M:%S").date().isoformat()
+    except ValueError:
+        return None
+
+
+def _degrees(value, ref) -> float:
+    degrees, minutes, seconds = (float(part) for part in value)
+    decimal = degrees + minutes / 60 + seconds / 3600
+    return -decimal if ref in ("S", "W") else decimal
+
+
+def capture_coordinates(exif) -> Optional[tuple[float, float]]:
+    gps = exif.get_ifd(GPS_IFD)
+    try:
+        lat = _degrees(gps[GPS_LATITUDE], gps.get(GPS_LATITUDE_REF))
+        lon = _degrees(gps[GPS_LONGITUDE], gps.get(GPS_LONGITUDE_REF))
+    except (KeyError, TypeError, ValueError, ZeroDivisionError):
+        return None
+    # Some phones write zeros when they had no fix
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180) or (lat == 0 and lon == 0):
+        return None
+    return round(lat, 6), round(lon, 6)
+
+
+def extract_features(img, exif) -> ImageFeatures:
+    """
+    Local features of a decoded photo; `exif` is its EXIF data, read before any transpose.
+    """
+    return ImageFeatures(
+        color=dominant_color(img),
+        captured_on=capture_date(exif),
+        coordinates=capture_coordinates(exif),
+        has_content=has_content(img),
+    )
+
+
+def prefill_insurance_data(features: ImageFeatures) -> dict:
+    """
+    The InsuranceCreationData fields known from the photo's features, plus its
+    EXIF capture date (`fecha_captura`) when there is one.
+
+    The colour is prefilled only when the photo has enough contrast, and the
+    coordinates only when the photo is geotagged; whether there is a tractor,
+    the description and the other fields are always left to the LLM.
+    """
+    data: dict = {"color": features.color} if features.has_content else {}
+    if features.captured_on:
+        data["fecha_captura"] = features.captured_on
+    if features.coordinates:
+        data["coordinates"] = features.coordinates
+    return data
@@ -0,0 +1,253 @@
+import os
+import json
+import time
+import array
+import sqlite3
+import threading
+from dataclasses import dataclass
+from functools import lru_cache
+from itertools import combinations
+from typing import Optional
+
+# Photos whose difference hashes differ in at most this many of their 64 bits are treated as the same photo
+IMAGE_DEDUP_RADIUS = int(os.environ.get("IMAGE_DEDUP_RADIUS", "6"))
+
+HASH_BITS = 64
+# The hash is split into this many chunks, each with its own table
+CHUNKS = 4
+CHUNK_BITS = HASH_BITS // CHUNKS
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS image_hashes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    hash INTEGER NOT NULL,
+    claim_id TEXT,
+    file_name TEXT,
+    analysis TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+"""
+
+
+def _to_signed(value: int) -> int:
+    # SQLite integers are signed 64-bit
+    return value - (1 << HASH_BITS) if value >= 1 << (HASH_BITS - 1) else value
+
+
+def _to_unsigned(value: int) -> int:
+    return value + (1 << HASH_BITS) if value < 0 else value
+
+
+@lru_cache(maxsize=None)
+def _lane_masks(lanes: int) -> tuple[int, int, int, int, int]:
+    ones = ((1 << (HASH_BITS * lanes)) - 1) // ((1 << HASH_BITS) - 1)
+    return ones, 0x5555555555555555 * ones, 0x3333333333333333 * ones, 0x0F0F0F0F0F0F0F0F * ones, 0xFF * ones
+
+
+def hamming_distances(packed: int, lanes: int, value: int) -> bytes:
+    """
+    Hamming distance from `value` to each of the `lanes` 64-bit hashes packed in
+    `packed`, lowest lane first.
+
+    A SWAR popcount over the whole big integer: a handful of C-level big-int
+    operations per bucket instead of one Python-level popcount per hash.
+    """
+    ones, m1, m2, m4, low = _lane_masks(lanes)
+    x = packed ^ (value * ones)
+    x -= (x >> 1) & m1
+    x = (x & m2) + ((x >> 2) & m2)
+    x = (x + (x >> 4)) & m4
+    # Sum each lane's bytes into its lowest byte; what leaks in from the next lane stays in the upper bytes
+    x += x >> 8
+    x += x >> 16
+    x += x >> 32
+    return (x & low).to_bytes(8 * lanes, "little")[::8]
+
+
+def _index_rows(rows: list[tuple[int, int]], ids: array.array, tables: list[dict[int, list]]) -> None:
+    """
+    Append (row ID, hash) rows to the index: each table maps a chunk value to
+    its bucket, the bucket's hashes packed into one integer (first hash in the
+    lowest bits) and their positions in `ids`.
+    """
+    for row_id, value in rows:
+        value = _to_unsigned(value)
+        position = len(ids)
+        ids.append(row_id)
+        for chunk, table in enumerate(tables):
+            key = (value >> (chunk * CHUNK_BITS)) & CHUNK_MASK
+            bucket = table.get(key)
+            if bucket is None:
+                table[key] = [value, array.array("I", (position,))]
+            else:
+                bucket[0] |= value << (HASH_BITS * len(bucket[1]))
+                bucket[1].append(position)
+
+
+@dataclass(frozen=True)
+class ImageMatch:
+    id: int
+    distance: int
+    claim_id: Optional[str]
+    file_name: Optional[str]
+    created_at: float
+    analysis: dict
+
+    def report(self, claim_id: Optional[str]) -> dict:
+        """
+        What the response says about the earlier photo; `cross_claim` flags reuse in a different claim.
+        """
+        return {
+            "distance": self.distance,
+            "claim_id": self.claim_id,
+            "file_name": self.file_name,
+            "first_seen": self.created_at,
+            "cross_claim": claim_id is not None and self.claim_id is not None and claim_id != self.claim_id,
+        }
+
+
+class ImageHashIndex:
+    """
+    Perceptual hashes of every analyzed claim photo and their damage analyses,
+    for reusing an analysis when the same photo (re-sent, re-compressed, slightly
+    re-cropped) comes in again, and for spotting photos reused across claims.
+
+    Hamming-radius queries use multi-index hashing: the 64-bit hash is split
+    into CHUNKS chunks, each indexed in its own table. Two hashes within
+    `radius` bits agree to within radius // CHUNKS bits on at least one chunk,
+    so a query probes only those chunk neighbourhoods and popcounts the few
+    candidates found. The cost grows with bucket size, not with the number of
+    hashes, so lookups stay under a millisecond at millions of photos.
+
+    Hashes and analyses are kept in SQLite, shared by every uvicorn worker; each
+    worker keeps the hashes in memory and picks up the other workers' new rows
+    before each lookup. Analyses are read from disk only on a match.
+    """
+
+    def __init__(self, db_path: str, radius: int = IMAGE_DEDUP_RADIUS):
+        self.db_path = db_path
+        self.radius = radius
+        self._ids = array.array("q")
+        self._tables: list[dict[int, list]] = [{} for _ in range(CHUNKS)]
+        self._masks = [
+            sum(1 << bit for bit in bits)
+            for flips in range(radius // CHUNKS + 1)
+            for bits in combinations(range(CHUNK_BITS), flips)
+        ]
+        self._last_id = 0
+        self._loaded = False
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.counters = {"lookups": 0, "matches": 0, "cross_claim_matches": 0, "lookup_seconds": 0.0}
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def load(self) -> None:
+        """
+        Read the stored hashes into memory. The index is built aside and swapped
+        in whole, so lookups keep running meanwhile (without deduplication
+        until it is done); rows added since are then picked up incrementally.
+        """
+        rows = self._connect().execute("SELECT id, hash FROM image_hashes ORDER BY id").fetchall()
+        ids = array.array("q")
+        tables: list[dict[int, list]] = [{} for _ in range(CHUNKS)]
+        _index_rows(rows, ids, tables)
+        with self._lock:
+            self._ids, self._tables = ids, tables
+            self._last_id = ids[-1] if ids else 0
+            self._catch_up()
+            self._loaded = True
+
+    def _catch_up(self) -> None:
+        """
+        Index the rows stored since the last call, by this worker or any other.
+        """
+        rows = self._connect().execute(
+            "SELECT id, hash FROM image_hashes WHERE id > ? ORDER BY id", (self._last_id,)
+        ).fetchall()
+        if rows:
+            _index_rows(rows, self._ids, self._tables)
+            self._last_id = rows[-1][0]
+
+    def _nearest(self, value: int) -> Optional[tuple[int, int]]:
+        best, best_distance = None, self.radius
+        for chunk, table in enumerate(self._tables):
+            key = (value >> (chunk * CHUNK_BITS)) & CHUNK_MASK
+            for mask in self._masks:
+                bucket = table.get(key ^ mask)
+                if bucket is None:
+                    continue
+                packed, positions = bucket
+                distances = hamming_distances(packed, len(positions), value)
+                distance = min(distances)
+                if distance > best_distance:
+                    continue
+                # Positions ascend within a bucket, and the earliest photo wins a tie: it is the original
+                position = positions[distances.index(distance)]
+                if best is None or distance < best_distance or (distance == best_distance and position < best):
+                    best, best_distance = position, distance
+        if best is None:
+            return None
+        return self._ids[best], best_distance
+
+    def lookup(self, value: int, claim_id: Optional[str] = None) -> Optional[ImageMatch]:
+        """
+        The stored photo closest to `value` within the radius, with its analysis, or None.
+        """
+        started = time.perf_counter()
+        with self._lock:
+            if self._loaded:
+                self._catch_up()
+            nearest = self._nearest(value)
+        match = None
+        if nearest is not None:
+            row_id, distance = nearest
+            row = self._connect().execute(
+                "SELECT claim_id, file_name, created_at, analysis FROM image_hashes WHERE id = ?", (row_id,)
+            ).fetchone()
+            match = ImageMatch(row_id, distance, row[0], row[1], row[2], json.loads(row[3]))
+        with self._lock:
+            self.counters["lookups"] += 1
+            self.counters["lookup_seconds"] += time.perf_counter() - started
+            if match is not None:
+                self.counters["matches"] += 1
+                self.counters["cross_claim_matches"] += 1 if match.report(claim_id)["cross_claim"] else 0
+        return match
+
+    def add(self, value: int, analysis: dict, claim_id: Optional[str] = None, file_name: Optional[str] = None) -> int:
+        """
+        Store the analysis of a new photo; returns its row ID.
+        """
+        with self._lock:
+            cursor = self._connect().execute(
+                "INSERT INTO image_hashes (hash, claim_id, file_name, analysis, created_at) VALUES (?, ?, ?, ?, ?)",
+                (_to_signed(value), claim_id, file_name, json.dumps(analysis, ensure_ascii=False), time.time()),
+            )
+            # Rows written by other workers in between are indexed first, in ID order
+            if self._loaded:
+                self._catch_up()
+            return cursor.lastrowid
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.counters["lookups"]
+            return {
+                "hashes": len(self._ids),
+                "loaded": self._loaded,
+                "radius": self.radius,
+                "lookups": lookups,
+                "matches": self.counters["matches"],
+                "cross_claim_matches": self.counters["cross_claim_matches"],
+                "match_rate": self.counters["matches"] / lookups if lookups else 0.0,
+                "avg_lookup_us": self.counters["lookup_seconds"] / lookups * 1e6 if lookups else 0.0,
+            }
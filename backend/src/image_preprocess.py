@@ -0,0 +1,104 @@
+import io
+import os
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Optional
+from fastapi import UploadFile
+from src.image_features import ImageFeatures, extract_features
+from src.telemetry import log_event, span
+
+# Longest side, in pixels, of the image sent to Gemini
+IMAGE_MAX_SIDE = int(os.environ.get("IMAGE_MAX_SIDE", "1600"))
+# Output encoding: JPEG or WEBP
+IMAGE_FORMAT = os.environ.get("IMAGE_FORMAT", "JPEG").upper()
+IMAGE_QUALITY = int(os.environ.get("IMAGE_QUALITY", "85"))
+IMAGE_WORKERS = int(os.environ.get("IMAGE_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp"}
+# Grayscale thumbnail the difference hash compares, one bit per horizontally adjacent pair: 8x8 = 64 bits
+HASH_SIZE = 8
+
+_executor = ThreadPoolExecutor(max_workers=IMAGE_WORKERS, thread_name_prefix="image-preprocess")
+
+
+class ImageDecodeError(ValueError):
+    """
+    The upload is not an image that can be decoded: a client error, not a server one.
+    """
+
+
+@dataclass(frozen=True)
+class PreparedImage:
+    data: bytes
+    mime_type: str
+    width: int
+    height: int
+    # 64-bit perceptual difference hash of the photo, for near-duplicate detection
+    dhash: Optional[int] = None
+    # Colour, EXIF capture date and GPS, and contrast check, when requested
+    features: Optional[ImageFeatures] = None
+
+
+def difference_hash(img) -> int:
+    """
+    64-bit dHash: each bit tells whether a pixel of a 9x8 grayscale thumbnail is
+    brighter than its right neighbour. Re-encoding, rescaling and small crops or
+    colour changes flip few bits, so near-duplicates are close in Hamming distance.
+    """
+    from PIL import Image
+
+    small = img.convert("L").resize((HASH_SIZE + 1, HASH_SIZE), Image.Resampling.BILINEAR)
+    pixels = small.tobytes()
+    value = 0
+    for row in range(HASH_SIZE):
+        offset = row * (HASH_SIZE + 1)
+        for column in range(HASH_SIZE):
+            value = (value << 1) | (pixels[offset + column] > pixels[offset + column + 1])
+    return value
+
+
+def prepare_image(raw: bytes, features: bool = False) -> PreparedImage:
+    """
+    Decode an uploaded image in memory, apply its EXIF orientation, downscale it
+    to IMAGE_MAX_SIDE and re-encode it compactly as IMAGE_FORMAT; with `features`
+    also extract its local features from the decoded image.
+    """
+    # Imported on first use, so workers that never see an image don't load PIL
+    from PIL import Image, ImageOps
+
+    try:
+        with Image.open(io.BytesIO(raw)) as img:
+            # Let the JPEG decoder skip detail we are going to throw away anyway
+            img.draft("RGB", (IMAGE_MAX_SIDE, IMAGE_MAX_SIDE))
+            exif = img.getexif()
+            img = ImageOps.exif_transpose(img)
+            img.thumbnail((IMAGE_MAX_SIDE, IMAGE_MAX_SIDE), Image.Resampling.LANCZOS)
+            if img.mode not in ("RGB", "L"):
+                img = img.convert("RGB")
+
+            buffer = io.BytesIO()
+            img.save(buffer, format=IMAGE_FORMAT, quality=IMAGE_QUALITY)
+            return PreparedImage(
+                data=buffer.getvalue(),
+                mime_type=MIME_TYPES[IMAGE_FORMAT],
+                width=img.width,
+                height=img.height,
+                dhash=difference_hash(img),
+                features=extract_features(img, exif) if features else None,
+            )
+    except Exception as e:
+        log_event("image_convert_failed", level="warning", error=str(e))
+        raise ImageDecodeError("No se pudo convertir la imagen a un formato compatible.") from e
+
+
+async def preprocess_upload(file: UploadFile, features: bool = False) -> PreparedImage:
+    """
+    Read an upload and prepare it for Gemini on the preprocessing thread pool,
+    so the PIL work never blocks the event loop.
+    """
+    with span("upload_read"):
+        raw = await file.read()
+    loop = asyncio.get_running_loop()
+    with span("image_convert"):
+        return await loop.run_in_executor(_executor, prepare_image, raw, features)
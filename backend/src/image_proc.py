@@ -1,166 +1,210 @@
-import os
-import json
-import base64
-from google import genai
-from google.genai import types
-from PIL import Image
+from typing import TYPE_CHECKING, AsyncIterator, Optional
+from pydantic import BaseModel
+from src.image_preprocess import PreparedImage
+from src.llm_client import generate_structured, stream_response
+from src.model_router import RouteFeatures, model_router
+from src.schemas import DamageAssessment, InsuranceCreationData, partial_schema
+from src.telemetry import log_event, span
 
-def process_image_with_gemini(image_path: str) -> dict:
+if TYPE_CHECKING:
+    from google.genai import types
+
+# Bump whenever a prompt template changes so cached answers are not reused
+PROMPT_VERSION = "2"
+
+def build_damage_request(image: PreparedImage, model: str) -> tuple[str, list, "types.GenerateContentConfig"]:
+    """
+    Construye el modelo, el contenido y la configuración de la llamada de análisis de daños de una imagen.
+    """
+    # Importado aquí para que el SDK solo se cargue cuando una petición lo necesita
+    from google.genai import types
+
+    # Preparar entrada para Gemini
+    input_text = """
+    Analiza la imagen proporcionada para identificar el modelo del tractor, determinar el problema del seguro y explicar lo ocurrido.
+    Proporciona los siguientes detalles en formato JSON:
+    - `modelo_tractor` (string): El modelo identificado del tractor.
+    - `evaluacion_daños` (objeto): Un desglose detallado de los daños observados en la imagen.
+        - `daños_vehiculo` (array de strings): Lista de daños al tractor.
+        - `daños_terceros` (array de strings): Lista de daños a propiedades o personas de terceros.
+    - `analisis_incidente` (string): Una explicación detallada de lo ocurrido basada en la imagen.
+    - `recomendaciones_seguro` (array de strings): Recomendaciones para coberturas o reclamaciones de seguro basadas en el análisis.
+    """
+    contents = [
+        types.Content(
+            role="user",
+            parts=[
+                types.Part.from_text(text=input_text),
+                types.Part.from_bytes(data=image.data, mime_type=image.mime_type),
+            ],
+        ),
+    ]
+    generate_content_config = types.GenerateContentConfig(
+        response_mime_type="application/json",
+        response_schema=DamageAssessment,
+    )
+    return model, contents, generate_content_config
+
+async def process_image_with_gemini(image: PreparedImage, endpoint: str = "process_image") -> dict:
     """
     Procesa una imagen usando Gemini para identificar el modelo del tractor, analizar el problema del seguro y determinar lo ocurrido.
     """
     try:
-        api_key = os.environ.get("GEMINI_API_KEY")
-        if not api_key:
-            raise ValueError("La variable de entorno GEMINI_API_KEY no está configurada.")
-        
-        client = genai.Client(api_key=api_key)
-        model = "gemini-2.0-flash"
-        
-        # Abrir y convertir la imagen para asegurar compatibilidad
-        try:
-            with Image.open(image_path) as img:
-                converted_image_path = "/tmp/converted_image.png"
-                img.save(converted_image_path, format="PNG")
-                print(f"Imagen convertida y guardada en {converted_image_path}")
-        except Exception as e:
-            print(f"Error al convertir la imagen: {e}")
-            raise ValueError("No se pudo convertir la imagen a un formato compatible.")
-        
-        # Leer y cargar la imagen convertida
-        try:
-            with open(converted_image_path, "rb") as image_file:
-                image_data = image_file.read()
-                print(f"Imagen cargada exitosamente, tamaño: {len(image_data)} bytes")
-        except Exception as e:
-            print(f"Error al leer la imagen: {e}")
-            raise ValueError("No se pudo leer la imagen.")
-        
+        async def ask(model: str) -> dict:
+            with span("prompt_build"):
+                model, contents, generate_content_config = build_damage_request(image, model)
+            return await generate_structured(
+                model, contents, generate_content_config, DamageAssessment, cache_version=PROMPT_VERSION
+            )
+
+        # El router elige el modelo y repite con pro si la respuesta no es válida
+        return await model_router.run(RouteFeatures(endpoint, images=1), ask)
+    except Exception as e:
+        # Registrar el error para depuración
+        log_event("gemini_failed", level="error", function="process_image_with_gemini", error=str(e))
+        raise
+
+def stream_image_with_gemini(image: PreparedImage) -> AsyncIterator[str]:
+    """
+    Transmite el texto JSON del análisis de daños a medida que Gemini lo genera.
+    """
+    model = model_router.choose(RouteFeatures("process_image", images=1))
+    with span("prompt_build"):
+        model, contents, generate_content_config = build_damage_request(image, model)
+    return stream_response(model, contents, generate_content_config, cache_version=PROMPT_VERSION)
+
+async def process_images_with_gemini(images: list[PreparedImage]) -> dict:
+    """
+    Analiza todas las fotos de un siniestro en una única petición multimodal y devuelve un análisis consolidado.
+    """
+    from google.genai import types
+
+    try:
         # Preparar entrada para Gemini
-        input_text = """
-        Analiza la imagen proporcionada para identificar el modelo del tractor, determinar el problema del seguro y explicar lo ocurrido.
+        input_text = f"""
+        Las {len(images)} imágenes proporcionadas pertenecen al mismo siniestro. Analízalas en conjunto para identificar el modelo del tractor, determinar el problema del seguro y explicar lo ocurrido.
         Proporciona los siguientes detalles en formato JSON:
         - `modelo_tractor` (string): El modelo identificado del tractor.
-        - `evaluacion_daños` (objeto): Un desglose detallado de los daños observados en la imagen.
+        - `evaluacion_daños` (objeto): Un desglose detallado de los daños observados en todas las imágenes, sin repetir daños.
             - `daños_vehiculo` (array de strings): Lista de daños al tractor.
             - `daños_terceros` (array de strings): Lista de daños a propiedades o personas de terceros.
-        - `analisis_incidente` (string): Una explicación detallada de lo ocurrido basada en la imagen.
+        - `analisis_incidente` (string): Una explicación detallada de lo ocurrido basada en las imágenes.
         - `recomendaciones_seguro` (array de strings): Recomendaciones para coberturas o reclamaciones de seguro basadas en el análisis.
         """
-        try:
-            contents = [
-                types.Content(
-                    role="user",
-                    parts=[
-                        types.Part.from_text(text=input_text),
-                        types.Part.from_bytes(data=image_data, mime_type="image/png"),
-                    ],
-                ),
-            ]
-        except Exception as e:
-            print(f"Error al crear las partes del contenido: {e}")
-            raise
+        with span("prompt_build"):
+            parts = [types.Part.from_text(text=input_text)]
+            parts.extend(types.Part.from_bytes(data=image.data, mime_type=image.mime_type) for image in images)
+            contents = [types.Content(role="user", parts=parts)]
         
         generate_content_config = types.GenerateContentConfig(
             response_mime_type="application/json",
+            response_schema=DamageAssessment,
         )
         
-        # Generar respuesta
-        response_text = ""
-        for chunk in client.models.generate_content_stream(
-            model=model,
-            contents=contents,
-            config=generate_content_config,
-        ):
-            if chunk.text:  # Asegurarse de que chunk.text no sea None
-                response_text += chunk.text
-        
-        # Analizar y devolver la respuesta JSON
-        try:
-            return json.loads(response_text)
-        except json.JSONDecodeError as e:
-            raise ValueError(f"No se pudo analizar la respuesta JSON: {response_text}") from e
+        async def ask(model: str) -> dict:
+            return await generate_structured(
+                model, contents, generate_content_config, DamageAssessment, cache_version=PROMPT_VERSION
+            )
+
+        # Generar respuesta; muchas fotos se envían directamente al modelo pro
+        return await model_router.run(RouteFeatures("process_images", images=len(images)), ask)
     except Exception as e:
         # Registrar el error para depuración
-        print(f"Error en process_image_with_gemini: {e}")
+        log_event("gemini_failed", level="error", function="process_images_with_gemini", error=str(e))
         raise
 
-def process_image_for_insurance_creation(image_path: str) -> dict:
+def merge_damage_assessments(analyses: list[dict]) -> dict:
+    """
+    Fusiona `daños_vehiculo` y `daños_terceros` de varios análisis, eliminando duplicados entre fotos.
+    """
+    merged = {"daños_vehiculo": [], "daños_terceros": []}
+    for field, damages in merged.items():
+        seen = set()
+        for analysis in analyses:
+            for damage in (analysis.get("evaluacion_daños") or {}).get(field) or []:
+                # Comparar sin distinguir mayúsculas ni espacios repetidos
+                normalized = " ".join(str(damage).split()).casefold()
+                if normalized and normalized not in seen:
+                    seen.add(normalized)
+                    damages.append(damage)
+    return merged
+
+# Prompt line of each InsuranceCreationData field; only the fields not filled locally are asked for
+INSURANCE_FIELD_PROMPTS = {
+    "modelo_tractor": "- `modelo_tractor` (string): La marca y el modelo identificado del tractor.",
+    "condicion": "- `condicion` (string): Una descripción del estado físico del tractor.",
+    "color": "- `color` (string): El color del tractor.",
+    "año": "- `año` (integer): El año de fabricación del tractor.",
+    "descripcion_adicional": "- `descripcion_adicional` (string): Cualquier información adicional relevante observada en la imagen.",
+    "hay_tractor": "- `hay_tractor` (boolean): Indica si el tractor está presente en la imagen.",
+}
+
+def insurance_fields_to_ask(prefilled: dict) -> list[str]:
+    """
+    InsuranceCreationData fields that still need the LLM after the local prefill.
+    """
+    return [field for field in InsuranceCreationData.model_fields if field not in prefilled]
+
+def build_insurance_request(
+    image: PreparedImage, model: str, fields: list[str],
+) -> tuple[str, list, "types.GenerateContentConfig", type[BaseModel]]:
+    """
+    Build the model, contents, config and response schema of the call that reads `fields` from a photo.
+    """
+    from google.genai import types
+
+    # Prepare input for Gemini
+    input_text = "\n".join([
+        "Analiza la imagen proporcionada para extraer datos relevantes para la creación de un seguro.",
+        "Proporciona los siguientes detalles en formato JSON:",
+        *(INSURANCE_FIELD_PROMPTS[field] for field in fields),
+    ])
+    contents = [
+        types.Content(
+            role="user",
+            parts=[
+                types.Part.from_text(text=input_text),
+                types.Part.from_bytes(data=image.data, mime_type=image.mime_type),
+            ],
+        ),
+    ]
+    schema = InsuranceCreationData if len(fields) == len(INSURANCE_FIELD_PROMPTS) else partial_schema(InsuranceCreationData, fields)
+    generate_content_config = types.GenerateContentConfig(
+        response_mime_type="application/json",
+        response_schema=schema,
+    )
+    return model, contents, generate_content_config, schema
+
+async def process_image_for_insurance_creation(image: PreparedImage, prefilled: Optional[dict] = None) -> dict:
     """
     Process an image to extract data for insurance creation, including tractor model, condition, color, year, etc.
+
+    Fields already in `prefilled` (read locally from the photo) are not asked for
+    and are returned as they are.
     """
+    prefilled = prefilled or {}
+    fields = insurance_fields_to_ask(prefilled)
     try:
-        api_key = os.environ.get("GEMINI_API_KEY")
-        if not api_key:
-            raise ValueError("La variable de entorno GEMINI_API_KEY no está configurada.")
-        
-        client = genai.Client(api_key=api_key)
-        model = "gemini-2.0-flash"
-        
-        # Open and convert the image to ensure compatibility
-        try:
-            with Image.open(image_path) as img:
-                converted_image_path = "/tmp/converted_image.png"
-                img.save(converted_image_path, format="PNG")
-                print(f"Imagen convertida y guardada en {converted_image_path}")
-        except Exception as e:
-            print(f"Error al convertir la imagen: {e}")
-            raise ValueError("No se pudo convertir la imagen a un formato compatible.")
-        
-        # Read and load the converted image
-        try:
-            with open(converted_image_path, "rb") as image_file:
-                image_data = image_file.read()
-                print(f"Imagen cargada exitosamente, tamaño: {len(image_data)} bytes")
-        except Exception as e:
-            print(f"Error al leer la imagen: {e}")
-            raise ValueError("No se pudo leer la imagen.")
-        
-        # Prepare input for Gemini
-        input_text = """
-        Analiza la imagen proporcionada para extraer datos relevantes para la creación de un seguro.
-        Proporciona los siguientes detalles en formato JSON:
-        - `modelo_tractor` (string): La marca y el modelo identificado del tractor.
-        - `condicion` (string): Una descripción del estado físico del tractor.
-        - `color` (string): El color del tractor.
-        - `año` (integer): El año de fabricación del tractor.
-        - `descripcion_adicional` (string): Cualquier información adicional relevante observada en la imagen.
-        - `hay_tractor` (boolean): Indica si el tractor está presente en la imagen.
-        """
-        try:
-            contents = [
-                types.Content(
-                    role="user",
-                    parts=[
-                        types.Part.from_text(text=input_text),
-                        types.Part.from_bytes(data=image_data, mime_type="image/png"),
-                    ],
-                ),
-            ]
-        except Exception as e:
-            print(f"Error al crear las partes del contenido: {e}")
-            raise
-        
-        generate_content_config = types.GenerateContentConfig(
-            response_mime_type="application/json",
-        )
-        
-        # Generate response
-        response_text = ""
-        for chunk in client.models.generate_content_stream(
-            model=model,
-            contents=contents,
-            config=generate_content_config,
-        ):
-            if chunk.text:  # Ensure chunk.text is not None
-                response_text += chunk.text
-        
-        # Parse and return the JSON response
-        try:
-            return json.loads(response_text)
-        except json.JSONDecodeError as e:
-            raise ValueError(f"No se pudo analizar la respuesta JSON: {response_text}") from e
+        async def ask(model: str) -> dict:
+            with span("prompt_build"):
+                model, contents, generate_content_config, schema = build_insurance_request(image, model, fields)
+            return await generate_structured(
+                model, contents, generate_content_config, schema, cache_version=PROMPT_VERSION
+            )
+
+        # Generate response, escalating to the pro model if it does not validate
+        response = await model_router.run(RouteFeatures("process_image_for_insurance", images=1), ask)
+        return {**prefilled, **response}
     except Exception as e:
         # Log the error for debugging
-        print(f"Error en process_image_for_insurance_creation: {e}")
+        log_event("gemini_failed", level="error", function="process_image_for_insurance_creation", error=str(e))
         raise
+
+def stream_image_for_insurance(image: PreparedImage, fields: list[str]) -> AsyncIterator[str]:
+    """
+    Stream the JSON text of the insurance fields `fields` as Gemini generates it.
+    """
+    model = model_router.choose(RouteFeatures("process_image_for_insurance", images=1))
+    with span("prompt_build"):
+        model, contents, generate_content_config, _ = build_insurance_request(image, model, fields)
+    return stream_response(model, contents, generate_content_config, cache_version=PROMPT_VERSION)
@@ -0,0 +1,259 @@
+import io
+import os
+import csv
+import json
+import mmap
+import array
+import struct
+import hashlib
+import threading
+from typing import Optional
+
+# Metadata lines (title, indicator, family...) plus the two column header lines
+HEADER_LINES = 6
+ENCODING = "latin-1"
+# Bumped whenever parsing changes, so caches of the same CSV parsed the old way are not reused
+CACHE_MAGIC = b"INE2"
+# magic, SHA-256 of the CSV, row count, length of the names JSON
+CACHE_HEADER = struct.Struct("<4s32sQQ")
+
+PROVINCES = {
+    "05": "Ávila",
+    "09": "Burgos",
+    "24": "León",
+    "34": "Palencia",
+    "37": "Salamanca",
+    "40": "Segovia",
+    "42": "Soria",
+    "47": "Valladolid",
+    "49": "Zamora",
+}
+
+
+def _padded(length: int) -> int:
+    return (length + 7) & ~7
+
+
+def parse_csv(raw: bytes) -> tuple[array.array, array.array, array.array, dict[int, str]]:
+    """
+    Parse an INE "Datos Básicos" export into year, municipality code and value
+    columns, plus the municipality names by code.
+
+    The year is only written on the first row of each year block, so it is
+    carried forward. TOTAL rows are skipped since totals are recomputed, and so
+    is the block of all-years totals per municipality that ends the file.
+    """
+    years = array.array("H")
+    codes = array.array("I")
+    values = array.array("q")
+    names: dict[int, str] = {}
+    reader = csv.reader(io.StringIO(raw.decode(ENCODING)))
+    for _ in range(HEADER_LINES):
+        next(reader, None)
+
+    year: Optional[int] = None
+    for row in reader:
+        if len(row) < 3:
+            continue
+        first = row[0].strip()
+        if first:
+            # A FECHA of "TOTAL" starts the all-years block: its rows are cumulative, not one year's
+            year = int(first) if first.isdigit() else None
+        if year is None:
+            continue
+        municipality = row[1].strip()
+        code = municipality[:5]
+        if not code.isdigit():
+            continue
+        years.append(year)
+        codes.append(int(code))
+        values.append(int(row[2]))
+        names.setdefault(int(code), municipality[6:].strip())
+    return years, codes, values, names
+
+
+class IneDataset:
+    """
+    One statistics CSV held as typed columns (year, INE code, value) with
+    precomputed group indexes for per-municipality series and aggregates.
+
+    The columns are parsed once and kept in a memory-mapped binary cache next to
+    the CSV, named after its hash, so later start-ups map them without parsing.
+    """
+
+    def __init__(self, name: str, path: str, cache_dir: Optional[str] = None):
+        self.name = name
+        self.path = path
+        self.cache_dir = cache_dir or os.path.join(os.path.dirname(path), ".cache")
+        self.rows = 0
+        self.names: dict[int, str] = {}
+        self._mmap: Optional[mmap.mmap] = None
+        # Typed column views over the memory-mapped cache
+        self.years: Optional[memoryview] = None
+        self.codes: Optional[memoryview] = None
+        self.values: Optional[memoryview] = None
+        # Per municipality, its (year, value) points in year order
+        self._series: dict[int, list[tuple[int, int]]] = {}
+        self._aggregates: dict[tuple[int, str], dict] = {}
+        self._by_year: dict[int, list[dict]] = {}
+        self._by_province: dict[str, list[dict]] = {}
+        self.cache_file: Optional[str] = None
+
+    def load(self) -> None:
+        with open(self.path, "rb") as file:
+            raw = file.read()
+        digest = hashlib.sha256(raw).digest()
+        stem = os.path.splitext(os.path.basename(self.path))[0]
+        cache_file = os.path.join(self.cache_dir, f"{stem}.{CACHE_MAGIC.decode('ascii').lower()}.{digest.hex()[:16]}.bin")
+
+        if not os.path.exists(cache_file):
+            self._write_cache(cache_file, digest, *parse_csv(raw))
+            self._remove_stale_caches(stem, cache_file)
+
+        years, codes, values = self._map_cache(cache_file, digest)
+        self._build_indexes(years, codes, values)
+        self.years, self.codes, self.values = years, codes, values
+        self.cache_file = cache_file
+
+    def _write_cache(self, cache_file, digest, years, codes, values, names) -> None:
+        os.makedirs(self.cache_dir, exist_ok=True)
+        names_json = json.dumps({str(code): name for code, name in names.items()}, ensure_ascii=False).encode("utf-8")
+        tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+        with open(tmp_file, "wb") as file:
+            file.write(CACHE_HEADER.pack(CACHE_MAGIC, digest, len(years), len(names_json)))
+            for column in (years, codes, values):
+                data = column.tobytes()
+                file.write(data + b"\0" * (_padded(len(data)) - len(data)))
+            file.write(names_json)
+        # Atomic rename, so concurrent workers never map a half-written file
+        os.replace(tmp_file, cache_file)
+
+    def _remove_stale_caches(self, stem: str, cache_file: str) -> None:
+        for entry in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, entry)
+            if entry.startswith(f"{stem}.") and entry.endswith(".bin") and path != cache_file:
+                os.remove(path)
+
+    def _map_cache(self, cache_file: str, digest: bytes):
+        with open(cache_file, "rb") as file:
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, cached_digest, rows, names_length = CACHE_HEADER.unpack_from(mapped, 0)
+        if magic != CACHE_MAGIC or cached_digest != digest:
+            mapped.close()
+            raise ValueError(f"Invalid statistics cache file: {cache_file}")
+
+        view = memoryview(mapped)
+        offset = CACHE_HEADER.size
+        columns = []
+        for typecode, itemsize in (("H", 2), ("I", 4), ("q", 8)):
+            columns.append(view[offset:offset + rows * itemsize].cast(typecode))
+            offset += _padded(rows * itemsize)
+        names = json.loads(bytes(view[offset:offset + names_length]).decode("utf-8"))
+
+        # A previous mapping is released once its column views are no longer referenced
+        self._mmap = mapped
+        self.rows = rows
+        self.names = {int(code): name for code, name in names.items()}
+        return columns
+
+    def _build_indexes(self, years, codes, values) -> None:
+        series: dict[int, list[tuple[int, int]]] = {}
+        aggregates: dict[tuple[int, str], dict] = {}
+        for year, code, value in zip(years, codes, values):
+            series.setdefault(code, []).append((year, value))
+            province = f"{code:05d}"[:2]
+            group = aggregates.setdefault((year, province), {
+                "year": year,
+                "province": province,
+                "province_name": PROVINCES.get(province),
+                "total": 0,
+                "municipalities": 0,
+            })
+            group["total"] += value
+            group["municipalities"] += 1
+        for points in series.values():
+            points.sort()
+        by_year: dict[int, list[dict]] = {}
+        by_province: dict[str, list[dict]] = {}
+        for (year, province), group in sorted(aggregates.items()):
+            by_year.setdefault(year, []).append(group)
+            by_province.setdefault(province, []).append(group)
+        self._series = series
+        self._aggregates = aggregates
+        self._by_year = by_year
+        self._by_province = by_province
+
+    def series(self, code: int) -> Optional[dict]:
+        points = self._series.get(code)
+        if points is None:
+            return None
+        return {
+            "code": f"{code:05d}",
+            "name": self.names.get(code),
+            "series": [{"year": year, "value": value} for year, value in points],
+        }
+
+    def aggregates(self, year: Optional[int] = None, province: Optional[str] = None) -> list[dict]:
+        """
+        Totals per year and province, optionally restricted to one year and/or province.
+        """
+        if year is not None and province is not None:
+            group = self._aggregates.get((year, province))
+            return [group] if group is not None else []
+        if year is not None:
+            return self._by_year.get(year, [])
+        if province is not None:
+            return self._by_province.get(province, [])
+        return [group for groups in self._by_year.values() for group in groups]
+
+    def value(self, code: int, year: Optional[int] = None) -> Optional[int]:
+        """
+        The municipality's value for `year`, or its latest value when `year` is None.
+        """
+        points = self._series.get(code)
+        if not points:
+            return None
+        if year is None:
+            return points[-1][1]
+        for point_year, value in points:
+            if point_year == year:
+                return value
+        return None
+
+    def stats(self) -> dict:
+        years = sorted(self._by_year)
+        return {
+            "rows": self.rows,
+            "municipalities": len(self._series),
+            "years": years,
+            "cache_file": self.cache_file,
+        }
+
+
+class IneStats:
+    """
+    The INE statistics datasets, loaded at start-up and whenever a CSV changes.
+    """
+
+    def __init__(self, paths: dict[str, str]):
+        self.datasets = {name: IneDataset(name, path) for name, path in paths.items()}
+        self._lock = threading.Lock()
+
+    def load(self) -> None:
+        # Each load maps fresh datasets and swaps them in whole, so a reader never sees one half-loaded
+        with self._lock:
+            datasets = {}
+            for name, dataset in self.datasets.items():
+                datasets[name] = IneDataset(name, dataset.path, dataset.cache_dir)
+                datasets[name].load()
+            self.datasets = datasets
+
+    @property
+    def paths(self) -> list[str]:
+        return [dataset.path for dataset in self.datasets.values()]
+
+    def get(self, name: str) -> Optional[IneDataset]:
+        return self.datasets.get(name)
+
+    def stats(self) -> dict:
+        return {name: dataset.stats() for name, dataset in self.datasets.items()}
@@ -0,0 +1,265 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+import sqlite3
+import threading
+from typing import Awaitable, Callable, Optional
+from src.telemetry import log_event
+
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "4"))
+JOB_QUEUE_MAX_DEPTH = int(os.environ.get("JOB_QUEUE_MAX_DEPTH", "1000"))
+# Gemini requests per minute this process may start, and the burst allowed above that pace
+GEMINI_RATE_PER_MINUTE = float(os.environ.get("GEMINI_RATE_PER_MINUTE", "60"))
+GEMINI_RATE_BURST = int(os.environ.get("GEMINI_RATE_BURST", "5"))
+# A running job whose worker has not finished it after this long is handed out again
+JOB_LEASE_SECONDS = float(os.environ.get("JOB_LEASE_SECONDS", "600"))
+# Finished jobs are kept this long for polling
+JOB_RETENTION_SECONDS = float(os.environ.get("JOB_RETENTION_SECONDS", "86400"))
+POLL_INTERVAL = 0.25
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status_created ON jobs (status, created_at);
+"""
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class TokenBucket:
+    """
+    Token-bucket rate limiter: `rate` tokens per second, holding at most `capacity`.
+    """
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class JobQueue:
+    """
+    Persistent job queue for the LLM-backed endpoints.
+
+    Jobs are stored in SQLite, so they survive restarts and can be claimed by any
+    uvicorn worker. A bounded pool of asyncio workers drains the queue, each job
+    first taking a token from a bucket sized to the Gemini quota. Submissions
+    beyond JOB_QUEUE_MAX_DEPTH queued jobs are rejected with QueueFullError.
+    """
+
+    def __init__(self, db_path: str, workers: int = JOB_WORKERS, max_depth: int = JOB_QUEUE_MAX_DEPTH):
+        self.db_path = db_path
+        self.workers = workers
+        self.max_depth = max_depth
+        self.handlers: dict[str, Callable[[dict], Awaitable[dict]]] = {}
+        self.bucket = TokenBucket(GEMINI_RATE_PER_MINUTE / 60, GEMINI_RATE_BURST)
+        self._local = threading.local()
+        self._tasks: list[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        # Long-polls waiting on a job, woken when a worker of this process finishes it
+        self._finished: dict[str, asyncio.Event] = {}
+        self._lock = threading.Lock()
+        self.counters = {"submitted": 0, "rejected": 0, "completed": 0, "failed": 0, "wait_seconds": 0.0}
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def register(self, kind: str, handler: Callable[[dict], Awaitable[dict]]) -> None:
+        self.handlers[kind] = handler
+
+    def start(self) -> None:
+        self._wakeup = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def depth(self) -> int:
+        (count,) = self._connect().execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()
+        return count
+
+    def submit(self, kind: str, payload: dict) -> str:
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        if self.depth() >= self.max_depth:
+            with self._lock:
+                self.counters["rejected"] += 1
+            raise QueueFullError(f"The job queue is full ({self.max_depth} jobs waiting).")
+
+        job_id = uuid.uuid4().hex
+        self._connect().execute(
+            "INSERT INTO jobs (id, kind, payload, status, created_at) VALUES (?, ?, ?, 'queued', ?)",
+            (job_id, kind, json.dumps(payload, ensure_ascii=False), time.time()),
+        )
+        with self._lock:
+            self.counters["submitted"] += 1
+        # Submitted from a worker thread too, so the workers are woken on their own loop
+        if self._wakeup is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+        return job_id
+
+    def get(self, job_id: str) -> Optional[dict]:
+        row = self._connect().execute(
+            "SELECT id, kind, status, result, error, created_at, started_at, finished_at FROM jobs WHERE id = ?",
+            (job_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        job = {"job_id": row[0], "kind": row[1], "status": row[2], "created_at": row[5], "started_at": row[6], "finished_at": row[7]}
+        if row[3] is not None:
+            job["result"] = json.loads(row[3])
+        if row[4] is not None:
+            job["error"] = row[4]
+        return job
+
+    async def wait(self, job_id: str, timeout: float) -> Optional[dict]:
+        """
+        Long-poll: return the job once it has finished or `timeout` seconds have passed.
+
+        A job finished by this process wakes the wait right away; one run by
+        another worker process is noticed on the next poll.
+        """
+        deadline = time.monotonic() + timeout
+        finished = self._finished.setdefault(job_id, asyncio.Event())
+        try:
+            job = await asyncio.to_thread(self.get, job_id)
+            while job is not None and job["status"] in ("queued", "running") and time.monotonic() < deadline:
+                try:
+                    await asyncio.wait_for(finished.wait(), timeout=min(POLL_INTERVAL * 4, max(0.0, deadline - time.monotonic())))
+                except asyncio.TimeoutError:
+                    pass
+                job = await asyncio.to_thread(self.get, job_id)
+        finally:
+            if self._finished.get(job_id) is finished:
+                del self._finished[job_id]
+        return job
+
+    def _claim(self) -> Optional[tuple[str, str, str, float]]:
+        """
+        Atomically hand the oldest queued (or abandoned) job to this worker.
+        """
+        conn = self._connect()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT id, kind, payload, created_at FROM jobs "
+                "WHERE status = 'queued' OR (status = 'running' AND started_at < ?) "
+                "ORDER BY created_at LIMIT 1",
+                (now - JOB_LEASE_SECONDS,),
+            ).fetchone()
+            if row is not None:
+                conn.execute("UPDATE jobs SET status = 'running', started_at = ? WHERE id = ?", (now, row[0]))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return row
+
+    def _finish(self, job_id: str, result: Optional[dict], error: Optional[str]) -> None:
+        now = time.time()
+        conn = self._connect()
+        conn.execute(
+            "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE id = ?",
+            (
+                "failed" if error is not None else "done",
+                json.dumps(result, ensure_ascii=False) if result is not None else None,
+                error,
+                now,
+                job_id,
+            ),
+        )
+        conn.execute("DELETE FROM jobs WHERE finished_at < ?", (now - JOB_RETENTION_SECONDS,))
+
+    async def _complete(self, job_id: str, result: Optional[dict], error: Optional[str]) -> None:
+        await asyncio.to_thread(self._finish, job_id, result, error)
+        finished = self._finished.get(job_id)
+        if finished is not None:
+            finished.set()
+
+    async def _worker(self) -> None:
+        while True:
+            # Claiming may wait up to busy_timeout on another process's write, so it runs off the loop
+            job = await asyncio.to_thread(self._claim)
+            if job is None:
+                # Sleep until a local submission or the next poll for other workers' jobs
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=POLL_INTERVAL * 4)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            job_id, kind, payload, created_at = job
+            await self.bucket.acquire()
+            with self._lock:
+                self.counters["wait_seconds"] += time.time() - created_at
+            try:
+                result = await self.handlers[kind](json.loads(payload))
+                await self._complete(job_id, result, None)
+                with self._lock:
+                    self.counters["completed"] += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log_event("job_failed", level="error", job_id=job_id, kind=kind, error=str(e))
+                # HTTPExceptions raised by the endpoint code carry a client-facing message
+                await self._complete(job_id, None, getattr(e, "detail", None) or "An error occurred while running the job.")
+                with self._lock:
+                    self.counters["failed"] += 1
+
+    def stats(self) -> dict:
+        conn = self._connect()
+        counts = dict(conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        with self._lock:
+            counters = dict(self.counters)
+        started = counters["completed"] + counters["failed"]
+        return {
+            "queue_depth": counts.get("queued", 0),
+            "running": counts.get("running", 0),
+            "max_depth": self.max_depth,
+            "workers": self.workers,
+            "submitted": counters["submitted"],
+            "rejected": counters["rejected"],
+            "completed": counters["completed"],
+            "failed": counters["failed"],
+            "avg_wait_seconds": counters["wait_seconds"] / started if started else 0.0,
+        }
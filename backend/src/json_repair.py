@@ -0,0 +1,112 @@
+import json
+
+try:
+    import orjson
+except ImportError:  # orjson is optional: the standard library parser is used without it
+    orjson = None
+
+CLOSERS = {"{": "}", "[": "]"}
+
+
+def loads(text: str):
+    """
+    Parse JSON with orjson when it is installed, falling back to the json module.
+
+    Both raise a json.JSONDecodeError (a ValueError) on invalid input.
+    """
+    if orjson is not None:
+        return orjson.loads(text)
+    return json.loads(text)
+
+
+def _strip_fences(text: str) -> str:
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.split("\n", 1)[1] if "\n" in text else ""
+        if text.rstrip().endswith("```"):
+            text = text.rstrip()[:-3]
+    return text
+
+
+def repair_json(text: str) -> str:
+    """
+    Best-effort fix of a model's JSON answer.
+
+    Markdown code fences and any text after the first complete top-level value
+    are removed. A truncated document is cut back to its last complete value and
+    its open brackets are closed: a half-written value is dropped, never kept.
+    """
+    return _repair(text)[0]
+
+
+def _repair(text: str) -> tuple[str, bool]:
+    """
+    Repaired text, and whether the document had to be closed because it was truncated.
+    """
+    text = _strip_fences(text)
+    start = min((i for i in (text.find("{"), text.find("[")) if i >= 0), default=-1)
+    if start < 0:
+        return text, False
+
+    # Each frame is [bracket, expecting_key]; a safe point is a prefix that can be closed as is
+    stack: list[list] = []
+    in_string = False
+    escape = False
+    safe_end = None
+    safe_stack: list[str] = []
+    for i in range(start, len(text)):
+        ch = text[i]
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+                # A closed string is a complete value unless it is an object key
+                if not (stack[-1][0] == "{" and stack[-1][1]):
+                    safe_end, safe_stack = i + 1, [frame[0] for frame in stack]
+            continue
+        if ch == '"':
+            in_string = True
+        elif ch in "{[":
+            stack.append([ch, ch == "{"])
+            safe_end, safe_stack = i + 1, [frame[0] for frame in stack]
+        elif ch in "}]":
+            if not stack or CLOSERS[stack[-1][0]] != ch:
+                break
+            stack.pop()
+            if not stack:
+                return text[start:i + 1], False
+            safe_end, safe_stack = i + 1, [frame[0] for frame in stack]
+        elif ch == ",":
+            # Whatever precedes a comma is a complete value, scalars included
+            safe_end, safe_stack = i, [frame[0] for frame in stack]
+            if stack and stack[-1][0] == "{":
+                stack[-1][1] = True
+        elif ch == ":" and stack:
+            stack[-1][1] = False
+
+    if safe_end is None:
+        return text[start:], True
+    prefix = text[start:safe_end].rstrip()
+    return prefix + "".join(CLOSERS[bracket] for bracket in reversed(safe_stack)), True
+
+
+def parse_json(text: str) -> tuple[object, bool]:
+    """
+    Parse a model's JSON answer, repairing it locally if it is malformed.
+
+    Returns the value and whether the answer was truncated, in which case its
+    last value may be incomplete. Raises ValueError if the answer cannot be
+    parsed even after repair.
+    """
+    try:
+        return loads(text), False
+    except ValueError:
+        pass
+    repaired, truncated = _repair(text)
+    try:
+        return loads(repaired), truncated
+    except ValueError as e:
+        raise ValueError(f"Failed to parse JSON response: {text}") from e
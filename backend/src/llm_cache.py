@@ -0,0 +1,141 @@
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Iterable, Optional
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS llm_cache (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_llm_cache_created ON llm_cache (created_at);
+"""
+
+# Run disk eviction once every this many writes instead of on every write
+EVICTION_INTERVAL = 100
+
+
+def make_key(model: str, template_version: str, parts: Iterable) -> str:
+    """
+    Content-addressed cache key: a SHA-256 over the model, the prompt template
+    version and every text and image payload sent to the model.
+    """
+    digest = hashlib.sha256()
+    for field in (model, template_version):
+        digest.update(field.encode("utf-8"))
+        digest.update(b"\0")
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode("utf-8")
+        digest.update(hashlib.sha256(part).digest())
+    return digest.hexdigest()
+
+
+class ResponseCache:
+    """
+    Two-tier response cache: a bounded in-memory LRU in front of a SQLite file
+    shared by every uvicorn worker. Both tiers expire entries after `ttl` seconds
+    and evict the oldest entries once they exceed their size limit.
+    """
+
+    def __init__(self, db_path: str, max_memory_entries: int = 256, max_disk_entries: int = 10000, ttl: float = 86400):
+        self.db_path = db_path
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self.ttl = ttl
+        self._memory: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._writes = 0
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._memory.move_to_end(key)
+                    self.counters["memory_hits"] += 1
+                    return entry[1]
+                del self._memory[key]
+
+        row = self._connect().execute(
+            "SELECT value, expires_at FROM llm_cache WHERE key = ? AND expires_at > ?", (key, now)
+        ).fetchone()
+        if row is None:
+            with self._lock:
+                self.counters["misses"] += 1
+            return None
+
+        # Promote disk hits into the memory tier
+        self._remember(key, row[0], row[1])
+        with self._lock:
+            self.counters["disk_hits"] += 1
+        return row[0]
+
+    def get_stale(self, key: str) -> Optional[str]:
+        """
+        Look up an entry even if it has expired, as a fallback while the model is unavailable.
+
+        Expired entries stay on disk until the next eviction pass.
+        """
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                return entry[1]
+        row = self._connect().execute("SELECT value FROM llm_cache WHERE key = ?", (key,)).fetchone()
+        return row[0] if row is not None else None
+
+    def set(self, key: str, value: str) -> None:
+        now = time.time()
+        expires_at = now + self.ttl
+        self._remember(key, value, expires_at)
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO llm_cache (key, value, created_at, expires_at) VALUES (?, ?, ?, ?)",
+            (key, value, now, expires_at),
+        )
+        with self._lock:
+            self._writes += 1
+            evict = self._writes % EVICTION_INTERVAL == 0
+        if evict:
+            self._evict_disk(conn, now)
+
+    def _remember(self, key: str, value: str, expires_at: float) -> None:
+        with self._lock:
+            self._memory[key] = (expires_at, value)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_memory_entries:
+                self._memory.popitem(last=False)
+                self.counters["evictions"] += 1
+
+    def _evict_disk(self, conn: sqlite3.Connection, now: float) -> None:
+        conn.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (now,))
+        conn.execute(
+            "DELETE FROM llm_cache WHERE key IN "
+            "(SELECT key FROM llm_cache ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_disk_entries,),
+        )
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self.counters)
+            stats["memory_entries"] = len(self._memory)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        return stats
@@ -0,0 +1,364 @@
+import os
+import json
+import time
+import asyncio
+from typing import TYPE_CHECKING, AsyncIterator, Optional
+from pydantic import BaseModel
+from src.llm_cache import ResponseCache, make_key
+from src.json_repair import loads, parse_json
+from src.schemas import InvalidResponseError, invalid_fields, partial_schema, validate
+from src.resilience import CircuitOpenError, is_retriable, resilience
+from src.telemetry import log_event, record, span
+
+if TYPE_CHECKING:
+    # google.genai is most of the backend's import time, so it is only imported on first use
+    from google import genai
+    from google.genai import types
+
+# Maximum number of Gemini calls in flight per process
+GEMINI_MAX_CONCURRENCY = int(os.environ.get("GEMINI_MAX_CONCURRENCY", "8"))
+# Default deadline for a whole call (connection + full stream), in seconds
+GEMINI_TIMEOUT = float(os.environ.get("GEMINI_TIMEOUT", "60"))
+# Longest the start-up warm-up may take before the worker starts serving anyway
+LLM_WARMUP_TIMEOUT = float(os.environ.get("LLM_WARMUP_TIMEOUT", "5"))
+
+LLM_CACHE_DB = os.environ.get(
+    "LLM_CACHE_DB",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "llm_cache.db"),
+)
+
+_client: Optional["genai.Client"] = None
+_semaphore = asyncio.Semaphore(GEMINI_MAX_CONCURRENCY)
+
+response_cache = ResponseCache(
+    LLM_CACHE_DB,
+    max_memory_entries=int(os.environ.get("LLM_CACHE_MEMORY_ENTRIES", "256")),
+    max_disk_entries=int(os.environ.get("LLM_CACHE_DISK_ENTRIES", "10000")),
+    ttl=float(os.environ.get("LLM_CACHE_TTL", "86400")),
+)
+# Identical calls already in flight share one upstream request
+_inflight: dict[str, asyncio.Task] = {}
+
+
+def get_client() -> "genai.Client":
+    """
+    Return the process-wide Gemini client, creating it on first use.
+
+    Reusing a single client keeps its HTTP connection pool (and TLS sessions)
+    alive across requests instead of paying a new handshake on every call.
+    """
+    global _client
+    if _client is None:
+        from google import genai
+        from google.genai import types
+
+        api_key = os.environ.get("GEMINI_API_KEY")
+        if not api_key:
+            raise ValueError("GEMINI_API_KEY environment variable is not set.")
+        http_options = types.HttpOptions(
+            timeout=int(GEMINI_TIMEOUT * 1000),
+            base_url=os.environ.get("GEMINI_BASE_URL"),
+        )
+        _client = genai.Client(api_key=api_key, http_options=http_options)
+    return _client
+
+
+async def warm_up(model: str, timeout: float = LLM_WARMUP_TIMEOUT) -> dict:
+    """
+    Import the Gemini SDK, create the client and open its pooled connection by
+    fetching the model's metadata, so the first request does not pay for any of it.
+
+    Any HTTP answer, even an error status, leaves a live connection in the pool.
+    Failures are reported in the result and never stop the worker from starting.
+    """
+    started = time.perf_counter()
+    result = {"model": model, "client_seconds": 0.0, "connect_seconds": 0.0, "connected": False, "error": None}
+    try:
+        async with asyncio.timeout(timeout):
+            client = await asyncio.to_thread(get_client)
+            result["client_seconds"] = time.perf_counter() - started
+            from google.genai import errors
+
+            connecting = time.perf_counter()
+            try:
+                await client.aio.models.get(model=model)
+            except errors.APIError:
+                pass
+            result["connect_seconds"] = time.perf_counter() - connecting
+            result["connected"] = True
+    except Exception as e:
+        result["error"] = str(e) or type(e).__name__
+    record("llm_warmup", time.perf_counter() - started)
+    return result
+
+
+async def _stream_once(
+    model: str,
+    contents: list,
+    config: "types.GenerateContentConfig",
+    timeout: float,
+) -> AsyncIterator[str]:
+    """
+    One streamed Gemini call through the native async client.
+
+    The call waits for a free concurrency slot and is cancelled with
+    `asyncio.TimeoutError` if the whole stream does not finish within `timeout`.
+    """
+    client = get_client()
+    waited = time.perf_counter()
+    async with _semaphore:
+        started = time.perf_counter()
+        record("llm_wait", started - waited)
+        first_chunk = True
+        async with asyncio.timeout(timeout):
+            stream = await client.aio.models.generate_content_stream(
+                model=model,
+                contents=contents,
+                config=config,
+            )
+            async for chunk in stream:
+                if first_chunk:
+                    record("llm_ttfb", time.perf_counter() - started)
+                    first_chunk = False
+                if chunk.text:  # Ensure chunk.text is not None
+                    yield chunk.text
+        record("llm_total", time.perf_counter() - started)
+
+
+def stream_text(
+    model: str,
+    contents: list,
+    config: "types.GenerateContentConfig",
+    timeout: Optional[float] = None,
+) -> AsyncIterator[str]:
+    """
+    Stream the text chunks of a Gemini response, retrying transient errors until
+    the first chunk arrives, within the endpoint's latency budget.
+    """
+    return resilience.stream(
+        model,
+        lambda budget: _stream_once(model, contents, config, budget),
+        timeout or GEMINI_TIMEOUT,
+    )
+
+
+def _cache_parts(contents: list, config: "types.GenerateContentConfig"):
+    """
+    Yield every payload that determines the answer: the generation config and
+    each text and inline image part of the contents.
+    """
+    schema = config.response_schema
+    if isinstance(schema, type) and issubclass(schema, BaseModel):
+        # Pydantic response models are not serializable as part of the config
+        yield config.model_dump_json(exclude_none=True, exclude={"response_schema"})
+        yield json.dumps(schema.model_json_schema(), sort_keys=True)
+    else:
+        yield config.model_dump_json(exclude_none=True)
+    for content in contents:
+        for part in content.parts:
+            if part.text is not None:
+                yield part.text
+            elif part.inline_data is not None:
+                yield part.inline_data.mime_type or ""
+                yield part.inline_data.data
+
+
+async def generate_text(
+    model: str,
+    contents: list,
+    config: "types.GenerateContentConfig",
+    timeout: Optional[float] = None,
+    cache_version: Optional[str] = None,
+) -> str:
+    """
+    Run a Gemini call and return the concatenated response text.
+
+    When `cache_version` (the prompt template version) is given, answers are
+    served from and stored in the response cache. Only well-formed JSON answers
+    are cached when JSON output was requested. While Gemini is failing, an
+    expired cached answer is returned instead of an error if one is available.
+    """
+    if cache_version is None:
+        return await _generate_uncached(model, contents, config, timeout)
+
+    key = make_key(model, cache_version, _cache_parts(contents, config))
+    cached = await asyncio.to_thread(response_cache.get, key)
+    if cached is not None:
+        return cached
+
+    # The upstream call runs as its own task, so a caller that is cancelled does not cancel it for the others
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.get_running_loop().create_task(_generate_and_cache(model, contents, config, timeout, key))
+        _inflight[key] = task
+        task.add_done_callback(lambda done: _forget(key, done))
+    return await asyncio.shield(task)
+
+
+async def _generate_and_cache(
+    model: str,
+    contents: list,
+    config: "types.GenerateContentConfig",
+    timeout: Optional[float],
+    key: str,
+) -> str:
+    try:
+        response_text = await _generate_uncached(model, contents, config, timeout)
+    except Exception as e:
+        stale = await asyncio.to_thread(_stale_fallback, model, key, e)
+        if stale is None:
+            raise
+        return stale
+    if config.response_mime_type != "application/json" or _is_json(response_text):
+        await asyncio.to_thread(response_cache.set, key, response_text)
+    return response_text
+
+
+def _forget(key: str, task: asyncio.Task) -> None:
+    _inflight.pop(key, None)
+    # Mark the exception as retrieved in case every caller was cancelled
+    if not task.cancelled():
+        task.exception()
+
+
+async def stream_response(
+    model: str,
+    contents: list,
+    config: "types.GenerateContentConfig",
+    timeout: Optional[float] = None,
+    cache_version: Optional[str] = None,
+) -> AsyncIterator[str]:
+    """
+    Stream a Gemini response chunk by chunk, going through the response cache.
+
+    A cached answer is yielded as a single chunk; a fresh answer is forwarded
+    as it arrives and stored once complete. If Gemini fails before the first
+    chunk, an expired cached answer is yielded instead when one is available.
+    """
+    if cache_version is None:
+        async for text in stream_text(model, contents, config, timeout=timeout):
+            yield text
+        return
+
+    key = make_key(model, cache_version, _cache_parts(contents, config))
+    cached = await asyncio.to_thread(response_cache.get, key)
+    if cached is not None:
+        yield cached
+        return
+
+    response_text = ""
+    try:
+        async for text in stream_text(model, contents, config, timeout=timeout):
+            response_text += text
+            yield text
+    except Exception as e:
+        stale = None if response_text else await asyncio.to_thread(_stale_fallback, model, key, e)
+        if stale is None:
+            raise
+        yield stale
+        return
+    if config.response_mime_type != "application/json" or _is_json(response_text):
+        await asyncio.to_thread(response_cache.set, key, response_text)
+
+
+async def generate_structured(
+    model: str,
+    contents: list,
+    config: "types.GenerateContentConfig",
+    schema: type[BaseModel],
+    timeout: Optional[float] = None,
+    cache_version: Optional[str] = None,
+) -> dict:
+    """
+    Run a Gemini call whose answer must match `schema` and return it validated.
+
+    Malformed output (code fences, trailing text, truncation) is repaired
+    locally. Fields still missing or invalid are re-asked for on their own
+    instead of repeating the whole call. Raises InvalidResponseError if the
+    answer cannot be completed.
+    """
+    response_text = await generate_text(model, contents, config, timeout, cache_version)
+    with span("json_parse"):
+        data, truncated = _parse(response_text)
+        missing = invalid_fields(schema, data)
+    if truncated and isinstance(data, dict) and data:
+        # The last field before the cut may have lost items
+        last_field = list(data)[-1]
+        if last_field in schema.model_fields and last_field not in missing:
+            missing.append(last_field)
+    if not missing:
+        with span("json_parse"):
+            return _validated(schema, data)
+
+    if not isinstance(data, dict) or len(missing) == len(schema.model_fields):
+        raise InvalidResponseError(f"Response does not match {schema.__name__}: {response_text}")
+
+    from google.genai import types
+
+    partial = partial_schema(schema, missing)
+    follow_up = contents + [
+        types.Content(role="model", parts=[types.Part.from_text(text=response_text)]),
+        types.Content(role="user", parts=[types.Part.from_text(
+            text="La respuesta anterior está incompleta o no es válida. "
+                 f"Devuelve únicamente un JSON con los campos: {', '.join(missing)}."
+        )]),
+    ]
+    follow_up_config = config.model_copy(update={"response_schema": partial})
+    log_event("llm_reask", level="warning", model=model, schema=schema.__name__, fields=missing)
+    follow_up_text = await generate_text(model, follow_up, follow_up_config, timeout, cache_version)
+    with span("json_parse"):
+        completion, _ = _parse(follow_up_text)
+    if not isinstance(completion, dict):
+        raise InvalidResponseError(f"Response does not match {partial.__name__}: {follow_up_text}")
+    data.update({field: completion[field] for field in missing if field in completion})
+    return _validated(schema, data)
+
+
+def _parse(text: str) -> tuple[object, bool]:
+    try:
+        return parse_json(text)
+    except ValueError as e:
+        raise InvalidResponseError(str(e)) from e
+
+
+def _validated(schema: type[BaseModel], data) -> dict:
+    try:
+        return validate(schema, data)
+    except ValueError as e:
+        raise InvalidResponseError(f"Response does not match {schema.__name__}: {e}") from e
+
+
+async def _generate_uncached(
+    model: str,
+    contents: list,
+    config: "types.GenerateContentConfig",
+    timeout: Optional[float],
+) -> str:
+    async def attempt(budget: float) -> str:
+        response_text = ""
+        async for text in _stream_once(model, contents, config, budget):
+            response_text += text
+        return response_text
+
+    return await resilience.call(model, attempt, timeout or GEMINI_TIMEOUT)
+
+
+def _stale_fallback(model: str, key: str, error: Exception) -> Optional[str]:
+    """
+    Expired cached answer to degrade to when Gemini is unavailable, if there is one.
+    """
+    if not (isinstance(error, CircuitOpenError) or is_retriable(error)):
+        return None
+    stale = response_cache.get_stale(key)
+    if stale is not None:
+        log_event("llm_stale_answer", level="warning", model=model, error=str(error))
+        resilience.record_degraded(model)
+    return stale
+
+
+def _is_json(text: str) -> bool:
+    try:
+        loads(text)
+        return True
+    except ValueError:
+        return False
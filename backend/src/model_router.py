@@ -0,0 +1,123 @@
+import os
+import time
+import threading
+from dataclasses import dataclass
+from typing import Awaitable, Callable
+from src.resilience import LatencyTracker, remaining
+from src.schemas import InvalidResponseError
+from src.telemetry import log_event
+
+FLASH_MODEL = os.environ.get("GEMINI_FLASH_MODEL", "gemini-2.0-flash")
+PRO_MODEL = os.environ.get("GEMINI_PRO_MODEL", "gemini-2.5-pro-exp-03-25")
+# User input (characters) or photos per request from which a request goes straight to the pro model
+ROUTER_PRO_INPUT_CHARS = int(os.environ.get("ROUTER_PRO_INPUT_CHARS", "1500"))
+ROUTER_PRO_IMAGES = int(os.environ.get("ROUTER_PRO_IMAGES", "6"))
+# Seconds of latency budget needed to call the pro model, and to escalate to it after flash
+ROUTER_PRO_MIN_BUDGET = float(os.environ.get("ROUTER_PRO_MIN_BUDGET", "15"))
+ROUTER_ESCALATION_MIN_BUDGET = float(os.environ.get("ROUTER_ESCALATION_MIN_BUDGET", "20"))
+
+
+@dataclass(frozen=True)
+class RouteFeatures:
+    endpoint: str
+    input_chars: int = 0
+    images: int = 0
+
+
+class ModelRouter:
+    """
+    Picks the Gemini model for each request from its endpoint, input size and
+    remaining latency budget (the endpoint's, or the caller's X-Latency-Budget).
+
+    Most requests try flash first and are re-asked to pro only when flash's
+    answer fails validation. Long narratives and large photo batches go straight
+    to pro, unless the budget left is too short for it.
+    """
+
+    def __init__(self, flash_model: str = FLASH_MODEL, pro_model: str = PRO_MODEL):
+        self.flash_model = flash_model
+        self.pro_model = pro_model
+        self._latency: dict[str, LatencyTracker] = {}
+        self._lock = threading.Lock()
+        self.model_counters: dict[str, dict] = {}
+        self.endpoint_counters: dict[str, dict] = {}
+
+    def route(self, features: RouteFeatures) -> list[str]:
+        """
+        Models to try in order: each one after the first is an escalation.
+        """
+        budget = remaining(float("inf"))
+        hard = features.input_chars >= ROUTER_PRO_INPUT_CHARS or features.images >= ROUTER_PRO_IMAGES
+        if budget < ROUTER_PRO_MIN_BUDGET:
+            return [self.flash_model]
+        if hard:
+            return [self.pro_model]
+        if budget < ROUTER_ESCALATION_MIN_BUDGET:
+            return [self.flash_model]
+        return [self.flash_model, self.pro_model]
+
+    def choose(self, features: RouteFeatures) -> str:
+        """
+        Single model for a streamed answer, which cannot be escalated once sent.
+        """
+        model = self.route(features)[0]
+        self._count_route(features.endpoint, model)
+        return model
+
+    async def run(self, features: RouteFeatures, ask: Callable[[str], Awaitable[dict]]) -> dict:
+        """
+        Ask the routed models in turn until one returns a valid answer; `ask`
+        raises InvalidResponseError when the model's answer does not validate.
+        Any other error (a missing API key, an upstream failure) is raised as is.
+        """
+        models = self.route(features)
+        self._count_route(features.endpoint, models[0])
+        for index, model in enumerate(models):
+            started = time.perf_counter()
+            try:
+                response = await ask(model)
+            except InvalidResponseError as e:
+                self._record(model, time.perf_counter() - started)
+                self._count_model(model, "validation_failures")
+                if index == len(models) - 1:
+                    raise
+                log_event("llm_escalation", level="warning", from_model=model, to_model=models[index + 1], error=str(e))
+                self._count_endpoint(features.endpoint, "escalations")
+                continue
+            self._record(model, time.perf_counter() - started)
+            return response
+
+    def _count_route(self, endpoint: str, model: str) -> None:
+        self._count_endpoint(endpoint, "requests")
+        self._count_endpoint(endpoint, f"routed_{'pro' if model == self.pro_model else 'flash'}")
+
+    def _count_endpoint(self, endpoint: str, counter: str) -> None:
+        with self._lock:
+            counters = self.endpoint_counters.setdefault(endpoint, {"requests": 0, "routed_flash": 0, "routed_pro": 0, "escalations": 0})
+            counters[counter] += 1
+
+    def _count_model(self, model: str, counter: str) -> None:
+        with self._lock:
+            counters = self.model_counters.setdefault(model, {"calls": 0, "validation_failures": 0})
+            counters[counter] += 1
+
+    def _record(self, model: str, seconds: float) -> None:
+        self._count_model(model, "calls")
+        with self._lock:
+            tracker = self._latency.setdefault(model, LatencyTracker())
+        tracker.record(seconds)
+
+    def stats(self) -> dict:
+        with self._lock:
+            models = {model: dict(counters) for model, counters in self.model_counters.items()}
+            endpoints = {endpoint: dict(counters) for endpoint, counters in self.endpoint_counters.items()}
+            latency = dict(self._latency)
+        for model, counters in models.items():
+            counters["p50_seconds"] = latency[model].percentile(0.5) if model in latency else None
+            counters["p95_seconds"] = latency[model].percentile(0.95) if model in latency else None
+        for counters in endpoints.values():
+            counters["escalation_rate"] = counters["escalations"] / counters["requests"] if counters["requests"] else 0.0
+        return {"models": models, "endpoints": endpoints}
+
+
+model_router = ModelRouter()
@@ -0,0 +1,230 @@
+import os
+import re
+import math
+import time
+import heapq
+import threading
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from typing import Optional
+from src.text_utils import tokenize
+from src.telemetry import record
+
+# Number of passages injected into a prompt
+POLICY_TOP_K = int(os.environ.get("POLICY_TOP_K", "6"))
+
+HEADING_PATTERN = re.compile(r"^¿.+\?$")
+CITE_PATTERN = re.compile(r"\s*\[cite:\s*([\d,\s]+)\]")
+BULLET_PATTERN = re.compile(r"^[*\-•]\s*(?:[X☑✔!]\s+)?")
+SENTENCE_ENDINGS = (".", "?", "!", ":", "€")
+
+# BM25 parameters
+K1 = 1.5
+B = 0.75
+
+
+@dataclass(frozen=True)
+class Passage:
+    source: str
+    heading: str
+    subheading: str
+    text: str
+    cites: tuple[int, ...]
+    order: int
+
+
+@dataclass(frozen=True)
+class _Index:
+    """
+    One build of the index; replaced whole when the documents are reloaded.
+    """
+    passages: tuple[Passage, ...] = ()
+    full_text: dict[str, str] = field(default_factory=dict)
+    postings: dict[str, tuple[tuple[int, int], ...]] = field(default_factory=dict)
+    idf: dict[str, float] = field(default_factory=dict)
+    lengths: tuple[int, ...] = ()
+    avg_length: float = 0.0
+
+
+def chunk_document(source: str, text: str) -> list[Passage]:
+    """
+    Split a policy document into passages.
+
+    Sections start at the "¿Qué se asegura?"-style question headings and
+    subsections at short lines ending in a colon. Each top-level item of a
+    section (with its nested items) becomes one passage; `[cite: N]` markers
+    are stripped from the text and kept as metadata.
+    """
+    passages: list[Passage] = []
+    heading, subheading = "", ""
+    lines: list[str] = []
+    cites: list[int] = []
+    base_indent: Optional[int] = None
+
+    def flush():
+        if lines:
+            passages.append(Passage(source, heading, subheading, "\n".join(lines), tuple(sorted(set(cites))), len(passages)))
+        lines.clear()
+        cites.clear()
+
+    for raw_line in text.splitlines():
+        stripped = raw_line.strip()
+        if not stripped:
+            continue
+        if HEADING_PATTERN.match(stripped):
+            flush()
+            heading, subheading, base_indent = stripped, "", None
+            continue
+        if stripped.endswith(":") and len(stripped) < 100 and not BULLET_PATTERN.match(stripped):
+            flush()
+            subheading, base_indent = stripped, None
+            continue
+
+        content = CITE_PATTERN.sub("", stripped)
+        indent = len(raw_line) - len(raw_line.lstrip())
+        if base_indent is None:
+            base_indent = indent
+        if lines and not BULLET_PATTERN.match(stripped) and not lines[-1].endswith(SENTENCE_ENDINGS):
+            # A paragraph wrapped over several lines
+            lines[-1] += " " + content
+        elif indent <= base_indent:
+            # A new top-level item starts a new passage; deeper lines are nested items
+            flush()
+            lines.append(content)
+        else:
+            lines.append("    " + content)
+
+        for match in CITE_PATTERN.finditer(stripped):
+            cites.extend(int(number) for number in match.group(1).replace(" ", "").split(",") if number)
+    flush()
+    return passages
+
+
+class PolicyIndex:
+    """
+    In-process BM25 index over the policy documents, built once at startup.
+
+    Endpoints ask for the top-k passages relevant to their query instead of
+    pasting whole documents into every prompt. Prompt-size savings and
+    retrieval latency are recorded per endpoint.
+    """
+
+    def __init__(self, paths: list[str]):
+        self.paths = paths
+        self._index = _Index()
+        self._lock = threading.Lock()
+        self._stats: dict[str, dict] = defaultdict(
+            lambda: {"requests": 0, "full_chars": 0, "retrieved_chars": 0, "fallbacks": 0, "retrieval_seconds": 0.0}
+        )
+
+    def build(self) -> None:
+        passages: list[Passage] = []
+        full_text: dict[str, str] = {}
+        for path in self.paths:
+            source = os.path.basename(path)
+            with open(path, "r", encoding="utf-8") as file:
+                full_text[source] = file.read()
+            passages.extend(chunk_document(source, full_text[source]))
+
+        postings: dict[str, list[tuple[int, int]]] = defaultdict(list)
+        lengths = []
+        for index, passage in enumerate(passages):
+            # Headings are indexed with the passage so "no está asegurado" style queries match
+            terms = tokenize(" ".join((passage.heading, passage.subheading, passage.text)))
+            lengths.append(len(terms))
+            for term, frequency in Counter(terms).items():
+                postings[term].append((index, frequency))
+
+        count = len(passages)
+        # Swapped in with a single assignment, so a search never mixes two builds
+        self._index = _Index(
+            passages=tuple(passages),
+            full_text=full_text,
+            postings={term: tuple(docs) for term, docs in postings.items()},
+            idf={term: math.log(1 + (count - len(docs) + 0.5) / (len(docs) + 0.5)) for term, docs in postings.items()},
+            lengths=tuple(lengths),
+            avg_length=sum(lengths) / count if count else 0.0,
+        )
+
+    @property
+    def passages(self) -> tuple[Passage, ...]:
+        return self._index.passages
+
+    @property
+    def full_text(self) -> dict[str, str]:
+        return self._index.full_text
+
+    def search(self, query: str, source: Optional[str] = None, k: int = POLICY_TOP_K) -> list[tuple[float, Passage]]:
+        """
+        Top-k passages for `query` by BM25 score, optionally restricted to one source document.
+        """
+        built = self._index
+        scores: dict[int, float] = defaultdict(float)
+        for term in set(tokenize(query)):
+            idf = built.idf.get(term)
+            if idf is None:
+                continue
+            for index, frequency in built.postings[term]:
+                if source is not None and built.passages[index].source != source:
+                    continue
+                norm = K1 * (1 - B + B * built.lengths[index] / built.avg_length)
+                scores[index] += idf * frequency * (K1 + 1) / (frequency + norm)
+        best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        return [(score, built.passages[index]) for index, score in best]
+
+    def context_for(self, query: str, source: str, endpoint: str, k: int = POLICY_TOP_K) -> str:
+        """
+        Policy text to inject into a prompt: the top-k passages of `source`
+        grouped under their headings in document order. Falls back to the whole
+        document when nothing in it matches the query.
+        """
+        started = time.perf_counter()
+        hits = self.search(query, source=source, k=k)
+        full = self.full_text[source]
+        if hits:
+            context = render_passages([passage for _, passage in hits])
+        else:
+            context = full
+        elapsed = time.perf_counter() - started
+        record("policy_retrieval", elapsed)
+
+        with self._lock:
+            stats = self._stats[endpoint]
+            stats["requests"] += 1
+            stats["full_chars"] += len(full)
+            stats["retrieved_chars"] += len(context)
+            stats["fallbacks"] += 0 if hits else 1
+            stats["retrieval_seconds"] += elapsed
+        return context
+
+    def stats(self) -> dict:
+        """
+        Per-endpoint prompt size before (whole document) and after retrieval, and retrieval latency.
+        """
+        with self._lock:
+            report = {}
+            for endpoint, stats in self._stats.items():
+                requests = stats["requests"]
+                report[endpoint] = {
+                    "requests": requests,
+                    "fallbacks": stats["fallbacks"],
+                    "avg_chars_before": stats["full_chars"] / requests,
+                    "avg_chars_after": stats["retrieved_chars"] / requests,
+                    "size_reduction": 1 - stats["retrieved_chars"] / stats["full_chars"] if stats["full_chars"] else 0.0,
+                    "avg_retrieval_ms": stats["retrieval_seconds"] / requests * 1000,
+                }
+        return {"passages": len(self.passages), "endpoints": report}
+
+
+def render_passages(passages: list[Passage]) -> str:
+    lines: list[str] = []
+    last_heading, last_subheading = None, None
+    for passage in sorted(passages, key=lambda passage: passage.order):
+        if passage.heading != last_heading:
+            lines.append(passage.heading)
+            last_heading, last_subheading = passage.heading, None
+        if passage.subheading and passage.subheading != last_subheading:
+            lines.append(passage.subheading)
+            last_subheading = passage.subheading
+        lines.append(passage.text)
+    return "\n".join(line for line in lines if line)
@@ -0,0 +1,153 @@
+import os
+import math
+import time
+import array
+import datetime
+import threading
+from statistics import median
+from typing import Optional
+from src.ine_stats import IneStats
+from src.text_utils import tokenize
+
+# Yearly premium (EUR) of a new, garaged tractor in good condition in an average municipality
+PRICING_BASE_PREMIUM = float(os.environ.get("PRICING_BASE_PREMIUM", "250"))
+# Records accepted per /quote/batch call
+MAX_QUOTE_BATCH = int(os.environ.get("MAX_QUOTE_BATCH", "10000"))
+
+# Surcharge per year of age, up to MAX_AGE_FACTOR
+AGE_LOADING = 0.02
+MAX_AGE_FACTOR = 1.6
+GARAGE_FACTOR = 0.9
+# Words of the free-text `condicion` and their factor; the worst one mentioned applies
+CONDITION_WORDS = {
+    "nuevo": 0.9, "excelente": 0.9, "perfecto": 0.9, "impecable": 0.9,
+    "bueno": 1.0, "buena": 1.0, "bien": 1.0,
+    "aceptable": 1.05, "normal": 1.05,
+    "regular": 1.15, "usado": 1.1, "desgastado": 1.15, "oxido": 1.15, "oxidado": 1.15,
+    "malo": 1.35, "mala": 1.35, "deteriorado": 1.35, "averiado": 1.4, "roto": 1.4,
+}
+UNKNOWN_CONDITION_FACTOR = 1.1
+# Exposure: tractor count and family labour per tractor of the municipality against the median one.
+# Latest yearly counts have a median of 2 tractors, so a municipality with a single one sits at
+# 0.95 and the ranges clamp under a fifth of the municipalities
+TRACTOR_DENSITY_WEIGHT = 0.05
+TRACTOR_DENSITY_RANGE = (0.95, 1.25)
+FAMILY_LABOUR_WEIGHT = 0.04
+FAMILY_LABOUR_RANGE = (0.9, 1.1)
+
+CONDITION_STEMS = {tokenize(word)[0]: factor for word, factor in CONDITION_WORDS.items()}
+
+
+def _clamp(value: float, bounds: tuple[float, float]) -> float:
+    return min(bounds[1], max(bounds[0], value))
+
+
+def municipality_code(value: Optional[str]) -> Optional[int]:
+    """
+    INE code of "05019" or "05019 AVILA", or None.
+    """
+    code = (value or "").strip()[:5]
+    return int(code) if len(code) == 5 and code.isdigit() else None
+
+
+class PricingEngine:
+    """
+    Deterministic premium for an InsuranceData record: a base premium times
+    age, garage, condition and local exposure factors.
+
+    Exposure factors are precomputed per municipality from the INE statistics,
+    so a batch is priced as a few column-wise passes without any lookups
+    beyond a dict per record.
+    """
+
+    def __init__(self, statistics: IneStats, base_premium: float = PRICING_BASE_PREMIUM):
+        self.statistics = statistics
+        self.base_premium = base_premium
+        self.exposure: dict[int, float] = {}
+        self._condition_cache: dict[str, float] = {}
+        self._lock = threading.Lock()
+        self.counters = {"quotes": 0, "batches": 0, "seconds": 0.0}
+
+    def build(self) -> None:
+        tractors = self.statistics.get("tractores_industriales")
+        families = self.statistics.get("familiares_trabajan_explotaciones")
+        latest_tractors = {code: tractors.value(code) for code in tractors.names}
+        latest_tractors = {code: count for code, count in latest_tractors.items() if count}
+        labour = {}
+        for code, count in latest_tractors.items():
+            family_count = families.value(code)
+            if family_count:
+                labour[code] = family_count / count
+
+        median_tractors = median(latest_tractors.values())
+        median_labour = median(labour.values()) if labour else 1.0
+        exposure = {}
+        for code, count in latest_tractors.items():
+            factor = _clamp(1 + TRACTOR_DENSITY_WEIGHT * math.log2(count / median_tractors), TRACTOR_DENSITY_RANGE)
+            if code in labour:
+                factor *= _clamp(1 + FAMILY_LABOUR_WEIGHT * math.log2(labour[code] / median_labour), FAMILY_LABOUR_RANGE)
+            exposure[code] = round(factor, 4)
+        self.exposure = exposure
+
+    def condition_factor(self, condition: str) -> float:
+        factor = self._condition_cache.get(condition)
+        if factor is None:
+            factors = [CONDITION_STEMS[token] for token in tokenize(condition) if token in CONDITION_STEMS]
+            factor = max(factors) if factors else UNKNOWN_CONDITION_FACTOR
+            if len(self._condition_cache) < 10000:
+                self._condition_cache[condition] = factor
+        return factor
+
+    def quote_batch(self, records: list[dict]) -> list[dict]:
+        """
+        Price every record (InsuranceData fields plus an optional `municipio`)
+        in column-wise passes.
+        """
+        started = time.perf_counter()
+        current_year = datetime.date.today().year
+        ages = array.array("d", (
+            min(MAX_AGE_FACTOR, 1 + AGE_LOADING * max(0, current_year - record["año"])) for record in records
+        ))
+        garages = array.array("d", (GARAGE_FACTOR if record["garaje"] else 1.0 for record in records))
+        conditions = array.array("d", (self.condition_factor(record["condicion"]) for record in records))
+        codes = [municipality_code(record.get("municipio")) for record in records]
+        exposures = array.array("d", (self.exposure.get(code, 1.0) for code in codes))
+        premiums = array.array("d", (
+            self.base_premium * age * garage * condition * exposure
+            for age, garage, condition, exposure in zip(ages, garages, conditions, exposures)
+        ))
+
+        quotes = [
+            {
+                "premium": round(premium, 2),
+                "currency": "EUR",
+                "municipio": f"{code:05d}" if code in self.exposure else None,
+                "factors": {
+                    "age": round(age, 4),
+                    "garage": garage,
+                    "condition": condition,
+                    "exposure": exposure,
+                },
+            }
+            for premium, code, age, garage, condition, exposure
+            in zip(premiums, codes, ages, garages, conditions, exposures)
+        ]
+        with self._lock:
+            self.counters["quotes"] += len(records)
+            self.counters["batches"] += 1
+            self.counters["seconds"] += time.perf_counter() - started
+        return quotes
+
+    def quote(self, record: dict) -> dict:
+        return self.quote_batch([record])[0]
+
+    def stats(self) -> dict:
+        with self._lock:
+            quotes = self.counters["quotes"]
+            return {
+                "municipalities": len(self.exposure),
+                "base_premium": self.base_premium,
+                "quotes": quotes,
+                "batches": self.counters["batches"],
+                "avg_quote_us": self.counters["seconds"] / quotes * 1e6 if quotes else 0.0,
+            }
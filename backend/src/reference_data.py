@@ -0,0 +1,124 @@
+import os
+import time
+import asyncio
+import threading
+from dataclasses import dataclass
+from typing import Callable, Iterable, Optional
+from src.telemetry import log_event
+
+# Seconds between checks of the reference files for changes on disk (0 disables reloading)
+REFERENCE_RELOAD_INTERVAL = float(os.environ.get("REFERENCE_RELOAD_INTERVAL", "5"))
+
+
+def file_signature(paths: Iterable[str]) -> tuple:
+    """
+    Modification time and size of each file, None for a missing one.
+    """
+    signature = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            signature.append((stat.st_mtime_ns, stat.st_size))
+        except FileNotFoundError:
+            signature.append(None)
+    return tuple(signature)
+
+
+@dataclass
+class _Source:
+    name: str
+    paths: tuple[str, ...]
+    build: Callable[[], None]
+    signature: tuple = ()
+    loaded_at: float = 0.0
+    build_seconds: float = 0.0
+    reloads: int = 0
+    failures: int = 0
+    last_error: Optional[str] = None
+
+
+class ReferenceData:
+    """
+    The reference files the backend answers from (policy documents, INE
+    statistics, municipality centroids), loaded into memory once and rebuilt
+    only when they change on disk.
+
+    Each source's `build` reads its files into a new immutable snapshot and swaps
+    it in with a single assignment, so requests served during a reload see the old
+    data or the new, never a mix. A failed reload keeps the previous snapshot and
+    is retried at the next check.
+    """
+
+    def __init__(self, interval: float = REFERENCE_RELOAD_INTERVAL):
+        self.interval = interval
+        self._sources: dict[str, _Source] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, paths: Iterable[str], build: Callable[[], None]) -> None:
+        self._sources[name] = _Source(name, tuple(paths), build)
+
+    def _build(self, source: _Source) -> None:
+        # Taken before reading, so a write during the build triggers another reload
+        signature = file_signature(source.paths)
+        started = time.perf_counter()
+        source.build()
+        source.build_seconds = time.perf_counter() - started
+        source.signature = signature
+        source.loaded_at = time.time()
+
+    def load(self) -> None:
+        """
+        Build every source, in registration order.
+        """
+        with self._lock:
+            for source in self._sources.values():
+                self._build(source)
+
+    def check(self) -> list[str]:
+        """
+        Rebuild the sources whose files changed since their last build; returns their names.
+        """
+        reloaded = []
+        with self._lock:
+            for source in self._sources.values():
+                if file_signature(source.paths) == source.signature:
+                    continue
+                try:
+                    self._build(source)
+                except Exception as e:
+                    source.failures += 1
+                    source.last_error = str(e)
+                    log_event("reference_reload_failed", level="error", source=source.name, error=str(e))
+                    continue
+                source.reloads += 1
+                source.last_error = None
+                reloaded.append(source.name)
+                log_event(
+                    "reference_reloaded", always=True, source=source.name,
+                    build_ms=round(source.build_seconds * 1000, 2),
+                )
+        return reloaded
+
+    async def watch(self) -> None:
+        """
+        Check the files for changes every `interval` seconds, until cancelled.
+        """
+        if self.interval <= 0:
+            return
+        while True:
+            await asyncio.sleep(self.interval)
+            await asyncio.to_thread(self.check)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                source.name: {
+                    "files": [os.path.basename(path) for path in source.paths],
+                    "loaded_at": source.loaded_at,
+                    "build_ms": source.build_seconds * 1000,
+                    "reloads": source.reloads,
+                    "failures": source.failures,
+                    "last_error": source.last_error,
+                }
+                for source in self._sources.values()
+            }
@@ -0,0 +1,236 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from dataclasses import dataclass, field
+from typing import Optional
+from src.text_utils import tokenize
+
+REPORT_SESSION_TTL = float(os.environ.get("REPORT_SESSION_TTL", "3600"))
+REPORT_SESSION_MAX = int(os.environ.get("REPORT_SESSION_MAX", "10000"))
+# Transcripts kept per session; older clips are dropped once answered questions are recorded
+MAX_TRANSCRIPTS_PER_SESSION = 20
+# Tokens at least this long tolerate one transcription error (edit distance 1)
+FUZZY_MIN_LENGTH = 5
+# Writes between two passes deleting expired sessions and those beyond REPORT_SESSION_MAX
+EVICTION_INTERVAL = 100
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS report_sessions (
+    claim_id TEXT PRIMARY KEY,
+    open_questions TEXT NOT NULL,
+    answers TEXT NOT NULL,
+    transcripts TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_report_sessions_expires ON report_sessions (expires_at);
+"""
+
+
+@dataclass(frozen=True)
+class ReportQuestion:
+    id: str
+    text: str
+    triggers: tuple[str, ...]
+
+
+IMPORTANT_QUESTIONS = (
+    ReportQuestion("location", "¿Dónde ocurrió el accidente?", (
+        "carretera", "calle", "camino", "kilometro", "km", "finca", "parcela", "pueblo", "cruce", "rotonda",
+        "autovia", "autopista", "cerca de", "a la altura", "municipio", "en el campo",
+    )),
+    ReportQuestion("injuries", "¿Hubo heridos?", (
+        "herido", "lesion", "lesionado", "ileso", "nadie resulto", "ambulancia", "hospital", "fallecido",
+        "muerto", "estamos bien", "sin heridos",
+    )),
+    ReportQuestion("vehicle_state", "¿Cuál es el estado del vehículo?", (
+        "daño", "dañado", "roto", "rota", "abollado", "abolladura", "golpe", "arranca", "funciona", "destrozado",
+        "siniestro total", "estado del tractor", "estado del vehiculo", "rueda", "motor", "luna", "capo",
+    )),
+    ReportQuestion("vehicles_involved", "¿Cuántos vehículos estuvieron involucrados?", (
+        "otro vehiculo", "otro coche", "otro tractor", "camion", "furgoneta", "moto", "coche", "vehiculos",
+        "solo yo", "ningun otro", "ninguno mas", "dos vehiculos", "tres vehiculos",
+    )),
+)
+
+
+def _deletes(token: str) -> set[str]:
+    return {token[:i] + token[i + 1:] for i in range(len(token))}
+
+
+class IntentMatcher:
+    """
+    Detects which report questions a transcript answers.
+
+    Each question has trigger phrases compared on accent-folded, stemmed tokens.
+    Single-token triggers also match with one transcription error through a
+    deletion-neighbourhood index, so lookups stay O(transcript length).
+    """
+
+    def __init__(self, questions=IMPORTANT_QUESTIONS):
+        self.questions = {question.id: question for question in questions}
+        self._phrases: dict[str, list[tuple[tuple[str, ...], str, str]]] = {}
+        self._fuzzy: dict[str, set[str]] = {}
+        for question in questions:
+            for trigger in question.triggers:
+                phrase = tuple(tokenize(trigger))
+                if not phrase:
+                    continue
+                self._phrases.setdefault(phrase[0], []).append((phrase, question.id, trigger))
+                if len(phrase) == 1 and len(phrase[0]) >= FUZZY_MIN_LENGTH:
+                    for variant in _deletes(phrase[0]):
+                        self._fuzzy.setdefault(variant, set()).add(phrase[0])
+
+    def _candidates(self, token: str) -> set[str]:
+        candidates = {token}
+        if len(token) >= FUZZY_MIN_LENGTH - 1:
+            candidates |= self._fuzzy.get(token, set())
+            for variant in _deletes(token):
+                if variant in self._phrases:
+                    candidates.add(variant)
+                candidates |= self._fuzzy.get(variant, set())
+        return candidates
+
+    def match(self, transcript: str, open_ids) -> dict[str, str]:
+        """
+        Map each open question answered by the transcript to the trigger that answered it.
+        """
+        tokens = tokenize(transcript)
+        answered: dict[str, str] = {}
+        open_ids = set(open_ids)
+        for start, token in enumerate(tokens):
+            for candidate in self._candidates(token):
+                for phrase, question_id, trigger in self._phrases.get(candidate, ()):
+                    if question_id not in open_ids or question_id in answered:
+                        continue
+                    if len(phrase) == 1 or tuple(tokens[start + 1:start + len(phrase)]) == phrase[1:]:
+                        answered[question_id] = trigger
+        return answered
+
+
+@dataclass
+class ReportSession:
+    claim_id: str
+    open_questions: list[str]
+    answers: dict[str, str] = field(default_factory=dict)
+    transcripts: list[str] = field(default_factory=list)
+    expires_at: float = 0.0
+
+
+class ReportSessionStore:
+    """
+    Report sessions keyed by claim ID, stored in SQLite so that every uvicorn
+    worker sees the same session and sessions survive restarts.
+
+    Sessions expire REPORT_SESSION_TTL seconds after their last recording; the
+    ones expiring first are deleted beyond REPORT_SESSION_MAX sessions. Recording
+    a transcript merges it into the stored session in one transaction, so two
+    recordings of the same claim handled by different workers both count.
+    """
+
+    def __init__(self, db_path: str, ttl: float = REPORT_SESSION_TTL, max_sessions: int = REPORT_SESSION_MAX):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _read(conn: sqlite3.Connection, claim_id: str, now: float) -> Optional[ReportSession]:
+        row = conn.execute(
+            "SELECT open_questions, answers, transcripts, expires_at FROM report_sessions "
+            "WHERE claim_id = ? AND expires_at > ?",
+            (claim_id, now),
+        ).fetchone()
+        if row is None:
+            return None
+        return ReportSession(claim_id, json.loads(row[0]), json.loads(row[1]), json.loads(row[2]), row[3])
+
+    @staticmethod
+    def _write(conn: sqlite3.Connection, session: ReportSession) -> None:
+        conn.execute(
+            "INSERT OR REPLACE INTO report_sessions (claim_id, open_questions, answers, transcripts, expires_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (
+                session.claim_id,
+                json.dumps(session.open_questions),
+                json.dumps(session.answers, ensure_ascii=False),
+                json.dumps(session.transcripts, ensure_ascii=False),
+                session.expires_at,
+            ),
+        )
+
+    def get_or_create(self, claim_id: Optional[str]) -> ReportSession:
+        now = time.time()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            session = self._read(conn, claim_id, now) if claim_id else None
+            if session is None:
+                session = ReportSession(
+                    claim_id=claim_id or uuid.uuid4().hex,
+                    open_questions=[question.id for question in IMPORTANT_QUESTIONS],
+                )
+            session.expires_at = now + self.ttl
+            self._write(conn, session)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        self._evict(conn, now)
+        return session
+
+    def _evict(self, conn: sqlite3.Connection, now: float) -> None:
+        with self._lock:
+            self._writes += 1
+            if self._writes % EVICTION_INTERVAL:
+                return
+        conn.execute("DELETE FROM report_sessions WHERE expires_at <= ?", (now,))
+        conn.execute(
+            "DELETE FROM report_sessions WHERE claim_id IN "
+            "(SELECT claim_id FROM report_sessions ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_sessions,),
+        )
+
+    def record(self, session: ReportSession, transcript: str, answered: dict[str, str]) -> None:
+        """
+        Add a transcript and the questions it answered to the stored session,
+        and refresh `session` with the merged state.
+        """
+        now = time.time()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            stored = self._read(conn, session.claim_id, now) or session
+            stored.transcripts.append(transcript)
+            del stored.transcripts[:-MAX_TRANSCRIPTS_PER_SESSION]
+            stored.answers.update(answered)
+            stored.open_questions = [question_id for question_id in stored.open_questions if question_id not in answered]
+            stored.expires_at = now + self.ttl
+            self._write(conn, stored)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        session.open_questions, session.answers = stored.open_questions, stored.answers
+        session.transcripts, session.expires_at = stored.transcripts, stored.expires_at
+
+    def __len__(self) -> int:
+        (count,) = self._connect().execute(
+            "SELECT COUNT(*) FROM report_sessions WHERE expires_at > ?", (time.time(),)
+        ).fetchone()
+        return count
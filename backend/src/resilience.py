@@ -0,0 +1,323 @@
+import os
+import sys
+import time
+import random
+import asyncio
+import threading
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, Awaitable, Callable, Optional
+import httpx
+
+# Retries of a failed call after the first attempt, with full-jitter exponential backoff
+LLM_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", "3"))
+LLM_RETRY_BASE_DELAY = float(os.environ.get("LLM_RETRY_BASE_DELAY", "0.5"))
+LLM_RETRY_MAX_DELAY = float(os.environ.get("LLM_RETRY_MAX_DELAY", "8"))
+# Fire a duplicate request when the first one is slower than the model's recent p95
+LLM_HEDGING = os.environ.get("LLM_HEDGING", "false").lower() == "true"
+HEDGE_MIN_SAMPLES = 20
+LATENCY_WINDOW = 200
+# Consecutive upstream failures that open a model's circuit, and how long it stays open
+CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_SECONDS = float(os.environ.get("CIRCUIT_RESET_SECONDS", "30"))
+
+RETRIABLE_STATUS = frozenset({408, 429, 500, 502, 503, 504})
+
+# Total seconds an endpoint may spend on Gemini, retries included (LLM_BUDGET_<ENDPOINT> overrides)
+DEFAULT_BUDGETS = {
+    "process_accident": 90,
+    "create_personalized_insurance": 90,
+    "analyze_vehicle_condition": 90,
+    "process_image": 45,
+    "process_image_for_insurance": 45,
+    "process_images": 90,
+}
+LATENCY_BUDGETS = {
+    endpoint: float(os.environ.get(f"LLM_BUDGET_{endpoint.upper()}", budget))
+    for endpoint, budget in DEFAULT_BUDGETS.items()
+}
+
+_deadline: ContextVar[Optional[float]] = ContextVar("llm_deadline", default=None)
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, model: str, retry_after: float):
+        super().__init__(f"Circuit open for {model}; retry in {retry_after:.0f}s.")
+        self.model = model
+        self.retry_after = retry_after
+
+
+@contextmanager
+def latency_budget(endpoint: str, requested: Optional[float] = None):
+    """
+    Bound every Gemini call made inside the block by the endpoint's latency
+    budget, or by the caller's `requested` budget when it is shorter.
+    """
+    budget = LATENCY_BUDGETS.get(endpoint)
+    if budget is None:
+        yield
+        return
+    if requested is not None and requested > 0:
+        budget = min(budget, requested)
+    token = _deadline.set(time.monotonic() + budget)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+class LatencyBudgetMiddleware:
+    """
+    ASGI middleware that runs each request inside its endpoint's latency budget;
+    /x and /x/stream share the budget of endpoint x, and callers may ask for a
+    shorter one with the X-Latency-Budget header.
+
+    Written as plain ASGI rather than with @app.middleware so the endpoint runs
+    in the same context and the budget also bounds the calls of streamed bodies.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        endpoint = scope["path"].strip("/").removesuffix("/stream")
+        requested = None
+        for name, value in scope["headers"]:
+            if name == b"x-latency-budget":
+                try:
+                    requested = float(value.decode("latin-1"))
+                except ValueError:
+                    requested = None
+        with latency_budget(endpoint, requested):
+            await self.app(scope, receive, send)
+
+
+def remaining(timeout: float) -> float:
+    """
+    Seconds the next attempt may take: `timeout`, capped by what is left of the budget.
+    """
+    deadline = _deadline.get()
+    if deadline is None:
+        return timeout
+    return min(timeout, deadline - time.monotonic())
+
+
+def is_retriable(e: Exception) -> bool:
+    # An API error can only have been raised once the SDK was imported; don't import it just to check
+    errors = sys.modules.get("google.genai.errors")
+    if errors is not None and isinstance(e, errors.APIError):
+        return e.code in RETRIABLE_STATUS
+    return isinstance(e, (TimeoutError, httpx.TransportError, ConnectionError))
+
+
+class LatencyTracker:
+    """
+    Sliding window of the latest successful call latencies.
+    """
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self._samples: deque[float] = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, q: float, min_samples: int = 1) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples or len(samples) < min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+class CircuitBreaker:
+    """
+    Opens after CIRCUIT_FAILURE_THRESHOLD consecutive upstream failures so calls
+    fail fast; after CIRCUIT_RESET_SECONDS calls are let through again (half-open)
+    and the first result closes the circuit or opens it for another period.
+    """
+
+    def __init__(self, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD, reset_seconds: float = CIRCUIT_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def check(self, model: str) -> None:
+        with self._lock:
+            if self.state != "open":
+                return
+            elapsed = time.monotonic() - self._opened_at
+            if elapsed < self.reset_seconds:
+                raise CircuitOpenError(model, self.reset_seconds - elapsed)
+            self.state = "half_open"
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                self.state = "open"
+                self._opened_at = time.monotonic()
+
+
+class ModelHealth:
+    def __init__(self):
+        self.breaker = CircuitBreaker()
+        self.latency = LatencyTracker()
+        self.counters = {"calls": 0, "retries": 0, "hedges": 0, "hedge_wins": 0, "short_circuits": 0, "degraded": 0}
+
+
+class Resilience:
+    """
+    Deadlines, retries, hedging and a circuit breaker around Gemini calls, tracked per model.
+    """
+
+    def __init__(self):
+        self._models: dict[str, ModelHealth] = {}
+        self._lock = threading.Lock()
+
+    def health(self, model: str) -> ModelHealth:
+        with self._lock:
+            return self._models.setdefault(model, ModelHealth())
+
+    def _count(self, health: ModelHealth, counter: str) -> None:
+        with self._lock:
+            health.counters[counter] += 1
+
+    def _check(self, model: str, health: ModelHealth) -> None:
+        try:
+            health.breaker.check(model)
+        except CircuitOpenError:
+            self._count(health, "short_circuits")
+            raise
+
+    async def _backoff(self, health: ModelHealth, retry: int, timeout: float, error: Exception) -> None:
+        """
+        Sleep before the next retry, or re-raise `error` if no retry is left or fits in the budget.
+        """
+        delay = random.uniform(0, min(LLM_RETRY_MAX_DELAY, LLM_RETRY_BASE_DELAY * 2 ** retry))
+        if retry >= LLM_MAX_RETRIES or remaining(timeout) <= delay:
+            raise error
+        self._count(health, "retries")
+        await asyncio.sleep(delay)
+
+    async def call(self, model: str, attempt: Callable[[float], Awaitable[str]], timeout: float) -> str:
+        """
+        Run `attempt(timeout)` until it succeeds, retrying retriable errors within
+        the latency budget. With LLM_HEDGING a second attempt races the first once
+        it outlives the model's p95 latency.
+        """
+        health = self.health(model)
+        self._count(health, "calls")
+        for retry in range(LLM_MAX_RETRIES + 1):
+            self._check(model, health)
+            budget = remaining(timeout)
+            if budget <= 0:
+                raise TimeoutError("Latency budget exhausted.")
+            started = time.monotonic()
+            try:
+                result = await self._hedged(health, attempt, budget)
+            except Exception as e:
+                if not is_retriable(e):
+                    # The upstream answered, so it is healthy even if the request was bad
+                    health.breaker.record_success()
+                    raise
+                health.breaker.record_failure()
+                await self._backoff(health, retry, timeout, e)
+                continue
+            health.breaker.record_success()
+            health.latency.record(time.monotonic() - started)
+            return result
+
+    async def _hedged(self, health: ModelHealth, attempt: Callable[[float], Awaitable[str]], budget: float) -> str:
+        hedge_after = health.latency.percentile(0.95, HEDGE_MIN_SAMPLES) if LLM_HEDGING else None
+        if hedge_after is None or hedge_after >= budget:
+            return await attempt(budget)
+
+        primary = asyncio.create_task(attempt(budget))
+        tasks = {primary}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+            if not done:
+                self._count(health, "hedges")
+                tasks.add(asyncio.create_task(attempt(budget - hedge_after)))
+            error: Optional[BaseException] = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self._count(health, "hedge_wins")
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            # Cancel the slower attempt (or both, if this call is cancelled)
+            for task in tasks:
+                task.cancel()
+
+    async def stream(self, model: str, open_stream: Callable[[float], AsyncIterator[str]], timeout: float) -> AsyncIterator[str]:
+        """
+        Forward a streamed answer, retrying retriable errors as long as no chunk
+        has been sent yet. Streams are never hedged.
+        """
+        health = self.health(model)
+        self._count(health, "calls")
+        for retry in range(LLM_MAX_RETRIES + 1):
+            self._check(model, health)
+            budget = remaining(timeout)
+            if budget <= 0:
+                raise TimeoutError("Latency budget exhausted.")
+            started = time.monotonic()
+            sent = False
+            try:
+                async for text in open_stream(budget):
+                    sent = True
+                    yield text
+            except Exception as e:
+                if not is_retriable(e):
+                    health.breaker.record_success()
+                    raise
+                health.breaker.record_failure()
+                if sent:
+                    raise
+                await self._backoff(health, retry, timeout, e)
+                continue
+            health.breaker.record_success()
+            health.latency.record(time.monotonic() - started)
+            return
+
+    def record_degraded(self, model: str) -> None:
+        self._count(self.health(model), "degraded")
+
+    def stats(self) -> dict:
+        with self._lock:
+            models = dict(self._models)
+        stats = {}
+        for model, health in models.items():
+            with self._lock:
+                counters = dict(health.counters)
+            stats[model] = {
+                "circuit": health.breaker.state,
+                "consecutive_failures": health.breaker.failures,
+                "p50_seconds": health.latency.percentile(0.5),
+                "p95_seconds": health.latency.percentile(0.95),
+                **counters,
+            }
+        return stats
+
+
+resilience = Resilience()
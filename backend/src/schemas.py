@@ -0,0 +1,83 @@
+from typing import Optional
+from pydantic import BaseModel, ValidationError, create_model
+
+# Response models passed to Gemini as `response_schema`. Fields have no defaults:
+# the Gemini schema format does not support them, and every field is required.
+
+
+class InvalidResponseError(ValueError):
+    """
+    A model's answer cannot be parsed as JSON or does not match its response schema.
+    """
+
+
+class DamageEvaluation(BaseModel):
+    daños_vehiculo: list[str]
+    daños_terceros: list[str]
+
+
+class DamageAssessment(BaseModel):
+    modelo_tractor: str
+    evaluacion_daños: DamageEvaluation
+    analisis_incidente: str
+    recomendaciones_seguro: list[str]
+
+
+class InsuranceCreationData(BaseModel):
+    """
+    The InsuranceData fields that can be read from a photo, plus whether a tractor is in it.
+    """
+    modelo_tractor: str
+    condicion: str
+    color: str
+    año: int
+    descripcion_adicional: str
+    hay_tractor: bool
+
+
+class CoverageItem(BaseModel):
+    item: str
+    is_covered: bool
+    explanation: str
+
+
+class CoverageAnalysis(BaseModel):
+    coverage_analysis: list[CoverageItem]
+
+
+def invalid_fields(schema: type[BaseModel], data: dict) -> list[str]:
+    """
+    Top-level fields of `schema` that are missing from `data` or fail validation.
+    """
+    try:
+        schema.model_validate(data)
+        return []
+    except ValidationError as e:
+        fields = []
+        for error in e.errors():
+            field = error["loc"][0] if error["loc"] else None
+            if not isinstance(field, str):
+                # An error not tied to a field (the answer is not an object) invalidates it all
+                return list(schema.model_fields)
+            if field not in fields:
+                fields.append(field)
+        return fields
+
+
+def partial_schema(schema: type[BaseModel], fields: list[str]) -> type[BaseModel]:
+    """
+    Response model with only `fields` of `schema`, to re-ask for just those.
+    """
+    return create_model(
+        f"{schema.__name__}Partial",
+        **{field: (schema.model_fields[field].annotation, ...) for field in fields},
+    )
+
+
+def validate(schema: type[BaseModel], data: Optional[dict]) -> dict:
+    """
+    Validate an answer against `schema` and return it as a plain dict.
+
+    Raises pydantic's ValidationError, a ValueError, when it does not match.
+    """
+    return schema.model_validate(data).model_dump()
@@ -0,0 +1,230 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from typing import Iterator, Optional
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS insurances (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at REAL NOT NULL,
+    modelo_tractor TEXT NOT NULL,
+    anio INTEGER NOT NULL,
+    garaje INTEGER NOT NULL,
+    lat REAL,
+    lon REAL,
+    municipio TEXT,
+    municipio_approximate INTEGER NOT NULL DEFAULT 0,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_insurances_modelo ON insurances (modelo_tractor);
+CREATE INDEX IF NOT EXISTS idx_insurances_anio ON insurances (anio);
+CREATE INDEX IF NOT EXISTS idx_insurances_garaje ON insurances (garaje);
+CREATE INDEX IF NOT EXISTS idx_insurances_lat_lon ON insurances (lat, lon);
+"""
+# Applied after SCHEMA, once the columns added since the first release exist
+INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_insurances_municipio ON insurances (municipio);
+"""
+
+
+class InsuranceStore:
+    """
+    Insurance store backed by SQLite in WAL mode.
+
+    Every save is a single INSERT (O(1)) inside a transaction, so a crash mid-write
+    never corrupts the store and several uvicorn workers can write concurrently
+    without losing records. The filterable fields (`modelo_tractor`, `año`, `garaje`)
+    have secondary indexes, as does the INE `municipio` code of records that carry one;
+    `municipio_approximate` marks the codes geocoded from the coordinates.
+    """
+
+    def __init__(self, db_path: str, legacy_json_path: Optional[str] = None):
+        self.db_path = db_path
+        self.legacy_json_path = legacy_json_path
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._initialized = False
+
+    def _connect(self) -> sqlite3.Connection:
+        # One connection per thread: sync FastAPI endpoints run in a threadpool
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=FULL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            self._local.conn = conn
+        if not self._initialized:
+            self._initialize(conn)
+        return conn
+
+    def _initialize(self, conn: sqlite3.Connection) -> None:
+        with self._init_lock:
+            if self._initialized:
+                return
+            conn.executescript(SCHEMA)
+            self._migrate(conn)
+            conn.executescript(INDEXES)
+            self._import_legacy_json(conn)
+            self._initialized = True
+
+    @staticmethod
+    def _migrate(conn: sqlite3.Connection) -> None:
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(insurances)")}
+        if "municipio" not in columns:
+            conn.execute("ALTER TABLE insurances ADD COLUMN municipio TEXT")
+        if "municipio_approximate" not in columns:
+            conn.execute("ALTER TABLE insurances ADD COLUMN municipio_approximate INTEGER NOT NULL DEFAULT 0")
+
+    def _import_legacy_json(self, conn: sqlite3.Connection) -> None:
+        """
+        One-time migration of the legacy insurances.json when the store is empty.
+        """
+        if not self.legacy_json_path or not os.path.exists(self.legacy_json_path):
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            (count,) = conn.execute("SELECT COUNT(*) FROM insurances").fetchone()
+            if count == 0:
+                with open(self.legacy_json_path, "r", encoding="utf-8") as file:
+                    legacy = json.load(file)
+                for record in legacy:
+                    self._insert(conn, record)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    @staticmethod
+    def _insert(conn: sqlite3.Connection, record: dict) -> int:
+        coordinates = record.get("coordinates") or (None, None)
+        cursor = conn.execute(
+            "INSERT INTO insurances (created_at, modelo_tractor, anio, garaje, lat, lon, municipio, municipio_approximate, data) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                time.time(),
+                record["modelo_tractor"],
+                int(record["año"]),
+                int(bool(record["garaje"])),
+                coordinates[0],
+                coordinates[1],
+                record.get("municipio"),
+                int(bool(record.get("municipio_approximate"))),
+                json.dumps(record, ensure_ascii=False),
+            ),
+        )
+        return cursor.lastrowid
+
+    def append(self, record: dict) -> int:
+        """
+        Append a record and return its ID.
+        """
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            record_id = self._insert(conn, record)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return record_id
+
+    def get(self, record_id: int) -> Optional[dict]:
+        row = self._connect().execute(
+            "SELECT id, data FROM insurances WHERE id = ?", (record_id,)
+        ).fetchone()
+        return self._row_to_record(row) if row else None
+
+    def query(
+        self,
+        after_id: Optional[int] = None,
+        limit: Optional[int] = None,
+        modelo: Optional[str] = None,
+        año_min: Optional[int] = None,
+        año_max: Optional[int] = None,
+        garaje: Optional[bool] = None,
+        bbox: Optional[tuple[float, float, float, float]] = None,
+        municipio: Optional[str] = None,
+        municipio_exact: bool = False,
+    ) -> list[dict]:
+        """
+        Return one page of records in ID order, filtered server-side.
+
+        `after_id` is the keyset cursor (the last ID of the previous page) and
+        `bbox` is (min_lat, min_lon, max_lat, max_lon). With `municipio_exact` the
+        records whose `municipio` was geocoded are left out.
+        """
+        clauses, params = [], []
+        if after_id is not None:
+            clauses.append("id > ?")
+            params.append(after_id)
+        if modelo is not None:
+            clauses.append("modelo_tractor = ?")
+            params.append(modelo)
+        if año_min is not None:
+            clauses.append("anio >= ?")
+            params.append(año_min)
+        if año_max is not None:
+            clauses.append("anio <= ?")
+            params.append(año_max)
+        if garaje is not None:
+            clauses.append("garaje = ?")
+            params.append(int(garaje))
+        if bbox is not None:
+            min_lat, min_lon, max_lat, max_lon = bbox
+            clauses.append("lat BETWEEN ? AND ? AND lon BETWEEN ? AND ?")
+            params.extend([min_lat, max_lat, min_lon, max_lon])
+        if municipio is not None:
+            clauses.append("municipio = ?")
+            params.append(municipio)
+        if municipio_exact:
+            clauses.append("municipio_approximate = 0")
+
+        sql = "SELECT id, data FROM insurances"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY id"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+
+        rows = self._connect().execute(sql, params).fetchall()
+        return [self._row_to_record(row) for row in rows]
+
+    def iter_records(self, batch_size: int = 500, **filters) -> Iterator[dict]:
+        """
+        Iterate over matching records in ID order, fetching them in keyset batches
+        so memory stays bounded however large the store grows.
+        """
+        after_id = filters.pop("after_id", None)
+        limit = filters.pop("limit", None)
+        remaining = limit
+        while remaining is None or remaining > 0:
+            size = batch_size if remaining is None else min(batch_size, remaining)
+            page = self.query(after_id=after_id, limit=size, **filters)
+            yield from page
+            if len(page) < size:
+                return
+            after_id = page[-1]["id"]
+            if remaining is not None:
+                remaining -= len(page)
+
+    def version(self) -> int:
+        """
+        Monotonic version of the store contents.
+
+        The store is append-only, so the last assigned ID changes exactly when
+        the contents do; reading it from `sqlite_sequence` is O(1).
+        """
+        row = self._connect().execute(
+            "SELECT seq FROM sqlite_sequence WHERE name = 'insurances'"
+        ).fetchone()
+        return row[0] if row else 0
+
+    @staticmethod
+    def _row_to_record(row) -> dict:
+        record = json.loads(row[1])
+        record["id"] = row[0]
+        return record
@@ -0,0 +1,157 @@
+import json
+import inspect
+from typing import AsyncIterator, Awaitable, Callable, Optional, Union
+from fastapi.responses import StreamingResponse
+from src.json_repair import loads, parse_json
+from src.telemetry import log_event, span
+
+
+class JSONFieldStream:
+    """
+    Incremental parser for a streamed top-level JSON object.
+
+    Text is fed in arbitrary chunks; as soon as a top-level field is closed a
+    `field` event is emitted, and every element of a top-level array (such as
+    each `coverage_analysis` item) is emitted as an `item` event the moment it
+    closes, without waiting for the rest of the document.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._pos = 0
+        self._stack: list[str] = []
+        self._in_string = False
+        self._escape = False
+        self._key: Optional[str] = None
+        self._key_start: Optional[int] = None
+        self._after_colon = False
+        self._value_start: Optional[int] = None
+        self._item_start: Optional[int] = None
+        self._item_index = 0
+
+    def feed(self, text: str) -> list[dict]:
+        self._buffer += text
+        events: list[dict] = []
+        while self._pos < len(self._buffer):
+            i = self._pos
+            self._pos += 1
+            self._scan(i, self._buffer[i], events)
+        return events
+
+    def _in_top_level_array(self) -> bool:
+        return len(self._stack) == 2 and self._stack[1] == "["
+
+    def _scan(self, i: int, ch: str, events: list[dict]) -> None:
+        if self._in_string:
+            if self._escape:
+                self._escape = False
+            elif ch == "\\":
+                self._escape = True
+            elif ch == '"':
+                self._in_string = False
+                if self._key_start is not None:
+                    self._key = loads(self._buffer[self._key_start:i + 1])
+                    self._key_start = None
+            return
+        if ch.isspace():
+            return
+
+        depth = len(self._stack)
+        # Mark where the current top-level value or array element begins
+        if depth == 1 and self._after_colon and self._value_start is None and ch not in ",}":
+            self._value_start = i
+        if self._in_top_level_array() and self._item_start is None and ch not in ",]":
+            self._item_start = i
+
+        if ch == '"':
+            self._in_string = True
+            if depth == 1 and not self._after_colon:
+                self._key_start = i
+        elif ch in "{[":
+            self._stack.append(ch)
+        elif ch in "}]":
+            if self._in_top_level_array() and self._item_start is not None:
+                # A scalar element closed by the end of the array
+                self._emit_item(self._buffer[self._item_start:i], events)
+            if depth == 1 and self._value_start is not None:
+                # A scalar field closed by the end of the object
+                self._emit_field(self._buffer[self._value_start:i], events)
+            self._stack.pop()
+            if self._in_top_level_array() and self._item_start is not None:
+                self._emit_item(self._buffer[self._item_start:i + 1], events)
+            elif len(self._stack) == 1 and self._value_start is not None:
+                self._emit_field(self._buffer[self._value_start:i + 1], events)
+        elif ch == ":" and depth == 1:
+            self._after_colon = True
+        elif ch == ",":
+            if depth == 1 and self._value_start is not None:
+                self._emit_field(self._buffer[self._value_start:i], events)
+            elif self._in_top_level_array() and self._item_start is not None:
+                self._emit_item(self._buffer[self._item_start:i], events)
+
+    def _emit_item(self, raw: str, events: list[dict]) -> None:
+        events.append({"event": "item", "field": self._key, "index": self._item_index, "value": loads(raw)})
+        self._item_index += 1
+        self._item_start = None
+
+    def _emit_field(self, raw: str, events: list[dict]) -> None:
+        events.append({"event": "field", "field": self._key, "value": loads(raw)})
+        self._key = None
+        self._after_colon = False
+        self._value_start = None
+        self._item_index = 0
+
+
+async def single_chunk(text: str) -> AsyncIterator[str]:
+    """
+    Wrap an already complete answer as a one-chunk stream.
+    """
+    yield text
+
+
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def sse_response(
+    chunks: AsyncIterator[str],
+    error_detail: str,
+    context: Optional[dict] = None,
+    on_result: Optional[Callable[[dict], Union[dict, Awaitable[dict]]]] = None,
+) -> StreamingResponse:
+    """
+    Forward a streamed Gemini JSON answer as server-sent events.
+
+    Events: `context` (request echo), `chunk` (raw text as it arrives), `item` and
+    `field` (completed JSON values), then `result` with the full parsed document,
+    or `error` if the call or the final parse fails. `on_result` is given the
+    parsed document and returns (or, if async, resolves to) the `result` to send.
+    """
+    async def events():
+        if context is not None:
+            yield sse_event("context", context)
+        parser = JSONFieldStream()
+        response_text = ""
+        try:
+            async for chunk in chunks:
+                response_text += chunk
+                yield sse_event("chunk", {"text": chunk})
+                for event in parser.feed(chunk):
+                    yield sse_event(event.pop("event"), event)
+            # A truncated or trailing-garbage answer is repaired rather than failed
+            with span("json_parse"):
+                result = parse_json(response_text)[0]
+            if on_result is not None:
+                result = on_result(result)
+                if inspect.isawaitable(result):
+                    result = await result
+            yield sse_event("result", result)
+        except Exception as e:
+            log_event("stream_failed", level="error", error=str(e))
+            yield sse_event("error", {"detail": error_detail})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,300 @@
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Optional
+from starlette.datastructures import MutableHeaders
+from starlette.routing import Match
+
+# Fraction of requests whose info/debug logs are emitted; warnings and errors are always logged
+LOG_SAMPLE_RATE = float(os.environ.get("LOG_SAMPLE_RATE", "0.01"))
+# Request header that asks for a per-stage timing breakdown in the response
+PROFILE_HEADER = "x-profile"
+
+# Distinct (method, path) pairs whose route is remembered, so each lookup is a dict hit
+ROUTE_CACHE_SIZE = 4096
+
+# Histogram buckets, in seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+LEVELS = {"debug": logging.DEBUG, "info": logging.INFO, "warning": logging.WARNING, "error": logging.ERROR}
+
+logger = logging.getLogger("backend")
+if not logger.handlers:
+    _handler = logging.StreamHandler(sys.stderr)
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+
+
+class RequestTrace:
+    """
+    Stages timed while serving one request, and whether its logs are sampled.
+    """
+
+    def __init__(self, endpoint: str, profile: bool = False):
+        self._request_id: Optional[str] = None
+        self.endpoint = endpoint
+        self.profile = profile
+        self.sampled = profile or random.random() < LOG_SAMPLE_RATE
+        self.spans: list[tuple[str, float]] = []
+
+    @property
+    def request_id(self) -> str:
+        # Only generated for requests that log or are profiled
+        if self._request_id is None:
+            self._request_id = uuid.uuid4().hex[:16]
+        return self._request_id
+
+    def server_timing(self, total: float) -> str:
+        """
+        Stage breakdown as a Server-Timing header value, durations in milliseconds.
+        """
+        totals: dict[str, float] = {}
+        for stage, seconds in self.spans:
+            totals[stage] = totals.get(stage, 0.0) + seconds
+        entries = [f"{stage};dur={seconds * 1000:.2f}" for stage, seconds in totals.items()]
+        entries.append(f"total;dur={total * 1000:.2f}")
+        return ", ".join(entries)
+
+
+_trace: ContextVar[Optional[RequestTrace]] = ContextVar("request_trace", default=None)
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += value
+
+
+class Metrics:
+    """
+    In-process histograms and counters, rendered in the Prometheus text format.
+
+    Each uvicorn worker keeps its own; scrape them per worker or aggregate them
+    in Prometheus.
+    """
+
+    def __init__(self):
+        self._stages: dict[tuple[str, str], Histogram] = {}
+        self._requests: dict[str, Histogram] = {}
+        self._responses: dict[tuple[str, int], int] = {}
+        self._collectors: list[Callable[[], list[tuple[str, str, str, list[tuple[dict, float]]]]]] = []
+        self._lock = threading.Lock()
+
+    def observe_stage(self, endpoint: str, stage: str, seconds: float) -> None:
+        with self._lock:
+            histogram = self._stages.get((endpoint, stage))
+            if histogram is None:
+                histogram = self._stages[(endpoint, stage)] = Histogram()
+            histogram.observe(seconds)
+
+    def observe_request(self, endpoint: str, status: int, seconds: float) -> None:
+        with self._lock:
+            histogram = self._requests.get(endpoint)
+            if histogram is None:
+                histogram = self._requests[endpoint] = Histogram()
+            histogram.observe(seconds)
+            self._responses[(endpoint, status)] = self._responses.get((endpoint, status), 0) + 1
+
+    def register_collector(self, collector: Callable[[], list[tuple[str, str, str, list[tuple[dict, float]]]]]) -> None:
+        """
+        Add metrics computed at scrape time: `collector()` returns
+        (name, type, help, [(labels, value)]) tuples.
+        """
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        with self._lock:
+            stages = {key: (list(h.counts), h.sum) for key, h in self._stages.items()}
+            requests = {key: (list(h.counts), h.sum) for key, h in self._requests.items()}
+            responses = dict(self._responses)
+
+        lines = [
+            "# HELP backend_stage_seconds Time spent in each stage of a request.",
+            "# TYPE backend_stage_seconds histogram",
+        ]
+        for (endpoint, stage), histogram in sorted(stages.items()):
+            lines.extend(_histogram_lines("backend_stage_seconds", {"endpoint": endpoint, "stage": stage}, *histogram))
+        lines.append("# HELP backend_request_seconds Time until the whole response was sent, per endpoint.")
+        lines.append("# TYPE backend_request_seconds histogram")
+        for endpoint, histogram in sorted(requests.items()):
+            lines.extend(_histogram_lines("backend_request_seconds", {"endpoint": endpoint}, *histogram))
+        lines.append("# HELP backend_responses_total Responses sent, per endpoint and status code.")
+        lines.append("# TYPE backend_responses_total counter")
+        for (endpoint, status), count in sorted(responses.items()):
+            lines.append(f"backend_responses_total{_labels({'endpoint': endpoint, 'status': str(status)})} {count}")
+
+        for collector in self._collectors:
+            for name, kind, help_text, samples in collector():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                lines.extend(f"{name}{_labels(labels)} {_number(value)}" for labels, value in samples)
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(str(value))}"' for key, value in labels.items()) + "}"
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _histogram_lines(name: str, labels: dict, counts: list[int], total: float) -> list[str]:
+    lines = []
+    cumulative = 0
+    for bound, count in zip(BUCKETS + (float("inf"),), counts):
+        cumulative += count
+        le = "+Inf" if bound == float("inf") else repr(bound)
+        lines.append(f"{name}_bucket{_labels({**labels, 'le': le})} {cumulative}")
+    lines.append(f"{name}_sum{_labels(labels)} {repr(total)}")
+    lines.append(f"{name}_count{_labels(labels)} {cumulative}")
+    return lines
+
+
+metrics = Metrics()
+
+
+def start_request(endpoint: str, profile: bool = False):
+    """
+    Start tracing a request; returns the trace and the token to pass to `end_request`.
+    """
+    trace = RequestTrace(endpoint, profile)
+    return trace, _trace.set(trace)
+
+
+def end_request(trace: RequestTrace, token, status: int, seconds: float) -> None:
+    _trace.reset(token)
+    metrics.observe_request(trace.endpoint, status, seconds)
+
+
+def current_trace() -> Optional[RequestTrace]:
+    return _trace.get()
+
+
+def record(stage: str, seconds: float) -> None:
+    """
+    Record a stage measured by the caller, e.g. an LLM time-to-first-chunk.
+
+    Work outside a request (queued jobs, start-up) is recorded under the `background` endpoint.
+    """
+    trace = _trace.get()
+    metrics.observe_stage(trace.endpoint if trace else "background", stage, seconds)
+    if trace is not None:
+        trace.spans.append((stage, seconds))
+
+
+@contextmanager
+def span(stage: str):
+    """
+    Time the enclosed block as `stage` of the current request.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - started)
+
+
+def log_event(event: str, level: str = "info", always: bool = False, **fields) -> None:
+    """
+    Emit a structured JSON log line.
+
+    Info and debug events are only written for sampled requests (LOG_SAMPLE_RATE,
+    or every request with the profiling header) unless `always` is set, as for
+    rare lifecycle events; warnings and errors always are.
+    """
+    severity = LEVELS[level]
+    trace = _trace.get()
+    if severity < logging.WARNING and not always:
+        sampled = trace.sampled if trace is not None else random.random() < LOG_SAMPLE_RATE
+        if not sampled:
+            return
+    record_fields = {"ts": round(time.time(), 3), "level": level, "event": event}
+    if trace is not None:
+        record_fields["endpoint"] = trace.endpoint
+        record_fields["request_id"] = trace.request_id
+    record_fields.update(fields)
+    logger.log(severity, json.dumps(record_fields, ensure_ascii=False, default=str))
+
+
+class TelemetryMiddleware:
+    """
+    ASGI middleware that traces every HTTP request: request latency and status
+    per route, and with the profiling header a Server-Timing breakdown of the
+    stages finished before the response headers were sent.
+
+    Written as plain ASGI rather than with @app.middleware so the endpoint runs
+    in the same task and streamed bodies stay inside the request's trace.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._routes: dict[tuple[str, str], str] = {}
+
+    def _endpoint(self, scope) -> str:
+        """
+        Route template of the request (/jobs/{job_id}), not its raw path, to bound the metric series.
+        """
+        key = (scope["method"], scope["path"])
+        endpoint = self._routes.get(key)
+        if endpoint is None:
+            endpoint = "unmatched"
+            for route in scope["app"].router.routes:
+                if route.matches(scope)[0] == Match.FULL:
+                    endpoint = route.path
+                    break
+            if len(self._routes) < ROUTE_CACHE_SIZE:
+                self._routes[key] = endpoint
+        return endpoint
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        endpoint = self._endpoint(scope)
+        profile = False
+        for name, value in scope["headers"]:
+            if name == PROFILE_HEADER.encode("latin-1"):
+                profile = value.decode("latin-1").lower() in ("1", "true")
+        trace, token = start_request(endpoint, profile)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if profile:
+                    headers = MutableHeaders(scope=message)
+                    headers["Server-Timing"] = trace.server_timing(time.perf_counter() - started)
+                    headers["X-Request-Id"] = trace.request_id
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            end_request(trace, token, status, time.perf_counter() - started)
@@ -0,0 +1,52 @@
+import re
+import unicodedata
+
+# Frequent Spanish function words that carry no meaning for matching
+STOPWORDS = {
+    "a", "al", "ante", "con", "como", "cual", "de", "del", "desde", "donde", "el", "ella", "en", "entre",
+    "era", "es", "esta", "este", "esto", "fue", "ha", "han", "hay", "la", "las", "le", "les", "lo", "los",
+    "mas", "me", "mi", "muy", "no", "nos", "o", "para", "pero", "por", "que", "se", "si", "sin", "sobre",
+    "su", "sus", "tambien", "un", "una", "uno", "unos", "unas", "y", "ya",
+}
+
+# Longest suffixes first so the most specific one is removed
+SUFFIXES = (
+    "amientos", "imientos", "amiento", "imiento", "aciones", "iciones", "acion", "icion", "mente",
+    "adas", "ados", "idas", "idos", "ada", "ado", "ida", "ido", "ar", "er", "ir", "es", "os", "as",
+    "s", "a", "o", "e",
+)
+MIN_STEM_LENGTH = 3
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9ñ]+")
+
+
+def fold_accents(text: str) -> str:
+    """
+    Lowercase and strip diacritics, keeping the ñ ("lunas", "Lúnas" -> "lunas").
+    """
+    text = text.casefold().replace("ñ", "\0")
+    decomposed = unicodedata.normalize("NFKD", text)
+    folded = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return folded.replace("\0", "ñ")
+
+
+def stem(token: str) -> str:
+    """
+    Light Spanish stemmer: removes one gender, number or common verb/noun suffix
+    ("robado", "robo", "robar" -> "rob").
+    """
+    for suffix in SUFFIXES:
+        if token.endswith(suffix) and len(token) - len(suffix) >= MIN_STEM_LENGTH:
+            return token[: -len(suffix)]
+    return token
+
+
+def tokenize(text: str, keep: frozenset = frozenset()) -> list[str]:
+    """
+    Accent-folded, stemmed tokens of `text` without stopwords, except those in `keep`.
+    """
+    return [
+        stem(token)
+        for token in TOKEN_PATTERN.findall(fold_accents(text))
+        if token not in STOPWORDS or token in keep
+    ]
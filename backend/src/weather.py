@@ -0,0 +1,435 @@
+import os
+import json
+import time
+import asyncio
+import sqlite3
+import threading
+from datetime import date, datetime, timedelta, timezone
+from typing import TYPE_CHECKING, Optional
+from src.geocoder import ReverseGeocoder
+from src.telemetry import log_event, span
+
+if TYPE_CHECKING:
+    import httpx
+
+AEMET_API_KEY = os.environ.get("AEMET_API_KEY", "")
+AEMET_BASE_URL = os.environ.get("AEMET_BASE_URL", "https://opendata.aemet.es/opendata/api").rstrip("/")
+AEMET_TIMEOUT = float(os.environ.get("AEMET_TIMEOUT", "15"))
+# Connections kept open to AEMET, shared by the bulk prefetch and the per-day fetches
+AEMET_MAX_CONNECTIONS = 4
+
+# Seconds between bulk downloads of the last 24 hours of observations of every station (0 disables them)
+WEATHER_PREFETCH_INTERVAL = float(os.environ.get("WEATHER_PREFETCH_INTERVAL", "1800"))
+# Least seconds between bulk downloads started by cache misses on recent days
+WEATHER_PREFETCH_COOLDOWN = float(os.environ.get("WEATHER_PREFETCH_COOLDOWN", "300"))
+# How long a cached station-day is served: recent days still receive observations, older ones are final
+WEATHER_RECENT_TTL = float(os.environ.get("WEATHER_RECENT_TTL", "3600"))
+WEATHER_PAST_TTL = float(os.environ.get("WEATHER_PAST_TTL", str(30 * 86400)))
+# Farthest station whose observations are taken as the weather at a claim's location
+WEATHER_STATION_MAX_KM = float(os.environ.get("WEATHER_STATION_MAX_KM", "50"))
+# Days before today that the bulk observations still cover; older days come from the daily climatology
+RECENT_DAYS = 1
+# Station-days fetched from AEMET at once on cache misses, to stay within its rate limit
+FETCH_CONCURRENCY = 2
+
+OBSERVATIONS_PATH = "observacion/convencional/todas"
+CLIMATOLOGY_PATH = "valores/climatologicos/diarios/datos/fechaini/{day}T00:00:00UTC/fechafin/{day}T23:59:59UTC/estacion/{idema}"
+# Hourly observation fields kept per station-day
+HOURLY_FIELDS = ("ta", "tamax", "tamin", "prec", "vv", "vmax", "hr")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS stations (
+    idema TEXT PRIMARY KEY,
+    name TEXT,
+    lat REAL NOT NULL,
+    lon REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS station_days (
+    idema TEXT NOT NULL,
+    day TEXT NOT NULL,
+    source TEXT NOT NULL,
+    data TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    PRIMARY KEY (idema, day)
+);
+"""
+
+
+class AemetError(Exception):
+    """
+    AEMET answered a request with an error status, such as 404 when it has no data or 429 when rate limited.
+    """
+
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+
+def number(value) -> Optional[float]:
+    """
+    A numeric AEMET value: climatology values are strings with a decimal comma,
+    and "Ip" is a trace of precipitation.
+    """
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = str(value).strip().replace(",", ".")
+    if text == "Ip":
+        return 0.0
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+class AemetClient:
+    """
+    AEMET OpenData client over one pooled HTTP connection set.
+
+    Every AEMET request takes two steps: the API answers with an envelope
+    holding a `datos` URL, and the data itself is downloaded from there.
+    """
+
+    def __init__(self, base_url: str = AEMET_BASE_URL, api_key: str = AEMET_API_KEY, timeout: float = AEMET_TIMEOUT):
+        self.base_url = base_url
+        self.api_key = api_key
+        self.timeout = timeout
+        self._client: Optional["httpx.AsyncClient"] = None
+        self.counters = {"requests": 0, "errors": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.api_key)
+
+    def _http(self) -> "httpx.AsyncClient":
+        if self._client is None:
+            # Imported on first use, like the other HTTP SDKs, to keep start-up fast
+            import httpx
+
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                headers={"api_key": self.api_key, "Accept": "application/json"},
+                limits=httpx.Limits(max_connections=AEMET_MAX_CONNECTIONS, max_keepalive_connections=AEMET_MAX_CONNECTIONS),
+            )
+        return self._client
+
+    async def fetch(self, path: str):
+        """
+        The data behind an AEMET API path, following its `datos` URL.
+        """
+        client = self._http()
+        self.counters["requests"] += 1
+        try:
+            response = await client.get(f"{self.base_url}/{path}")
+            envelope = response.json()
+            status = envelope.get("estado", response.status_code)
+            if status != 200 or "datos" not in envelope:
+                raise AemetError(f"AEMET {path}: {status} {envelope.get('descripcion', '')}".strip(), status)
+            data = await client.get(envelope["datos"])
+            data.raise_for_status()
+            # The data files are served in Latin-9 and do not always say so
+            return json.loads(data.content.decode(data.charset_encoding or "iso-8859-15"))
+        except Exception:
+            self.counters["errors"] += 1
+            raise
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+def summarize_hours(hours: dict[str, dict]) -> dict:
+    """
+    Daily summary of the hourly observations of a station-day.
+    """
+    def values(*fields):
+        return [value for hour in hours.values() for field in fields if (value := hour.get(field)) is not None]
+
+    temperatures_max, temperatures_min = values("tamax", "ta"), values("tamin", "ta")
+    winds, gusts, humidity, precipitation = values("vv"), values("vmax"), values("hr"), values("prec")
+    return {
+        "hours_observed": len(hours),
+        "temp_max_c": max(temperatures_max) if temperatures_max else None,
+        "temp_min_c": min(temperatures_min) if temperatures_min else None,
+        "precipitation_mm": round(sum(precipitation), 1) if precipitation else None,
+        "wind_mean_ms": round(sum(winds) / len(winds), 1) if winds else None,
+        "gust_max_ms": max(gusts) if gusts else None,
+        "humidity_mean_pct": round(sum(humidity) / len(humidity)) if humidity else None,
+    }
+
+
+def summarize_daily(record: dict) -> dict:
+    """
+    The same summary from a daily climatology record.
+    """
+    return {
+        "hours_observed": 24,
+        "temp_max_c": number(record.get("tmax")),
+        "temp_min_c": number(record.get("tmin")),
+        "precipitation_mm": number(record.get("prec")),
+        "wind_mean_ms": number(record.get("velmedia")),
+        "gust_max_ms": number(record.get("racha")),
+        "humidity_mean_pct": number(record.get("hrMedia")),
+    }
+
+
+class WeatherService:
+    """
+    Weather at a claim's place and date, from the nearest AEMET station, for
+    use as evidence while processing the claim.
+
+    Observations are cached in SQLite per (station, day) with a TTL: the last
+    24 hours of every station are bulk-downloaded every
+    WEATHER_PREFETCH_INTERVAL seconds, and older days are fetched from the
+    daily climatology the first time a claim asks for them. Lookups only read
+    the cache and never wait for AEMET: a missing or stale station-day is
+    fetched in the background and reported as `pending` meanwhile.
+
+    The station list is learnt from the bulk observations and indexed like the
+    municipality centroids.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        client: Optional[AemetClient] = None,
+        prefetch_interval: float = WEATHER_PREFETCH_INTERVAL,
+        max_km: float = WEATHER_STATION_MAX_KM,
+        prefetch_cooldown: float = WEATHER_PREFETCH_COOLDOWN,
+    ):
+        self.db_path = db_path
+        self.client = client or AemetClient()
+        self.prefetch_interval = prefetch_interval
+        self.prefetch_cooldown = prefetch_cooldown
+        self.stations = ReverseGeocoder(None, max_km=max_km, cell_degrees=0.5)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._fetches: dict[tuple[str, str], asyncio.Task] = {}
+        self._prefetch: Optional[asyncio.Task] = None
+        self._prefetch_started: Optional[float] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.last_prefetch: dict = {}
+        self.counters = {"lookups": 0, "hits": 0, "stale": 0, "misses": 0, "no_station": 0, "fetches": 0, "fetch_errors": 0, "prefetches": 0, "prefetches_throttled": 0}
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def load(self) -> None:
+        """
+        Index the stations already known, so lookups work before the first prefetch.
+        """
+        rows = self._connect().execute("SELECT idema, name, lat, lon FROM stations").fetchall()
+        self.stations.index((idema, name or idema, lat, lon) for idema, name, lat, lon in rows)
+
+    def _ttl(self, day: str) -> float:
+        recent = (datetime.now(timezone.utc).date() - timedelta(days=RECENT_DAYS)).isoformat()
+        return WEATHER_RECENT_TTL if day >= recent else WEATHER_PAST_TTL
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            self.counters[counter] += 1
+
+    async def context(self, lat: float, lon: float, day: date) -> dict:
+        """
+        Cached weather of `day` at the station nearest to (lat, lon). `status`
+        is `ok`, `pending` (being fetched; stale data is returned if there is
+        any), `unavailable` (AEMET has no data for it, or no API key is set) or
+        `no_station`.
+        """
+        self._count("lookups")
+        station = self.stations.lookup(lat, lon)
+        if station is None:
+            self._count("no_station")
+            return {"status": "no_station", "day": day.isoformat()}
+
+        idema, key = station["code"], day.isoformat()
+        with span("weather_lookup"):
+            row = await asyncio.to_thread(self._read, idema, key)
+        context = {
+            "day": key,
+            "station": {"idema": idema, "name": station["name"], "distance_km": station["distance_km"]},
+        }
+        if row is not None:
+            source, data, fetched_at = row
+            data = json.loads(data)
+            if source == "observations":
+                context.update(summarize_hours(data["hours"]))
+            elif source == "climatology":
+                context.update(data["summary"])
+            context.update(source=source, fetched_at=fetched_at)
+            if time.time() - fetched_at < self._ttl(key):
+                self._count("hits")
+                context["status"] = "ok" if source != "none" else "unavailable"
+                return context
+            self._count("stale")
+        else:
+            self._count("misses")
+        self._schedule(idema, key)
+        context["status"] = "pending" if self.client.enabled else "unavailable"
+        return context
+
+    def _read(self, idema: str, day: str) -> Optional[tuple]:
+        return self._connect().execute(
+            "SELECT source, data, fetched_at FROM station_days WHERE idema = ? AND day = ?", (idema, day)
+        ).fetchone()
+
+    def _schedule(self, idema: str, day: str) -> None:
+        if not self.client.enabled:
+            return
+        today = datetime.now(timezone.utc).date()
+        # Callers reject future dates; a day past tomorrow in UTC has no observations to fetch
+        if day > (today + timedelta(days=1)).isoformat():
+            return
+        if day >= (today - timedelta(days=RECENT_DAYS)).isoformat():
+            # The bulk observations cover it; one download serves every station, so misses
+            # (stations that have not reported yet) do not start one more than once per cooldown
+            if self._prefetch_started is not None and time.monotonic() - self._prefetch_started < self.prefetch_cooldown:
+                self._count("prefetches_throttled")
+                return
+            self.start_prefetch()
+            return
+        if (idema, day) not in self._fetches:
+            task = asyncio.get_running_loop().create_task(self._fetch_day(idema, day))
+            self._fetches[(idema, day)] = task
+            task.add_done_callback(lambda _: self._fetches.pop((idema, day), None))
+
+    async def _fetch_day(self, idema: str, day: str) -> None:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(FETCH_CONCURRENCY)
+        async with self._semaphore:
+            self._count("fetches")
+            try:
+                records = await self.client.fetch(CLIMATOLOGY_PATH.format(day=day, idema=idema))
+                source, data = "climatology", {"summary": summarize_daily(records[0])}
+            except AemetError as e:
+                if e.status != 404:
+                    self._count("fetch_errors")
+                    log_event("weather_fetch_failed", level="warning", idema=idema, day=day, error=str(e))
+                    return
+                # Remembered, so claims for that day do not ask again until the TTL runs out
+                source, data = "none", {}
+            except Exception as e:
+                self._count("fetch_errors")
+                log_event("weather_fetch_failed", level="warning", idema=idema, day=day, error=str(e))
+                return
+        await asyncio.to_thread(self._store, [(idema, day, source, json.dumps(data))])
+
+    def _store(self, rows: list[tuple[str, str, str, str]]) -> None:
+        conn = self._connect()
+        now = time.time()
+        conn.execute("BEGIN")
+        try:
+            conn.executemany(
+                "INSERT OR REPLACE INTO station_days (idema, day, source, data, fetched_at) VALUES (?, ?, ?, ?, ?)",
+                [(*row, now) for row in rows],
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def start_prefetch(self) -> asyncio.Task:
+        """
+        Start a bulk download of the latest observations, unless one is already running.
+        """
+        if self._prefetch is None or self._prefetch.done():
+            self._prefetch_started = time.monotonic()
+            self._prefetch = asyncio.get_running_loop().create_task(self.prefetch())
+        return self._prefetch
+
+    async def prefetch(self) -> None:
+        started = time.perf_counter()
+        self._count("prefetches")
+        try:
+            observations = await self.client.fetch(OBSERVATIONS_PATH)
+            stored = await asyncio.to_thread(self.store_observations, observations)
+        except Exception as e:
+            self._count("fetch_errors")
+            log_event("weather_prefetch_failed", level="warning", error=str(e))
+            return
+        self.last_prefetch = {
+            "at": time.time(),
+            "observations": len(observations),
+            "station_days": stored,
+            "seconds": time.perf_counter() - started,
+        }
+        log_event("weather_prefetch", always=True, **self.last_prefetch)
+
+    def store_observations(self, observations: list[dict]) -> int:
+        """
+        Merge a bulk observation download into the station-day cache and the
+        station list in one transaction; returns the station-days written.
+        """
+        stations: dict[str, tuple] = {}
+        groups: dict[tuple[str, str], dict[str, dict]] = {}
+        for observation in observations:
+            idema, hour = observation.get("idema"), observation.get("fint")
+            lat, lon = number(observation.get("lat")), number(observation.get("lon"))
+            if not idema or not hour or lat is None or lon is None:
+                continue
+            stations[idema] = (idema, observation.get("ubi"), lat, lon)
+            fields = {field: number(observation.get(field)) for field in HOURLY_FIELDS}
+            groups.setdefault((idema, hour[:10]), {})[hour] = {k: v for k, v in fields.items() if v is not None}
+
+        conn = self._connect()
+        now = time.time()
+        conn.execute("BEGIN")
+        try:
+            conn.executemany("INSERT OR REPLACE INTO stations (idema, name, lat, lon) VALUES (?, ?, ?, ?)", stations.values())
+            for (idema, day), hours in groups.items():
+                # Hours from earlier downloads are kept: each one only covers the last 24 hours
+                row = conn.execute(
+                    "SELECT data FROM station_days WHERE idema = ? AND day = ? AND source = 'observations'", (idema, day)
+                ).fetchone()
+                if row is not None:
+                    hours = {**json.loads(row[0])["hours"], **hours}
+                conn.execute(
+                    "INSERT OR REPLACE INTO station_days (idema, day, source, data, fetched_at) VALUES (?, ?, 'observations', ?, ?)",
+                    (idema, day, json.dumps({"hours": hours}), now),
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        self.load()
+        return len(groups)
+
+    async def refresh(self) -> None:
+        """
+        Prefetch the latest observations now and every `prefetch_interval` seconds, until cancelled.
+        """
+        if not self.client.enabled or self.prefetch_interval <= 0:
+            return
+        while True:
+            await self.start_prefetch()
+            await asyncio.sleep(self.prefetch_interval)
+
+    async def close(self) -> None:
+        for task in list(self._fetches.values()) + ([self._prefetch] if self._prefetch else []):
+            task.cancel()
+        await self.client.close()
+
+    def stats(self) -> dict:
+        cached = self._connect().execute("SELECT COUNT(*) FROM station_days").fetchone()[0]
+        with self._lock:
+            lookups = self.counters["lookups"]
+            return {
+                "enabled": self.client.enabled,
+                "stations": len(self.stations),
+                "station_days": cached,
+                **self.counters,
+                "hit_rate": self.counters["hits"] / lookups if lookups else 0.0,
+                "in_flight": len(self._fetches),
+                "aemet": dict(self.client.counters),
+                "last_prefetch": self.last_prefetch,
+            }
@@ -0,0 +1,428 @@
+"""
+End-to-end load test of the backend against the local fake Gemini server.
+
+Starts test/fake_gemini.py and the API (uvicorn, `--workers` processes) with
+throwaway databases, drives every endpoint with the fixture corpus in
+test/fixtures at fixed concurrency levels, and reports p50/p95/p99 latency,
+throughput, and CPU and RSS per worker. The results are compared with a stored
+baseline and the run fails (exit code 1) when an endpoint regressed:
+
+    python test/bench.py                              # all endpoints at 1 and 8 users
+    python test/bench.py -e quote,process_image -c 1,16 -d 10
+    python test/bench.py --llm-latency 0.8 --llm-distribution lognormal --error-rate 0.05
+    python test/bench.py --update-baseline            # store this run as the new baseline
+
+The LLM response cache is disabled unless `--llm-cache` is given, so every call
+reaches the fake server. CPU and RSS are read from /proc (Linux only).
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import socket
+import tempfile
+import subprocess
+from dataclasses import dataclass
+from typing import Callable, Optional
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES_DIR = os.path.join(BACKEND_DIR, "test", "fixtures")
+DEFAULT_BASELINE = os.path.join(BACKEND_DIR, "test", "bench_baseline.json")
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+# Latency regressions smaller than this are noise, whatever the relative change
+MIN_REGRESSION_MS = 5.0
+QUOTE_BATCH_SIZE = 1000
+
+
+class Corpus:
+    """
+    Recorded inputs the scenarios cycle through: descriptions, images, audio and policies.
+    """
+
+    def __init__(self, path: str = os.path.join(FIXTURES_DIR, "corpus.json")):
+        with open(path, "r", encoding="utf-8") as file:
+            data = json.load(file)
+        self.accident_descriptions = data["accident_descriptions"]
+        self.user_inputs = data["user_inputs"]
+        self.vehicle_conditions = data["vehicle_conditions"]
+        self.insurances = data["insurances"]
+        self.images = [self._read(name) for name in data["images"]]
+        self.audio = [self._read(name) for name in data["audio"]]
+
+    @staticmethod
+    def _read(name: str) -> tuple[str, bytes]:
+        with open(os.path.join(BACKEND_DIR, name), "rb") as file:
+            return os.path.basename(name), file.read()
+
+    def image(self, i: int) -> tuple[str, bytes]:
+        return self.images[i % len(self.images)]
+
+
+@dataclass(frozen=True)
+class Scenario:
+    method: str
+    path: str
+    # Keyword arguments of the httpx request for the i-th call
+    build: Callable[[Corpus, int], dict]
+    stream: bool = False
+
+
+def pick(items: list, i: int):
+    return items[i % len(items)]
+
+
+SCENARIOS = {
+    "process_accident": Scenario("POST", "/process_accident", lambda corpus, i: {
+        "json": {"accident_description": pick(corpus.accident_descriptions, i)},
+    }),
+    "process_image": Scenario("POST", "/process_image", lambda corpus, i: {
+        "files": {"file": corpus.image(i)},
+    }),
+    "process_image_stream": Scenario("POST", "/process_image/stream", lambda corpus, i: {
+        "files": {"file": corpus.image(i)},
+    }, stream=True),
+    "process_images": Scenario("POST", "/process_images", lambda corpus, i: {
+        "files": [("files", corpus.image(i + k)) for k in range(3)],
+    }),
+    "process_image_for_insurance": Scenario("POST", "/process_image_for_insurance", lambda corpus, i: {
+        "files": {"file": corpus.image(i)},
+    }),
+    "create_personalized_insurance": Scenario("POST", "/create_personalized_insurance", lambda corpus, i: {
+        "json": {"user_input": pick(corpus.user_inputs, i)},
+    }),
+    "create_personalized_insurance_stream": Scenario("POST", "/create_personalized_insurance/stream", lambda corpus, i: {
+        "json": {"user_input": pick(corpus.user_inputs, i)},
+    }, stream=True),
+    "analyze_vehicle_condition": Scenario("POST", "/analyze_vehicle_condition", lambda corpus, i: {
+        "json": {"description": pick(corpus.vehicle_conditions, i)},
+    }),
+    "analyze_vehicle_condition_stream": Scenario("POST", "/analyze_vehicle_condition/stream", lambda corpus, i: {
+        "json": {"description": pick(corpus.vehicle_conditions, i)},
+    }, stream=True),
+    "analyze_report": Scenario("POST", "/analyze_report", lambda corpus, i: {
+        "files": {"file": pick(corpus.audio, i)},
+    }),
+    "save_insurance": Scenario("POST", "/save_insurance", lambda corpus, i: {
+        "json": pick(corpus.insurances, i),
+    }),
+    "load_insurances": Scenario("GET", "/load_insurances", lambda corpus, i: {
+        "params": {"limit": 100},
+    }),
+    "quote": Scenario("POST", "/quote", lambda corpus, i: {
+        "json": pick(corpus.insurances, i),
+    }),
+    "quote_batch": Scenario("POST", "/quote/batch", lambda corpus, i: {
+        "json": [pick(corpus.insurances, i + k) for k in range(QUOTE_BATCH_SIZE)],
+    }),
+    "geocode": Scenario("GET", "/geocode", lambda corpus, i: {
+        "params": dict(zip(("lat", "lon"), pick(corpus.insurances, i)["coordinates"])),
+    }),
+    "ine_series": Scenario("GET", "/ine/tractores_industriales/municipios/05019", lambda corpus, i: {}),
+}
+
+
+def port_in_use(port: int) -> bool:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        return sock.connect_ex(("127.0.0.1", port)) == 0
+
+
+def start_process(command: list[str], env: dict, log_path: str) -> subprocess.Popen:
+    log = open(log_path, "wb")
+    return subprocess.Popen(command, cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+def wait_ready(url: str, process: subprocess.Popen, timeout: float = 60) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Process serving {url} exited with code {process.returncode}.")
+        try:
+            if httpx.get(url, timeout=1).status_code < 500:
+                return
+        except httpx.TransportError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Timed out waiting for {url}.")
+
+
+def worker_pids(master_pid: int) -> list[int]:
+    """
+    PIDs of the uvicorn worker processes, or the master itself when it serves requests.
+    """
+    children = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", "r") as file:
+                fields = file.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        # fields[1] is the parent PID; multiprocessing's resource tracker is not a worker
+        if int(fields[1]) == master_pid and "resource_tracker" not in _cmdline(int(entry)):
+            children.append(int(entry))
+    return children or [master_pid]
+
+
+def _cmdline(pid: int) -> str:
+    try:
+        with open(f"/proc/{pid}/cmdline", "rb") as file:
+            return file.read().replace(b"\0", b" ").decode("utf-8", "replace")
+    except OSError:
+        return ""
+
+
+def sample_resources(pids: list[int]) -> dict[int, tuple[float, float]]:
+    """
+    CPU seconds used so far and current RSS (MB) of each process.
+    """
+    samples = {}
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/stat", "r") as file:
+                fields = file.read().rsplit(")", 1)[1].split()
+            with open(f"/proc/{pid}/status", "r") as file:
+                rss_kb = next(int(line.split()[1]) for line in file if line.startswith("VmRSS:"))
+        except (OSError, StopIteration):
+            continue
+        # utime and stime are fields 14 and 15 of /proc/<pid>/stat
+        samples[pid] = ((int(fields[11]) + int(fields[12])) / CLOCK_TICKS, rss_kb / 1024)
+    return samples
+
+
+def percentile(samples: list[float], q: float) -> Optional[float]:
+    if not samples:
+        return None
+    return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+async def run_level(base_url: str, scenario: Scenario, corpus: Corpus, concurrency: int, duration: float) -> dict:
+    """
+    Closed-loop load: `concurrency` users send requests back to back for `duration` seconds.
+    """
+    latencies: list[float] = []
+    errors = 0
+    deadline = time.monotonic() + duration
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+        async def user(i: int) -> None:
+            nonlocal errors
+            while time.monotonic() < deadline:
+                request = scenario.build(corpus, i)
+                started = time.perf_counter()
+                try:
+                    if scenario.stream:
+                        async with client.stream(scenario.method, scenario.path, **request) as response:
+                            async for _ in response.aiter_bytes():
+                                pass
+                    else:
+                        response = await client.request(scenario.method, scenario.path, **request)
+                    ok = response.status_code < 400
+                except httpx.HTTPError:
+                    ok = False
+                if ok:
+                    latencies.append(time.perf_counter() - started)
+                else:
+                    errors += 1
+                i += concurrency
+
+        started = time.monotonic()
+        await asyncio.gather(*(user(i) for i in range(concurrency)))
+        elapsed = time.monotonic() - started
+
+    latencies.sort()
+    total = len(latencies) + errors
+    return {
+        "requests": total,
+        "errors": errors,
+        "error_rate": round(errors / total, 4) if total else 0.0,
+        "throughput_rps": round(len(latencies) / elapsed, 2),
+        **{
+            f"p{int(q * 100)}_ms": round(value * 1000, 2) if (value := percentile(latencies, q)) is not None else None
+            for q in (0.5, 0.95, 0.99)
+        },
+    }
+
+
+def resource_usage(before: dict, after: dict, elapsed: float) -> list[dict]:
+    return [
+        {
+            "pid": pid,
+            "cpu_percent": round((cpu - before[pid][0]) / elapsed * 100, 1) if pid in before else None,
+            "rss_mb": round(rss, 1),
+        }
+        for pid, (cpu, rss) in sorted(after.items())
+    ]
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """
+    Regressions of `results` against the baseline: p95 latency or error rate up, or throughput down.
+    """
+    regressions = []
+    for key, result in results.items():
+        reference = baseline.get(key)
+        if reference is None:
+            continue
+        p95, reference_p95 = result.get("p95_ms"), reference.get("p95_ms")
+        if p95 is not None and reference_p95 is not None:
+            if p95 > reference_p95 * (1 + tolerance) and p95 - reference_p95 > MIN_REGRESSION_MS:
+                regressions.append(f"{key}: p95 {p95} ms vs {reference_p95} ms")
+        if result["throughput_rps"] < reference["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{key}: throughput {result['throughput_rps']} rps vs {reference['throughput_rps']} rps")
+        if result["error_rate"] > reference["error_rate"] + 0.01:
+            regressions.append(f"{key}: error rate {result['error_rate']} vs {reference['error_rate']}")
+    return regressions
+
+
+def print_table(results: dict) -> None:
+    header = f"{'scenario':<44}{'reqs':>7}{'err%':>7}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}  cpu%/rss MB per worker"
+    print(header)
+    print("-" * len(header))
+    for key, result in results.items():
+        workers = " ".join(f"{worker['cpu_percent']}/{worker['rss_mb']}" for worker in result["workers"])
+        print(
+            f"{key:<44}{result['requests']:>7}{result['error_rate'] * 100:>7.1f}{result['throughput_rps']:>9}"
+            f"{result['p50_ms'] or '-':>10}{result['p95_ms'] or '-':>10}{result['p99_ms'] or '-':>10}  {workers}"
+        )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Load test the backend against a local fake Gemini server.")
+    parser.add_argument("-e", "--endpoints", default=",".join(SCENARIOS), help="Comma-separated scenarios.")
+    parser.add_argument("-c", "--concurrency", default="1,8", help="Comma-separated concurrency levels.")
+    parser.add_argument("-d", "--duration", type=float, default=3.0, help="Seconds per scenario and level.")
+    parser.add_argument("-w", "--workers", type=int, default=1, help="uvicorn worker processes.")
+    parser.add_argument("--port", type=int, default=8011)
+    parser.add_argument("--fake-port", type=int, default=8090)
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="Fake Gemini latency (median for lognormal).")
+    parser.add_argument("--llm-jitter", type=float, default=0.1)
+    parser.add_argument("--llm-distribution", default="uniform", choices=("uniform", "lognormal", "exponential"))
+    parser.add_argument("--chunk-interval", type=float, default=0.02, help="Seconds between streamed chunks.")
+    parser.add_argument("--chunk-size", type=int, default=64)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of fake Gemini calls that fail.")
+    parser.add_argument("--llm-cache", action="store_true", help="Keep the LLM response cache enabled.")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative regression.")
+    parser.add_argument("--output", help="Write the full results as JSON to this file.")
+    args = parser.parse_args()
+
+    names = [name.strip() for name in args.endpoints.split(",") if name.strip()]
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(unknown)}")
+    levels = [int(level) for level in args.concurrency.split(",")]
+    config = {
+        "workers": args.workers,
+        "duration": args.duration,
+        "llm_latency": args.llm_latency,
+        "llm_jitter": args.llm_jitter,
+        "llm_distribution": args.llm_distribution,
+        "chunk_interval": args.chunk_interval,
+        "error_rate": args.error_rate,
+        "llm_cache": args.llm_cache,
+    }
+    corpus = Corpus()
+    busy = [str(port) for port in (args.port, args.fake_port) if port_in_use(port)]
+    if busy:
+        # A server left running there would answer instead of the ones started here
+        parser.error(f"Port(s) already in use: {', '.join(busy)}")
+
+    workdir = tempfile.mkdtemp(prefix="bench-")
+    fake_env = {
+        **os.environ,
+        "FAKE_GEMINI_LATENCY": str(args.llm_latency),
+        "FAKE_GEMINI_LATENCY_JITTER": str(args.llm_jitter),
+        "FAKE_GEMINI_LATENCY_DISTRIBUTION": args.llm_distribution,
+        "FAKE_GEMINI_CHUNK_INTERVAL": str(args.chunk_interval),
+        "FAKE_GEMINI_CHUNK_SIZE": str(args.chunk_size),
+        "FAKE_GEMINI_ERROR_RATE": str(args.error_rate),
+    }
+    backend_env = {
+        **os.environ,
+        "GEMINI_BASE_URL": f"http://127.0.0.1:{args.fake_port}",
+        "GEMINI_API_KEY": "fake",
+        "INSURANCE_DB": os.path.join(workdir, "insurances.db"),
+        "JOB_QUEUE_DB": os.path.join(workdir, "jobs.db"),
+        "LLM_CACHE_DB": os.path.join(workdir, "llm_cache.db"),
+        "SPEECH_BACKEND": "local",
+        "SPEECH_LOCAL_TRANSCRIPTS": os.path.join(FIXTURES_DIR, "transcripts.json"),
+        "PYTHONUNBUFFERED": "1",
+    }
+    if not args.llm_cache:
+        # Entries expire as soon as they are written, so every call reaches the fake server
+        backend_env["LLM_CACHE_TTL"] = "0"
+
+    processes = []
+    try:
+        fake = start_process(
+            [sys.executable, os.path.join("test", "fake_gemini.py"), "--port", str(args.fake_port)],
+            fake_env, os.path.join(workdir, "fake_gemini.log"),
+        )
+        processes.append(fake)
+        wait_ready(f"http://127.0.0.1:{args.fake_port}/_stats", fake)
+        backend = start_process(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.port),
+             "--workers", str(args.workers), "--log-level", "warning"],
+            backend_env, os.path.join(workdir, "backend.log"),
+        )
+        processes.append(backend)
+        base_url = f"http://127.0.0.1:{args.port}"
+        wait_ready(f"{base_url}/", backend)
+        pids = worker_pids(backend.pid)
+
+        results = {}
+        for name in names:
+            for level in levels:
+                before = sample_resources(pids)
+                started = time.monotonic()
+                result = asyncio.run(run_level(base_url, SCENARIOS[name], corpus, level, args.duration))
+                result["workers"] = resource_usage(before, sample_resources(pids), time.monotonic() - started)
+                results[f"{name}@{level}"] = result
+                print(f"{name}@{level}: {result['throughput_rps']} rps, p95 {result['p95_ms']} ms", file=sys.stderr)
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        print(f"Server logs in {workdir}", file=sys.stderr)
+
+    print_table(results)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump({"config": config, "results": results}, file, indent=2)
+
+    if args.update_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as file:
+            json.dump({"config": config, "results": results}, file, indent=2)
+            file.write("\n")
+        print(f"Baseline written to {args.baseline}")
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --update-baseline to create one.")
+        return 0
+
+    with open(args.baseline, "r", encoding="utf-8") as file:
+        baseline = json.load(file)
+    if baseline.get("config") != config:
+        print(f"Warning: baseline was recorded with a different configuration: {baseline.get('config')}")
+    regressions = compare(results, baseline["results"], args.tolerance)
+    if regressions:
+        print(f"{len(regressions)} regression(s) against {args.baseline}:")
+        for regression in regressions:
+            print(f"  {regression}")
+        return 1
+    print(f"No regressions against {args.baseline}.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,186 @@
+"""
+Cold-start benchmark of the backend: how long `import main` takes, how long a
+fresh uvicorn worker takes to answer its first request, and the latency of its
+first and second LLM-backed requests against the local fake Gemini server.
+
+Each measurement is repeated `--runs` times on fresh processes and the median is
+compared with a stored baseline; the run fails (exit code 1) on a regression:
+
+    python test/bench_startup.py                      # 5 cold starts
+    python test/bench_startup.py --runs 10 --no-warmup
+    python test/bench_startup.py --update-baseline    # store this run as the new baseline
+
+The server's own view of its start-up (reference data build times and the LLM
+warm-up) is read from /startup/stats and shown alongside.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+import tempfile
+import httpx
+from bench import BACKEND_DIR, port_in_use, start_process, wait_ready
+
+DEFAULT_BASELINE = os.path.join(BACKEND_DIR, "test", "bench_startup_baseline.json")
+# Start-up times are noisier than request latencies; smaller differences are never regressions
+MIN_REGRESSION_MS = 50.0
+IMPORT_SNIPPET = "import time; started = time.perf_counter(); import main; print(time.perf_counter() - started)"
+ACCIDENT = {"accident_description": "El tractor volcó en una cuneta al esquivar un coche y se rompió la cabina."}
+
+
+def measure_import(env: dict) -> float:
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_SNIPPET], cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    return float(output.strip().splitlines()[-1]) * 1000
+
+
+def measure_start(env: dict, port: int, log_path: str) -> dict:
+    """
+    Start one uvicorn worker and time its first request, then its first two LLM requests.
+    """
+    base_url = f"http://127.0.0.1:{port}"
+    started = time.perf_counter()
+    backend = start_process(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"], env, log_path,
+    )
+    try:
+        with httpx.Client(base_url=base_url, timeout=60) as client:
+            while True:
+                if backend.poll() is not None:
+                    raise RuntimeError(f"Backend exited with code {backend.returncode}; see {log_path}.")
+                try:
+                    if client.get("/").status_code == 200:
+                        break
+                except httpx.TransportError:
+                    time.sleep(0.01)
+            first_request = (time.perf_counter() - started) * 1000
+
+            llm = []
+            for _ in range(2):
+                sent = time.perf_counter()
+                client.post("/process_accident", json=ACCIDENT).raise_for_status()
+                llm.append((time.perf_counter() - sent) * 1000)
+            report = client.get("/startup/stats").json()
+    finally:
+        backend.terminate()
+        try:
+            backend.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            backend.kill()
+
+    warm_up = report.get("llm_warm_up") or {}
+    return {
+        "first_request_ms": first_request,
+        "first_llm_ms": llm[0],
+        "second_llm_ms": llm[1],
+        "server_ready_ms": report["ready_seconds"] * 1000,
+        "warm_up_ms": warm_up["seconds"] * 1000 if "seconds" in warm_up else None,
+        "reference_data_ms": sum(source["build_ms"] for source in report["reference_data"].values()),
+    }
+
+
+def summarize(samples: list[dict]) -> dict:
+    summary = {}
+    for key in samples[0]:
+        values = [sample[key] for sample in samples if sample[key] is not None]
+        if values:
+            summary[key] = {"median": round(statistics.median(values), 2), "max": round(max(values), 2)}
+    return summary
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    regressions = []
+    for key, result in results.items():
+        reference = baseline.get(key)
+        if reference is None:
+            continue
+        median, reference_median = result["median"], reference["median"]
+        if median > reference_median * (1 + tolerance) and median - reference_median > MIN_REGRESSION_MS:
+            regressions.append(f"{key}: median {median} ms vs {reference_median} ms")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Measure the backend's import time and time to first request.")
+    parser.add_argument("-n", "--runs", type=int, default=5, help="Cold starts to measure.")
+    parser.add_argument("--port", type=int, default=8011)
+    parser.add_argument("--fake-port", type=int, default=8090)
+    parser.add_argument("--no-warmup", action="store_true", help="Start the workers with LLM_WARMUP=false.")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative regression.")
+    args = parser.parse_args()
+
+    busy = [str(port) for port in (args.port, args.fake_port) if port_in_use(port)]
+    if busy:
+        parser.error(f"Port(s) already in use: {', '.join(busy)}")
+
+    workdir = tempfile.mkdtemp(prefix="bench-startup-")
+    config = {"runs": args.runs, "llm_warmup": not args.no_warmup}
+    env = {
+        **os.environ,
+        "GEMINI_BASE_URL": f"http://127.0.0.1:{args.fake_port}",
+        "GEMINI_API_KEY": "fake",
+        "INSURANCE_DB": os.path.join(workdir, "insurances.db"),
+        "JOB_QUEUE_DB": os.path.join(workdir, "jobs.db"),
+        "LLM_CACHE_DB": os.path.join(workdir, "llm_cache.db"),
+        # Every LLM request reaches the fake server
+        "LLM_CACHE_TTL": "0",
+        "LLM_WARMUP": "false" if args.no_warmup else "true",
+        "PYTHONUNBUFFERED": "1",
+    }
+
+    fake = start_process(
+        [sys.executable, os.path.join("test", "fake_gemini.py"), "--port", str(args.fake_port)],
+        {**os.environ, "FAKE_GEMINI_LATENCY": "0"}, os.path.join(workdir, "fake_gemini.log"),
+    )
+    try:
+        wait_ready(f"http://127.0.0.1:{args.fake_port}/_stats", fake)
+        samples = []
+        for run in range(args.runs):
+            sample = {"import_ms": measure_import(env)}
+            sample.update(measure_start(env, args.port, os.path.join(workdir, f"backend.{run}.log")))
+            samples.append(sample)
+            print(f"run {run + 1}: " + ", ".join(f"{key} {value:.0f}" for key, value in sample.items() if value is not None),
+                  file=sys.stderr)
+    finally:
+        fake.terminate()
+        fake.wait(timeout=10)
+        print(f"Server logs in {workdir}", file=sys.stderr)
+
+    results = summarize(samples)
+    print(f"{'measurement':<24}{'median ms':>12}{'max ms':>12}")
+    print("-" * 48)
+    for key, result in results.items():
+        print(f"{key:<24}{result['median']:>12}{result['max']:>12}")
+
+    if args.update_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as file:
+            json.dump({"config": config, "results": results}, file, indent=2)
+            file.write("\n")
+        print(f"Baseline written to {args.baseline}")
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --update-baseline to create one.")
+        return 0
+
+    with open(args.baseline, "r", encoding="utf-8") as file:
+        baseline = json.load(file)
+    if baseline.get("config") != config:
+        print(f"Warning: baseline was recorded with a different configuration: {baseline.get('config')}")
+    regressions = compare(results, baseline["results"], args.tolerance)
+    if regressions:
+        print(f"{len(regressions)} regression(s) against {args.baseline}:")
+        for regression in regressions:
+            print(f"  {regression}")
+        return 1
+    print(f"No regressions against {args.baseline}.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,134 @@
+"""
+Local stand-in for the AEMET OpenData API, to exercise the weather cache and
+its two-step fetches without an API key or AEMET's rate limit.
+
+Run it and point the backend at it:
+
+    python test/fake_aemet.py --port 8091
+    AEMET_BASE_URL=http://127.0.0.1:8091/opendata/api AEMET_API_KEY=fake uvicorn main:app --port 8001
+
+Like AEMET, every API call answers with an envelope whose `datos` URL holds the
+data, served in Latin-9. It knows a handful of stations in Castilla y León:
+`observacion/convencional/todas` returns their last 24 hourly observations, and
+the daily climatology answers for any past day of a known station (404 for an
+unknown one). FAKE_AEMET_LATENCY adds seconds to every response; GET /_stats
+counts the calls per kind.
+"""
+import os
+import json
+import random
+import asyncio
+import argparse
+import itertools
+from datetime import datetime, timedelta, timezone
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+
+LATENCY = float(os.environ.get("FAKE_AEMET_LATENCY", "0"))
+
+# idema, name, lat, lon
+STATIONS = [
+    ("2422", "VALLADOLID", 41.6406, -4.7544),
+    ("2444", "ÁVILA", 40.6592, -4.6800),
+    ("2867", "SALAMANCA AEROPUERTO", 40.9592, -5.4981),
+    ("2661", "LEÓN VIRGEN DEL CAMINO", 42.5883, -5.6511),
+    ("2030", "SORIA", 41.7753, -2.4833),
+    ("2465", "SEGOVIA", 40.9456, -4.1264),
+]
+
+app = FastAPI()
+counters = {"observations": 0, "climatology": 0, "datos": 0, "unauthorized": 0, "not_found": 0}
+_datos: dict[str, bytes] = {}
+_tokens = itertools.count()
+
+
+def hourly(idema: str, lat: float, lon: float, name: str, hour: datetime) -> dict:
+    rng = random.Random(f"{idema}{hour.isoformat()}")
+    temperature = round(12 + 8 * rng.random(), 1)
+    return {
+        "idema": idema, "lat": lat, "lon": lon, "ubi": name, "alt": 700.0,
+        "fint": hour.strftime("%Y-%m-%dT%H:%M:%S"),
+        "prec": round(rng.choice([0, 0, 0, 0.2, 1.4, 3.0]), 1),
+        "vv": round(6 * rng.random(), 1), "vmax": round(8 + 14 * rng.random(), 1), "dv": rng.randrange(360),
+        "ta": temperature, "tamax": round(temperature + 0.6, 1), "tamin": round(temperature - 0.6, 1),
+        "hr": rng.randrange(35, 95), "pres": 930.0,
+    }
+
+
+def daily(idema: str, name: str, day: str) -> dict:
+    rng = random.Random(f"{idema}{day}")
+    # Climatology values are strings with a decimal comma, as AEMET sends them
+    comma = lambda value: f"{value:.1f}".replace(".", ",")
+    return {
+        "fecha": day, "indicativo": idema, "nombre": name, "provincia": "CASTILLA Y LEON", "altitud": "700",
+        "tmed": comma(13 + 5 * rng.random()), "prec": rng.choice(["0,0", "Ip", comma(12 * rng.random())]),
+        "tmin": comma(4 + 4 * rng.random()), "tmax": comma(20 + 8 * rng.random()),
+        "velmedia": comma(5 * rng.random()), "racha": comma(10 + 15 * rng.random()), "hrMedia": str(rng.randrange(40, 90)),
+    }
+
+
+def envelope(request: Request, data) -> JSONResponse:
+    token = str(next(_tokens))
+    _datos[token] = json.dumps(data, ensure_ascii=False).encode("iso-8859-15")
+    url = f"{request.base_url}_datos/{token}"
+    return JSONResponse({"descripcion": "exito", "estado": 200, "datos": url, "metadatos": url})
+
+
+def error(status: int, description: str) -> JSONResponse:
+    return JSONResponse(status_code=status, content={"descripcion": description, "estado": status})
+
+
+@app.middleware("http")
+async def authorize(request: Request, call_next):
+    if LATENCY:
+        await asyncio.sleep(LATENCY)
+    if request.url.path.startswith("/opendata/") and not request.headers.get("api_key"):
+        counters["unauthorized"] += 1
+        return error(401, "API key invalido")
+    return await call_next(request)
+
+
+@app.get("/_stats")
+def stats() -> dict:
+    return counters
+
+
+@app.get("/_datos/{token}")
+def datos(token: str) -> Response:
+    counters["datos"] += 1
+    # Each data file is served once, like AEMET's short-lived data URLs
+    content = _datos.pop(token, None)
+    if content is None:
+        return error(404, "No hay datos")
+    return Response(content, media_type="application/json; charset=ISO-8859-15")
+
+
+@app.get("/opendata/api/observacion/convencional/todas")
+def observations(request: Request) -> JSONResponse:
+    counters["observations"] += 1
+    now = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0, tzinfo=None)
+    data = [
+        hourly(idema, lat, lon, name, now - timedelta(hours=hours))
+        for idema, name, lat, lon in STATIONS
+        for hours in range(23, -1, -1)
+    ]
+    return envelope(request, data)
+
+
+@app.get("/opendata/api/valores/climatologicos/diarios/datos/fechaini/{start}/fechafin/{end}/estacion/{idema}")
+def climatology(request: Request, start: str, end: str, idema: str) -> JSONResponse:
+    counters["climatology"] += 1
+    names = {station[0]: station[1] for station in STATIONS}
+    if idema not in names:
+        counters["not_found"] += 1
+        return error(404, "No hay datos que satisfagan esos criterios")
+    return envelope(request, [daily(idema, names[idema], start[:10])])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake AEMET OpenData API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8091)
+    args = parser.parse_args()
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
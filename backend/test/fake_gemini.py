@@ -0,0 +1,182 @@
+"""
+Local stand-in for the Gemini API with fault injection, to exercise the
+timeouts, retries, hedging and circuit breaker without calling Google.
+
+Run it and point the backend at it:
+
+    python test/fake_gemini.py --port 8090
+    GEMINI_BASE_URL=http://127.0.0.1:8090 GEMINI_API_KEY=fake uvicorn main:app --port 8001
+
+Faults are read from FAKE_GEMINI_* environment variables at start-up and can be
+changed at runtime with POST /_faults (same keys, JSON body):
+    error_rate    fraction of calls answered with `error_status`
+    error_status  HTTP status of the injected errors (default 503)
+    latency       seconds before the first chunk is sent (the median for lognormal)
+    latency_jitter  extra random latency, up to this many seconds (the sigma for lognormal)
+    latency_distribution  `uniform` (latency plus uniform jitter), `lognormal`
+                   or `exponential` (mean latency)
+    chunk_size    characters of the answer per streamed chunk
+    chunk_interval  seconds between streamed chunks
+    stall_rate    fraction of streams that hang after the first chunk
+    invalid_model  models whose name contains this answer an empty JSON object,
+                   to exercise escalation to the pro model
+    truncate_rate  fraction of single-turn answers cut off halfway, to exercise
+                   the JSON repair and the re-ask of missing fields
+
+Answers are trimmed to the properties of the request's response schema, so a
+re-ask for some fields gets just those fields.
+"""
+import os
+import json
+import math
+import random
+import asyncio
+import argparse
+import uvicorn
+from fastapi import FastAPI, Request, Body
+from fastapi.responses import JSONResponse, StreamingResponse
+
+faults = {
+    "error_rate": float(os.environ.get("FAKE_GEMINI_ERROR_RATE", "0")),
+    "error_status": int(os.environ.get("FAKE_GEMINI_ERROR_STATUS", "503")),
+    "latency": float(os.environ.get("FAKE_GEMINI_LATENCY", "0")),
+    "latency_jitter": float(os.environ.get("FAKE_GEMINI_LATENCY_JITTER", "0")),
+    "latency_distribution": os.environ.get("FAKE_GEMINI_LATENCY_DISTRIBUTION", "uniform"),
+    "chunk_size": int(os.environ.get("FAKE_GEMINI_CHUNK_SIZE", "64")),
+    "chunk_interval": float(os.environ.get("FAKE_GEMINI_CHUNK_INTERVAL", "0")),
+    "stall_rate": float(os.environ.get("FAKE_GEMINI_STALL_RATE", "0")),
+    "invalid_model": os.environ.get("FAKE_GEMINI_INVALID_MODEL", ""),
+    "truncate_rate": float(os.environ.get("FAKE_GEMINI_TRUNCATE_RATE", "0")),
+}
+counters = {"requests": 0, "errors": 0, "stalls": 0, "truncations": 0, "model_gets": 0}
+
+STATUS_NAMES = {429: "RESOURCE_EXHAUSTED", 500: "INTERNAL", 503: "UNAVAILABLE", 504: "DEADLINE_EXCEEDED"}
+
+DAMAGE_ANSWER = {
+    "modelo_tractor": "John Deere 6120M",
+    "evaluacion_daños": {
+        "daños_vehiculo": ["Abolladura en el capó", "Faro delantero roto"],
+        "daños_terceros": [],
+    },
+    "analisis_incidente": "El tractor golpeó un obstáculo con la parte delantera.",
+    "recomendaciones_seguro": ["Revisar la cobertura de daños propios."],
+}
+INSURANCE_DATA_ANSWER = {
+    "modelo_tractor": "John Deere 6120M",
+    "condicion": "Buena",
+    "color": "Verde",
+    "año": 2018,
+    "descripcion_adicional": "Tractor con pala frontal.",
+    "hay_tractor": True,
+}
+COVERAGE_ANSWER = {
+    "coverage_analysis": [
+        {"item": "Daños propios", "is_covered": True, "explanation": "Incluido en la modalidad a todo riesgo."},
+        {"item": "Cosas transportadas", "is_covered": False, "explanation": "Figura entre las exclusiones."},
+    ],
+}
+
+app = FastAPI()
+
+
+def answer_for(body: dict) -> dict:
+    """
+    Canned answer shaped like the one the prompt asks for.
+    """
+    prompt = " ".join(
+        part.get("text", "")
+        for content in body.get("contents", [])
+        for part in content.get("parts", [])
+    )
+    if "hay_tractor" in prompt:
+        answer = INSURANCE_DATA_ANSWER
+    elif "modelo_tractor" in prompt:
+        answer = DAMAGE_ANSWER
+    else:
+        answer = COVERAGE_ANSWER
+    schema = body.get("generationConfig", {}).get("responseSchema") or {}
+    properties = schema.get("properties")
+    if properties:
+        answer = {key: value for key, value in answer.items() if key in properties}
+    return answer
+
+
+def sample_latency() -> float:
+    latency = faults["latency"]
+    distribution = faults["latency_distribution"]
+    if distribution == "lognormal" and latency > 0:
+        return random.lognormvariate(math.log(latency), faults["latency_jitter"])
+    if distribution == "exponential" and latency > 0:
+        return random.expovariate(1 / latency)
+    return latency + random.uniform(0, faults["latency_jitter"])
+
+
+def chunk_payload(text: str) -> dict:
+    return {"candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "index": 0}]}
+
+
+def error_response(status: int) -> JSONResponse:
+    error = {"code": status, "message": "Injected fault.", "status": STATUS_NAMES.get(status, "UNKNOWN")}
+    return JSONResponse(status_code=status, content={"error": error})
+
+
+@app.post("/_faults")
+def set_faults(changes: dict = Body(...)) -> dict:
+    faults.update({key: type(faults[key])(value) for key, value in changes.items() if key in faults})
+    return faults
+
+
+@app.get("/_stats")
+def stats() -> dict:
+    return {"faults": faults, **counters}
+
+
+@app.get("/{version}/models/{model}")
+def get_model(version: str, model: str) -> dict:
+    # Model metadata, fetched by the backend's start-up warm-up
+    counters["model_gets"] += 1
+    return {"name": f"models/{model}", "displayName": model, "supportedGenerationMethods": ["generateContent"]}
+
+
+@app.post("/{version}/models/{model_action}")
+async def generate(version: str, model_action: str, request: Request):
+    counters["requests"] += 1
+    body = await request.json()
+    await asyncio.sleep(sample_latency())
+    if random.random() < faults["error_rate"]:
+        counters["errors"] += 1
+        return error_response(faults["error_status"])
+
+    model = model_action.split(":", 1)[0]
+    invalid = faults["invalid_model"] and faults["invalid_model"] in model
+    text = json.dumps({} if invalid else answer_for(body), ensure_ascii=False)
+    if len(body.get("contents", [])) == 1 and random.random() < faults["truncate_rate"]:
+        counters["truncations"] += 1
+        text = text[:len(text) // 2]
+    if model_action.endswith(":generateContent"):
+        return chunk_payload(text)
+
+    stall = random.random() < faults["stall_rate"]
+    if stall:
+        counters["stalls"] += 1
+    size = max(1, faults["chunk_size"])
+    pieces = [text[i:i + size] for i in range(0, len(text), size)]
+
+    async def events():
+        for index, piece in enumerate(pieces):
+            yield f"data: {json.dumps(chunk_payload(piece), ensure_ascii=False)}\r\n\r\n"
+            if stall and index == 0:
+                # Hang until the client gives up
+                await asyncio.sleep(3600)
+            if faults["chunk_interval"] and index < len(pieces) - 1:
+                await asyncio.sleep(faults["chunk_interval"])
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Gemini API with fault injection.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    args = parser.parse_args()
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
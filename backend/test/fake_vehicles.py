@@ -0,0 +1,75 @@
+"""
+Local stub of the vehicle registry API, to exercise the vehicle lookup client
+(pooling, caching of records and 404s, batching) without a trans.eu account.
+
+Run it and point the backend at it:
+
+    python test/fake_vehicles.py --port 8092
+    VEHICLE_API_URL=http://127.0.0.1:8092/api/rest/v1 VEHICLE_API_TOKEN=fake uvicorn main:app --port 8001
+
+Numeric vehicle IDs are registered, each as one of a few tractor models picked
+from the ID; any other ID answers 404. Requests without a bearer token answer
+401. FAKE_VEHICLES_LATENCY adds seconds to every response; GET /_stats counts
+requests and the connections they came in on.
+"""
+import os
+import asyncio
+import argparse
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+LATENCY = float(os.environ.get("FAKE_VEHICLES_LATENCY", "0"))
+
+MODELS = [
+    ("John Deere", "6120M", 2018),
+    ("New Holland", "T6.180", 2016),
+    ("Massey Ferguson", "5713 S", 2020),
+    ("Kubota", "M5-111", 2019),
+    ("Case IH", "Puma 165", 2015),
+]
+
+app = FastAPI()
+counters = {"requests": 0, "found": 0, "not_found": 0, "unauthorized": 0}
+connections: set = set()
+
+
+@app.get("/_stats")
+def stats() -> dict:
+    return {**counters, "connections": len(connections)}
+
+
+@app.get("/api/rest/v1/vehicles/{vehicle_id}")
+async def vehicle(vehicle_id: str, request: Request) -> JSONResponse:
+    counters["requests"] += 1
+    connections.add((request.client.host, request.client.port))
+    if LATENCY:
+        await asyncio.sleep(LATENCY)
+    if not request.headers.get("authorization", "").startswith("Bearer "):
+        counters["unauthorized"] += 1
+        return JSONResponse(status_code=401, content={"message": "Unauthorized"})
+    if not vehicle_id.isdigit():
+        counters["not_found"] += 1
+        return JSONResponse(status_code=404, content={"message": "Vehicle not found"})
+
+    counters["found"] += 1
+    brand, model, year = MODELS[int(vehicle_id) % len(MODELS)]
+    return JSONResponse(
+        media_type="application/hal+json",
+        content={
+            "id": int(vehicle_id),
+            "brand": brand,
+            "model": model,
+            "type": "tractor",
+            "production_year": year,
+            "_links": {"self": {"href": f"/api/rest/v1/vehicles/{vehicle_id}"}},
+        },
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake vehicle registry API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8092)
+    args = parser.parse_args()
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
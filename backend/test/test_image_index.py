@@ -0,0 +1,45 @@
+"""
+Regression tests of the near-duplicate photo index.
+
+Run with pytest, or directly: PYTHONPATH=. python test/test_image_index.py
+"""
+import os
+import tempfile
+from src.image_index import ImageHashIndex
+
+
+def flipped(value: int, bits: int) -> int:
+    # Flip bits spread over the hash, one per chunk in turn
+    for bit in range(bits):
+        value ^= 1 << ((bit % 4) * 16 + bit // 4)
+    return value
+
+
+def index_with(*hashes: int, radius: int = 6) -> ImageHashIndex:
+    index = ImageHashIndex(os.path.join(tempfile.mkdtemp(), "image_index.db"), radius=radius)
+    index.load()
+    for value in hashes:
+        index.add(value, {"hash": value})
+    return index
+
+
+def test_match_at_radius():
+    match = index_with(0).lookup(flipped(0, 6))
+    assert match is not None and match.distance == 6
+
+
+def test_no_match_beyond_radius():
+    assert index_with(0).lookup(flipped(0, 7)) is None
+
+
+def test_earliest_photo_wins_a_tie():
+    index = index_with(flipped(0, 1), 1 << 5)
+    match = index.lookup(0)
+    assert match is not None and match.analysis == {"hash": flipped(0, 1)}
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"{name}: ok")
@@ -0,0 +1,47 @@
+"""
+Regression tests of the INE statistics parser, on the shipped CSVs.
+
+Run with pytest, or directly: PYTHONPATH=. python test/test_ine_stats.py
+"""
+import os
+import tempfile
+from collections import Counter
+from src.ine_stats import IneDataset
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+DATASETS = ("tractores_industriales", "familiares_trabajan_explotaciones")
+
+
+def dataset(name: str) -> IneDataset:
+    loaded = IneDataset(name, os.path.join(DATA_DIR, f"{name}.csv"), cache_dir=tempfile.mkdtemp())
+    loaded.load()
+    return loaded
+
+
+def test_one_point_per_municipality_and_year():
+    for name in DATASETS:
+        loaded = dataset(name)
+        counts = Counter(zip(loaded.codes.tolist(), loaded.years.tolist()))
+        assert max(counts.values()) == 1, name
+
+
+def test_all_years_totals_are_not_a_year():
+    tractors = dataset("tractores_industriales")
+    years = [point["year"] for point in tractors.series(5019)["series"]]
+    assert len(years) == len(set(years))
+    assert tractors.value(5019) == tractors.value(5019, 2023)
+
+
+def test_latest_aggregate_in_line_with_the_year_before():
+    tractors = dataset("tractores_industriales")
+    (latest,) = tractors.aggregates(2023, "05")
+    (previous,) = tractors.aggregates(2022, "05")
+    assert 0.8 < latest["total"] / previous["total"] < 1.25
+    assert abs(latest["municipalities"] - previous["municipalities"]) <= 10
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"{name}: ok")
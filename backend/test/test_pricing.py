@@ -0,0 +1,44 @@
+"""
+Calibration checks of the exposure factors, on the shipped INE CSVs.
+
+Run with pytest, or directly: PYTHONPATH=. python test/test_pricing.py
+"""
+import os
+import tempfile
+from statistics import mean
+from src.ine_stats import IneDataset, IneStats
+from src.pricing import FAMILY_LABOUR_RANGE, TRACTOR_DENSITY_RANGE, PricingEngine
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+
+
+def engine() -> PricingEngine:
+    cache_dir = tempfile.mkdtemp()
+    statistics = IneStats({})
+    statistics.datasets = {
+        name: IneDataset(name, os.path.join(DATA_DIR, f"{name}.csv"), cache_dir)
+        for name in ("tractores_industriales", "familiares_trabajan_explotaciones")
+    }
+    statistics.load()
+    built = PricingEngine(statistics)
+    built.build()
+    return built
+
+
+def test_average_municipality_pays_the_base_premium():
+    exposure = engine().exposure
+    assert len(exposure) > 1000
+    assert 0.97 < mean(exposure.values()) < 1.05
+
+
+def test_exposure_within_ranges():
+    low = TRACTOR_DENSITY_RANGE[0] * FAMILY_LABOUR_RANGE[0]
+    high = TRACTOR_DENSITY_RANGE[1] * FAMILY_LABOUR_RANGE[1]
+    assert all(low <= factor <= high for factor in engine().exposure.values())
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"{name}: ok")
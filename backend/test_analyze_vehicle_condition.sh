@@ -8,3 +8,9 @@ echo "Testing /analyze_vehicle_condition endpoint with description..."
 curl -s -X POST "http://127.0.0.1:8001/analyze_vehicle_condition" \
     -H "Content-Type: application/json" \
     -d "{\"description\": \"$DESCRIPTION\"}" | jq .
+
+# Test the streamed (server-sent events) variant
+echo "Testing /analyze_vehicle_condition/stream endpoint with description..."
+curl -s -N -X POST "http://127.0.0.1:8001/analyze_vehicle_condition/stream" \
+    -H "Content-Type: application/json" \
+    -d "{\"description\": \"$DESCRIPTION\"}"
@@ -8,3 +8,9 @@ echo "Testing /create_personalized_insurance endpoint with user input..."
 curl -s -X POST "http://127.0.0.1:8001/create_personalized_insurance" \
     -H "Content-Type: application/json" \
     -d "{\"user_input\": \"$USER_INPUT\"}" | jq .
+
+# Test the streamed (server-sent events) variant
+echo "Testing /create_personalized_insurance/stream endpoint with user input..."
+curl -s -N -X POST "http://127.0.0.1:8001/create_personalized_insurance/stream" \
+    -H "Content-Type: application/json" \
+    -d "{\"user_input\": \"$USER_INPUT\"}"
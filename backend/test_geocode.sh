@@ -0,0 +1,15 @@
+#!/bin/bash
+
+# Test the /geocode endpoint
+echo "Testing /geocode endpoint..."
+curl -s -X GET "http://127.0.0.1:8001/geocode?lat=40.6566&lon=-4.6818" | jq .
+
+# Test the /geocode/batch endpoint
+echo "Testing /geocode/batch endpoint..."
+curl -s -X POST "http://127.0.0.1:8001/geocode/batch" \
+-H "Content-Type: application/json" \
+-d '[[40.6566, -4.6818], [41.6523, -4.7245], [0, 0]]' | jq .
+
+# Test the /geocoder/stats endpoint
+echo "Testing /geocoder/stats endpoint..."
+curl -s -X GET "http://127.0.0.1:8001/geocoder/stats" | jq .
@@ -0,0 +1,16 @@
+#!/bin/bash
+
+# Test the /ine/{dataset}/municipios/{code} endpoint
+echo "Testing /ine/tractores_industriales/municipios/05019 endpoint..."
+curl -s -X GET "http://127.0.0.1:8001/ine/tractores_industriales/municipios/05019" | jq .
+
+# Test the /ine/{dataset}/aggregates endpoint
+echo "Testing /ine/tractores_industriales/aggregates endpoint..."
+curl -s -X GET "http://127.0.0.1:8001/ine/tractores_industriales/aggregates?year=2023&province=05" | jq .
+
+echo "Testing /ine/familiares_trabajan_explotaciones/aggregates endpoint..."
+curl -s -X GET "http://127.0.0.1:8001/ine/familiares_trabajan_explotaciones/aggregates?year=1999" | jq .
+
+# Test the /ine/stats endpoint
+echo "Testing /ine/stats endpoint..."
+curl -s -X GET "http://127.0.0.1:8001/ine/stats" | jq .
@@ -3,3 +3,24 @@
 # Test the /load_insurances endpoint
 echo "Testing /load_insurances endpoint..."
 curl -s -X GET "http://127.0.0.1:8001/load_insurances" | jq .
+
+# Test pagination and server-side filters
+echo "Testing /load_insurances endpoint with pagination and filters..."
+curl -s -X GET "http://127.0.0.1:8001/load_insurances?limit=10&año_min=2015&garaje=true&bbox=36,-9,44,5" | jq .
+
+# Test NDJSON streaming mode
+echo "Testing /load_insurances endpoint in NDJSON streaming mode..."
+curl -s -N -X GET "http://127.0.0.1:8001/load_insurances?format=ndjson"
+
+# Test conditional GET (expects 304 when nothing changed)
+echo "Testing /load_insurances endpoint with If-None-Match..."
+ETAG=$(curl -s -D - -o /dev/null "http://127.0.0.1:8001/load_insurances" | grep -i '^etag:' | cut -d' ' -f2 | tr -d '\r')
+curl -s -o /dev/null -w "%{http_code}\n" -H "If-None-Match: $ETAG" "http://127.0.0.1:8001/load_insurances"
+
+# Test the municipality filter (INE code resolved at save time)
+echo "Testing /load_insurances endpoint with a municipio filter..."
+curl -s -X GET "http://127.0.0.1:8001/load_insurances?municipio=05019" | jq .
+
+# Test the municipality filter without the geocoded (approximate) matches
+echo "Testing /load_insurances endpoint with an exact municipio filter..."
+curl -s -X GET "http://127.0.0.1:8001/load_insurances?municipio=05019&municipio_exact=true" | jq .
@@ -0,0 +1,9 @@
+#!/bin/bash
+
+# Test the /metrics endpoint (Prometheus text format)
+echo "Testing /metrics endpoint..."
+curl -s -X GET "http://127.0.0.1:8001/metrics" | head -n 40
+
+# Test the per-stage timing breakdown of a single request
+echo "Testing Server-Timing header with X-Profile..."
+curl -s -D - -o /dev/null -H "X-Profile: 1" "http://127.0.0.1:8001/load_insurances" | grep -i -E '^(server-timing|x-request-id):'
@@ -22,3 +22,13 @@ curl -s -X POST "http://127.0.0.1:8001/process_accident" \
     -d '{
         "accident_description": "El 15 de marzo de 2023 a las 14:30, un tractor chocó contra un árbol en una carretera rural debido a lluvias intensas. El vehículo sufrió daños en el capó y el parabrisas. No hubo daños a terceros. El vehículo estaba siendo usado para actividades agrícolas profesionales."
     }' | jq .
+
+# Test the asynchronous mode: queue the request, then long-poll the job
+echo "Testing /process_accident endpoint in async mode..."
+JOB_ID=$(curl -s -X POST "http://127.0.0.1:8001/process_accident?async=true" \
+    -H "Content-Type: application/json" \
+    -d '{"accident_description": "El vehículo fue robado mientras estaba estacionado en una zona rural."}' | jq -r .job_id)
+curl -s "http://127.0.0.1:8001/jobs/$JOB_ID?wait=30" | jq .
+
+echo "Testing /jobs/stats endpoint..."
+curl -s "http://127.0.0.1:8001/jobs/stats" | jq .
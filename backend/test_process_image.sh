@@ -14,3 +14,21 @@ echo "Testing /process_image endpoint with $TEST_IMAGE..."
 curl -s -X POST "http://127.0.0.1:8001/process_image" \
     -H "Content-Type: multipart/form-data" \
     -F "file=@$TEST_IMAGE" | jq .
+
+# Test the streamed (server-sent events) variant
+echo "Testing /process_image/stream endpoint with $TEST_IMAGE..."
+curl -s -N -X POST "http://127.0.0.1:8001/process_image/stream" \
+    -H "Content-Type: multipart/form-data" \
+    -F "file=@$TEST_IMAGE"
+
+# Send the same photo again under another claim: the stored analysis is reused and flagged as cross-claim
+echo "Testing /process_image duplicate detection with $TEST_IMAGE..."
+curl -s -X POST "http://127.0.0.1:8001/process_image" \
+    -H "Content-Type: multipart/form-data" \
+    -F "file=@$TEST_IMAGE" \
+    -F "claim_id=claim-1" | jq '.duplicate_of'
+curl -s -X POST "http://127.0.0.1:8001/process_image" \
+    -H "Content-Type: multipart/form-data" \
+    -F "file=@$TEST_IMAGE" \
+    -F "claim_id=claim-2" | jq '.duplicate_of'
+curl -s "http://127.0.0.1:8001/image_index/stats" | jq .
@@ -14,3 +14,9 @@ echo "Testing /process_image_for_insurance endpoint with $TEST_IMAGE..."
 curl -s -X POST "http://127.0.0.1:8001/process_image_for_insurance" \
     -H "Content-Type: multipart/form-data" \
     -F "file=@$TEST_IMAGE" | jq .
+
+# Test the streamed variant: the locally read fields arrive first, in the context event
+echo "Testing /process_image_for_insurance/stream endpoint with $TEST_IMAGE..."
+curl -s -N -X POST "http://127.0.0.1:8001/process_image_for_insurance/stream" \
+    -H "Content-Type: multipart/form-data" \
+    -F "file=@$TEST_IMAGE"
@@ -0,0 +1,25 @@
+#!/bin/bash
+
+# Path to the test image
+TEST_IMAGE="testimage.png"
+
+# Check if the test image exists
+if [ ! -f "$TEST_IMAGE" ]; then
+    echo "Error: Test image '$TEST_IMAGE' not found."
+    exit 1
+fi
+
+# Test the /process_images endpoint with several photos of the same claim
+echo "Testing /process_images endpoint with $TEST_IMAGE (x3)..."
+curl -s -X POST "http://127.0.0.1:8001/process_images" \
+    -H "Content-Type: multipart/form-data" \
+    -F "files=@$TEST_IMAGE" \
+    -F "files=@$TEST_IMAGE" \
+    -F "files=@$TEST_IMAGE" | jq .
+
+# Test the combined mode (one multimodal request for all photos)
+echo "Testing /process_images endpoint in combined mode..."
+curl -s -X POST "http://127.0.0.1:8001/process_images?combined=true" \
+    -H "Content-Type: multipart/form-data" \
+    -F "files=@$TEST_IMAGE" \
+    -F "files=@$TEST_IMAGE" | jq .
@@ -0,0 +1,29 @@
+#!/bin/bash
+
+# Test the /quote endpoint
+echo "Testing /quote endpoint..."
+curl -s -X POST "http://127.0.0.1:8001/quote" \
+-H "Content-Type: application/json" \
+-d '{
+  "modelo_tractor": "John Deere 6120M",
+  "condicion": "Buena",
+  "color": "Verde",
+  "año": 2015,
+  "descripcion_adicional": "Tractor con pala frontal.",
+  "coordinates": [40.6565, -4.6818],
+  "garaje": true,
+  "municipio": "05019"
+}' | jq .
+
+# Test the /quote/batch endpoint
+echo "Testing /quote/batch endpoint..."
+curl -s -X POST "http://127.0.0.1:8001/quote/batch" \
+-H "Content-Type: application/json" \
+-d '[
+  {"modelo_tractor": "John Deere 6120M", "condicion": "Buena", "color": "Verde", "año": 2015, "descripcion_adicional": "", "coordinates": [40.6565, -4.6818], "garaje": true, "municipio": "05019"},
+  {"modelo_tractor": "Massey Ferguson 5710", "condicion": "Regular, con óxido", "color": "Rojo", "año": 1998, "descripcion_adicional": "", "coordinates": [41.6523, -4.7245], "garaje": false}
+]' | jq .
+
+# Test the /pricing/stats endpoint
+echo "Testing /pricing/stats endpoint..."
+curl -s -X GET "http://127.0.0.1:8001/pricing/stats" | jq .
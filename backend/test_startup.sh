@@ -0,0 +1,11 @@
+#!/bin/bash
+
+# Test the /startup/stats endpoint
+echo "Testing /startup/stats endpoint..."
+curl -s -X GET "http://127.0.0.1:8001/startup/stats" | jq .
+
+# Touch a policy document; it is reloaded within REFERENCE_RELOAD_INTERVAL seconds
+echo "Testing reference data reload after touching data/cobertura.txt..."
+touch data/cobertura.txt
+sleep 6
+curl -s -X GET "http://127.0.0.1:8001/startup/stats" | jq '.reference_data.coverage_rules, .reference_data.policy_index'
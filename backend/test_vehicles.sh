@@ -0,0 +1,27 @@
+#!/bin/bash
+
+# Run the backend against the local vehicle registry stub:
+#   python test/fake_vehicles.py --port 8092
+#   VEHICLE_API_URL=http://127.0.0.1:8092/api/rest/v1 VEHICLE_API_TOKEN=fake uvicorn main:app --port 8001
+
+INSURANCE='{"modelo_tractor": "John Deere 6120M", "condicion": "Buena", "color": "verde", "año": 2018, "descripcion_adicional": "", "coordinates": [41.6523, -4.7245], "garaje": true, "vehicle_id": "5"}'
+
+# The first save starts the registry lookup in the background (pending); the next one is checked from the cache
+echo "Testing /save_insurance endpoint with a vehicle ID..."
+curl -s -X POST "http://127.0.0.1:8001/save_insurance" \
+-H "Content-Type: application/json" \
+-d "$INSURANCE" | jq .vehicle_check
+sleep 1
+curl -s -X POST "http://127.0.0.1:8001/save_insurance" \
+-H "Content-Type: application/json" \
+-d "$INSURANCE" | jq .vehicle_check
+
+# Test the /vehicles/lookup endpoint: looked up concurrently, unknown IDs map to null
+echo "Testing /vehicles/lookup endpoint..."
+curl -s -X POST "http://127.0.0.1:8001/vehicles/lookup" \
+-H "Content-Type: application/json" \
+-d '["1", "2", "3", "unknown"]' | jq .
+
+# Test the /vehicles/stats endpoint
+echo "Testing /vehicles/stats endpoint..."
+curl -s -X GET "http://127.0.0.1:8001/vehicles/stats" | jq .
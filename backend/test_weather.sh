@@ -0,0 +1,26 @@
+#!/bin/bash
+
+# Run the backend against the local AEMET stand-in:
+#   python test/fake_aemet.py --port 8091
+#   AEMET_BASE_URL=http://127.0.0.1:8091/opendata/api AEMET_API_KEY=fake uvicorn main:app --port 8001
+
+# Test the /weather endpoint with today's observations (prefetched in bulk)
+echo "Testing /weather endpoint..."
+curl -s -X GET "http://127.0.0.1:8001/weather?lat=41.6523&lon=-4.7245" | jq .
+
+# A past day is fetched in the background: the first call is pending, the next one is served from the cache
+PAST_DATE=$(date -d "5 days ago" +%Y-%m-%d)
+echo "Testing /weather endpoint for $PAST_DATE..."
+curl -s -X GET "http://127.0.0.1:8001/weather?lat=40.6566&lon=-4.6818&date=$PAST_DATE" | jq .status
+sleep 1
+curl -s -X GET "http://127.0.0.1:8001/weather?lat=40.6566&lon=-4.6818&date=$PAST_DATE" | jq .
+
+# Test /process_accident with the place of the accident: the response carries the weather evidence
+echo "Testing /process_accident endpoint with coordinates..."
+curl -s -X POST "http://127.0.0.1:8001/process_accident" \
+-H "Content-Type: application/json" \
+-d '{"accident_description": "Una racha de viento volcó el remolque del tractor.", "coordinates": [41.6523, -4.7245]}' | jq .weather
+
+# Test the /weather/stats endpoint
+echo "Testing /weather/stats endpoint..."
+curl -s -X GET "http://127.0.0.1:8001/weather/stats" | jq .